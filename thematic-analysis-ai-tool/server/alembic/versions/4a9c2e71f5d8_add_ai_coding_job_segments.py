@@ -0,0 +1,39 @@
+"""add ai coding job segments
+
+Revision ID: 4a9c2e71f5d8
+Revises: b5e07c93d1a2
+Create Date: 2026-10-17 12:05:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a9c2e71f5d8'
+down_revision: Union[str, None] = 'b5e07c93d1a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ai_coding_job_segments',
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['ai_coding_jobs.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['segment_id'], ['document_segments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('job_id', 'segment_id')
+    )
+    op.add_column('ai_coding_jobs', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ai_coding_jobs', 'attempts')
+    op.drop_table('ai_coding_job_segments')
@@ -0,0 +1,54 @@
+"""add ai coding jobs
+
+Revision ID: 8e2d4b6a1f37
+Revises: 3c1f9a7d2b64
+Create Date: 2026-10-17 10:04:18.551920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e2d4b6a1f37'
+down_revision: Union[str, None] = '3c1f9a7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ai_coding_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED', name='aicodingjobstatus'), nullable=False),
+    sa.Column('document_ids', sa.JSON(), nullable=False),
+    sa.Column('model_name', sa.String(), nullable=False),
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('options', sa.JSON(), nullable=True),
+    sa.Column('total_segments', sa.Integer(), nullable=False),
+    sa.Column('processed_segments', sa.Integer(), nullable=False),
+    sa.Column('failed_segments', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.JSON(), nullable=True),
+    sa.Column('result_summary', sa.JSON(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('worker_id', sa.String(), nullable=True),
+    sa.Column('created_by_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ai_coding_jobs_id'), 'ai_coding_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_ai_coding_jobs_status'), 'ai_coding_jobs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ai_coding_jobs_status'), table_name='ai_coding_jobs')
+    op.drop_index(op.f('ix_ai_coding_jobs_id'), table_name='ai_coding_jobs')
+    op.drop_table('ai_coding_jobs')
+    sa.Enum(name='aicodingjobstatus').drop(op.get_bind(), checkfirst=True)
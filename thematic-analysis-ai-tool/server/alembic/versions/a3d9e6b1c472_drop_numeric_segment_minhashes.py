@@ -0,0 +1,45 @@
+"""drop numeric segment minhashes
+
+Revision ID: a3d9e6b1c472
+Revises: f1c7a3e9b254
+Create Date: 2026-10-17 18:02:44.215903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d9e6b1c472'
+down_revision: Union[str, None] = 'f1c7a3e9b254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Shingles now keep numbers: signatures of segments with digits were computed without them,
+    # so those segments and their cluster members go back to representing themselves
+    op.execute("""
+        CREATE TEMPORARY TABLE numeric_segments ON COMMIT DROP AS
+        SELECT m.segment_id FROM segment_minhashes m
+        JOIN document_segments s ON s.id = m.segment_id
+        WHERE s.content ~ '[0-9]'
+    """)
+    op.execute("""
+        DELETE FROM segment_lsh_bands
+        WHERE segment_id IN (SELECT segment_id FROM numeric_segments)
+    """)
+    op.execute("""
+        DELETE FROM segment_minhashes
+        WHERE segment_id IN (SELECT segment_id FROM numeric_segments)
+           OR cluster_id IN (SELECT segment_id FROM numeric_segments)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Dropped index rows are not restored; re-uploading a document indexes it again
+    pass
@@ -0,0 +1,35 @@
+"""add segment coding states
+
+Revision ID: b5e07c93d1a2
+Revises: 8e2d4b6a1f37
+Create Date: 2026-10-17 11:27:03.914562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e07c93d1a2'
+down_revision: Union[str, None] = '8e2d4b6a1f37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('segment_coding_states',
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('coding_version', sa.String(length=64), nullable=False),
+    sa.Column('coded_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['segment_id'], ['document_segments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('segment_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('segment_coding_states')
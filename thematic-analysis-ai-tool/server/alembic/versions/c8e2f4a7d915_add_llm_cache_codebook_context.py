@@ -0,0 +1,28 @@
+"""add llm cache codebook context
+
+Revision ID: c8e2f4a7d915
+Revises: a3d9e6b1c472
+Create Date: 2026-10-17 18:40:12.583047
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e2f4a7d915'
+down_revision: Union[str, None] = 'a3d9e6b1c472'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_response_cache', sa.Column('codebook_context', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_response_cache', 'codebook_context')
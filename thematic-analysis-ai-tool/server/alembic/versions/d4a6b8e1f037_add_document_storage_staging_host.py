@@ -0,0 +1,29 @@
+"""add document storage staging host
+
+Revision ID: d4a6b8e1f037
+Revises: c8e2f4a7d915
+Create Date: 2026-10-17 19:14:36.908214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a6b8e1f037'
+down_revision: Union[str, None] = 'c8e2f4a7d915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Documents already pending keep no host: any host's workers may claim them
+    op.add_column('documents', sa.Column('storage_staging_host', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'storage_staging_host')
@@ -0,0 +1,52 @@
+"""add segment minhashes
+
+Revision ID: d7f3a1c8e925
+Revises: 4a9c2e71f5d8
+Create Date: 2026-10-17 12:48:19.603127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f3a1c8e925'
+down_revision: Union[str, None] = '4a9c2e71f5d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('segment_minhashes',
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('signature', sa.JSON(), nullable=False),
+    sa.Column('cluster_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['segment_id'], ['document_segments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('segment_id')
+    )
+    op.create_index(op.f('ix_segment_minhashes_cluster_id'), 'segment_minhashes', ['cluster_id'], unique=False)
+    op.create_index(op.f('ix_segment_minhashes_project_id'), 'segment_minhashes', ['project_id'], unique=False)
+    op.create_table('segment_lsh_bands',
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.Column('band_index', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('band_hash', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['segment_id'], ['document_segments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('segment_id', 'band_index')
+    )
+    op.create_index('ix_segment_lsh_bands_lookup', 'segment_lsh_bands', ['project_id', 'band_index', 'band_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_segment_lsh_bands_lookup', table_name='segment_lsh_bands')
+    op.drop_table('segment_lsh_bands')
+    op.drop_index(op.f('ix_segment_minhashes_project_id'), table_name='segment_minhashes')
+    op.drop_index(op.f('ix_segment_minhashes_cluster_id'), table_name='segment_minhashes')
+    op.drop_table('segment_minhashes')
@@ -0,0 +1,28 @@
+"""add document file hash index
+
+Revision ID: e4b8d2f6a913
+Revises: d7f3a1c8e925
+Create Date: 2026-10-17 14:02:37.415208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d2f6a913'
+down_revision: Union[str, None] = 'd7f3a1c8e925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_documents_project_file_hash', 'documents', ['project_id', 'file_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_documents_project_file_hash', table_name='documents')
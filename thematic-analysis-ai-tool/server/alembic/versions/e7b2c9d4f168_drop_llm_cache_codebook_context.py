@@ -0,0 +1,30 @@
+"""drop llm cache codebook context
+
+Revision ID: e7b2c9d4f168
+Revises: d4a6b8e1f037
+Create Date: 2026-10-17 20:05:51.372940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b2c9d4f168'
+down_revision: Union[str, None] = 'd4a6b8e1f037'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Entries written with a codebook but no project in their key may name another project's codes
+    op.execute("DELETE FROM llm_response_cache WHERE codebook_context IS NOT NULL")
+    op.drop_column('llm_response_cache', 'codebook_context')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('llm_response_cache', sa.Column('codebook_context', sa.Text(), nullable=True))
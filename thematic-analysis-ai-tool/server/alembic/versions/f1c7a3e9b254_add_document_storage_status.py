@@ -0,0 +1,42 @@
+"""add document storage status
+
+Revision ID: f1c7a3e9b254
+Revises: e4b8d2f6a913
+Create Date: 2026-10-17 15:21:08.672340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a3e9b254'
+down_revision: Union[str, None] = 'e4b8d2f6a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    storage_status = sa.Enum('PENDING', 'STORED', 'FAILED', name='storagestatus')
+    storage_status.create(op.get_bind(), checkfirst=True)
+    # Existing documents were uploaded to Cloudinary during their request
+    op.add_column('documents', sa.Column('storage_backend', sa.String(), server_default='cloudinary', nullable=False))
+    op.add_column('documents', sa.Column('storage_status', storage_status, server_default='STORED', nullable=False))
+    op.add_column('documents', sa.Column('storage_attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('documents', sa.Column('storage_error', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('storage_retry_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_documents_storage_status'), 'documents', ['storage_status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_documents_storage_status'), table_name='documents')
+    op.drop_column('documents', 'storage_retry_at')
+    op.drop_column('documents', 'storage_error')
+    op.drop_column('documents', 'storage_attempts')
+    op.drop_column('documents', 'storage_status')
+    op.drop_column('documents', 'storage_backend')
+    sa.Enum(name='storagestatus').drop(op.get_bind(), checkfirst=True)
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional
 from app.db.session import get_db
 from app.core.auth import get_current_user
+from app.core.permissions import PermissionChecker
+from app.schemas.ai_coding import AICodingRequest, AICodingJobOut, AICodingEstimate, ThemeGenerationRequest
 from app.services.ai_coding_service import AICodingService
+from app.services.ai_coding_estimate_service import AICodingEstimateService
+from app.services.ai_coding_job_service import AICodingJobService
+from app.services.ai_coding_stream_service import AICodingStreamService
+from app.services.llm_service import LLMService
+from app.services.llm import LLMCacheService, get_all_call_stats, get_rate_limits, get_single_flight
 
 router = APIRouter()
 
@@ -10,11 +18,213 @@ router = APIRouter()
 @router.post("/initial-coding", response_model=List[Dict[str, Any]])
 def ai_initial_coding(
     document_ids: list[int],
+    max_concurrency: Optional[int] = Query(None, ge=1, le=64),
+    batch_mode: bool = False,
+    incremental: bool = False,
+    deduplicate: bool = True,
     db=Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    # Checked before any LLM call is made
+    for document_id in document_ids:
+        if not PermissionChecker.check_document_access(
+            db, document_id, current_user, raise_exception=False
+        ):
+            raise HTTPException(
+                status_code=404, detail=f"Document {document_id} not found or access denied")
     return AICodingService.generate_code(
         document_ids=document_ids,
         db=db,
-        user_id=current_user.id
+        user_id=current_user.id,
+        max_concurrency=max_concurrency,
+        batch_mode=batch_mode,
+        incremental=incremental,
+        deduplicate=deduplicate
     )
+
+
+@router.post("/initial-coding/stream")
+def ai_initial_coding_stream(
+    request: AICodingRequest,
+    http_request: Request,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Stream AI initial coding results as Server-Sent Events while segments are coded"""
+    for document_id in request.document_ids:
+        PermissionChecker.check_document_access(db, document_id, current_user)
+    try:
+        LLMService.check_provider(request.provider)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        AICodingStreamService.stream_code(
+            request,
+            current_user.id,
+            is_disconnected=http_request.is_disconnected
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/themes", response_model=List[Dict[str, Any]])
+def ai_generate_themes(
+    request: ThemeGenerationRequest,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Cluster the project's codes into themes and store them as parent codes"""
+    try:
+        return AICodingService.generate_themes(
+            project_id=request.project_id,
+            db=db,
+            user_id=current_user.id,
+            model_name=request.model_name,
+            provider=request.provider,
+            num_themes=request.num_themes,
+            max_concurrency=request.max_concurrency
+        )
+    except ValueError as e:
+        if "not found" in str(e).lower() or "access denied" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        else:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/initial-coding/estimate", response_model=AICodingEstimate)
+def ai_initial_coding_estimate(
+    request: AICodingRequest,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Estimate tokens, LLM requests and duration of an AI coding run without running it"""
+    try:
+        return AICodingEstimateService.estimate(db, request, current_user.id)
+    except ValueError as e:
+        if "not found" in str(e).lower() or "access denied" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        else:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+def ai_cache_stats(
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Get LLM response cache hit/miss counters and size, and coalesced in-flight requests"""
+    stats = LLMCacheService.get_stats(db)
+    stats["single_flight"] = get_single_flight().snapshot()
+    return stats
+
+
+@router.get("/llm/stats", response_model=Dict[str, Any])
+def ai_llm_call_stats(
+    current_user=Depends(get_current_user)
+):
+    """Get per-model LLM call latency, retry and hedge counters with the configured rate limits"""
+    stats = get_all_call_stats()
+    for key, model_stats in stats.items():
+        provider, _, model_name = key.partition(":")
+        model_stats["rate_limits"] = get_rate_limits(provider, model_name)
+    return stats
+
+
+@router.get("/metrics", response_model=Dict[str, Any])
+def ai_metrics(
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Get LLM metrics of this process: per-model latency histograms, token
+    usage, cost and parse failures, totals across models, and the response
+    cache and single-flight counters
+    """
+    models = get_all_call_stats()
+    totals = {"calls": 0, "failures": 0, "parse_failures": 0,
+              "prompt_tokens": 0, "completion_tokens": 0, "cost": None}
+    for model_stats in models.values():
+        for field in ("calls", "failures", "parse_failures", "prompt_tokens", "completion_tokens"):
+            totals[field] += model_stats[field]
+        if model_stats["cost"] is not None:
+            totals["cost"] = round((totals["cost"] or 0.0) + model_stats["cost"], 6)
+    totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+    return {
+        "totals": totals,
+        "models": models,
+        "cache": LLMCacheService.get_stats(db),
+        "single_flight": get_single_flight().snapshot(),
+    }
+
+
+@router.post("/jobs", response_model=AICodingJobOut, status_code=status.HTTP_202_ACCEPTED)
+def start_ai_coding_job(
+    request: AICodingRequest,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Queue an AI initial coding run and return its job id immediately"""
+    try:
+        return AICodingJobService.create_job(db, request, current_user.id)
+    except ValueError as e:
+        if "not found" in str(e).lower() or "access denied" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        else:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/jobs", response_model=List[AICodingJobOut])
+def list_ai_coding_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Get the current user's most recent AI coding jobs"""
+    return AICodingJobService.list_jobs(db, current_user.id, limit)
+
+
+@router.get("/jobs/{job_id}", response_model=AICodingJobOut)
+def get_ai_coding_job(
+    job_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Get status and progress of an AI coding job"""
+    try:
+        return AICodingJobService.get_job(db, job_id, current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=AICodingJobOut)
+def cancel_ai_coding_job(
+    job_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Cancel a queued or running AI coding job"""
+    try:
+        return AICodingJobService.cancel_job(db, job_id, current_user.id)
+    except ValueError as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        else:
+            raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/jobs/{job_id}/resume", response_model=AICodingJobOut, status_code=status.HTTP_202_ACCEPTED)
+def resume_ai_coding_job(
+    job_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Requeue a failed or cancelled AI coding job; segments that already succeeded are skipped"""
+    try:
+        return AICodingJobService.resume_job(db, job_id, current_user.id)
+    except ValueError as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        else:
+            raise HTTPException(status_code=409, detail=str(e))
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 import os
 import pathlib
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 import asyncio
 from app.db.session import get_db, SessionLocal
 from app.core.auth import get_current_user
@@ -11,9 +11,15 @@ from app.models.user import User
 from app.models.document import DocumentType
 from app.schemas.document import DocumentOut, DocumentUpdate, BulkUploadResult, DocumentUpload
 from app.services.document_service import DocumentService
+from app.services.document import NearDuplicateService
+from app.core.config import settings
 
 router = APIRouter()
 
+# Uploads of bulk requests processed at once in this process; the rest wait their turn,
+# so a large bulk upload can't take every DB connection and thread from other requests
+_bulk_upload_slots = asyncio.Semaphore(settings.BULK_UPLOAD_MAX_CONCURRENCY)
+
 async def _do_single_upload(
     project_id: int,
     file: UploadFile,
@@ -22,7 +28,8 @@ async def _do_single_upload(
     db: Session,
     current_user: User
 ) -> DocumentUpload:
-    content = await file.read()
+    # The spooled upload is processed as a stream rather than read into memory
+    await file.seek(0)
     ext = pathlib.Path(file.filename or "").suffix.lower()
     if ext == ".pdf":
         doc_type = DocumentType.PDF
@@ -42,7 +49,7 @@ async def _do_single_upload(
             doc_type,
             project_id,
             getattr(current_user, "id"),
-            content,
+            file.file,
             str(file.filename)
         )
 
@@ -59,7 +66,8 @@ async def upload_document(
     """Upload a single document"""
     PermissionChecker.check_project_access(db, project_id, current_user)
 
-    content = await file.read()
+    # The spooled upload is processed as a stream rather than read into memory
+    await file.seek(0)
     ext = pathlib.Path(file.filename or "").suffix.lower()
     if ext == ".pdf":
         doc_type = DocumentType.PDF
@@ -78,7 +86,7 @@ async def upload_document(
             document_type=doc_type,
             project_id=project_id,
             uploaded_by_id=getattr(current_user, "id"),
-            file_content=content,
+            file_content=file.file,
             filename=str(file.filename)
         )
     except ValueError as e:
@@ -99,12 +107,15 @@ async def bulk_upload_documents(
 
     async def _wrap(file: UploadFile):
         try:
-            doc = await _do_single_upload(
-                project_id, file, None, None, db, current_user
-            )
+            async with _bulk_upload_slots:
+                doc = await _do_single_upload(
+                    project_id, file, None, None, db, current_user
+                )
             uploaded.append(doc)
         except HTTPException as e:
             failed.append({"filename": file.filename, "error": e.detail})
+        except ValueError as e:
+            failed.append({"filename": file.filename, "error": str(e)})
 
     tasks = [_wrap(file) for file in files]
     await asyncio.gather(*tasks)
@@ -130,6 +141,26 @@ def get_project_documents(
     )
     return documents
 
+@router.get("/project/{project_id}/near-duplicates", response_model=Dict[str, Any])
+def get_project_near_duplicates(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get how many segments of a project are near-duplicates that AI coding codes only once"""
+    PermissionChecker.check_project_access(db, project_id, current_user)
+    return NearDuplicateService.get_project_stats(db, project_id)
+
+@router.get("/project/{project_id}/duplicates", response_model=Dict[str, Any])
+def get_project_duplicate_documents(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the documents of a project that were uploaded more than once, grouped by file content"""
+    PermissionChecker.check_project_access(db, project_id, current_user)
+    return DocumentService.get_duplicate_report(db, project_id)
+
 # Maybe not needed
 @router.get("/{document_id}", response_model=DocumentOut)
 def get_document(
@@ -162,6 +193,8 @@ def update_document(
     except ValueError as e:
         if "not found" in str(e).lower():
             raise HTTPException(status_code=404, detail=str(e))
+        elif "column" in str(e).lower():
+            raise HTTPException(status_code=400, detail=str(e))
         else:
             raise HTTPException(status_code=403, detail=str(e))
 
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -17,13 +18,125 @@ class Settings(BaseSettings):
     BACKEND_URL: str = "http://localhost:8000"
     FRONTEND_URL: str = "http://localhost:3000"
 
-    CLOUDINARY_CLOUD_NAME: str
-    CLOUDINARY_API_KEY: str
-    CLOUDINARY_API_SECRET: str
+    # File storage: "cloudinary" or "local" (files under UPLOAD_FOLDER). Uploads are staged in
+    # STORAGE_STAGING_DIR and stored by background workers of the same host (0 stores them
+    # during the request), retried with exponential backoff; a running attempt keeps renewing
+    # its hold on the document for the lease time. STORAGE_STAGING_HOST defaults to the hostname
+    STORAGE_BACKEND: str = "cloudinary"
+    CLOUDINARY_CLOUD_NAME: Optional[str] = None
+    CLOUDINARY_API_KEY: Optional[str] = None
+    CLOUDINARY_API_SECRET: Optional[str] = None
     UPLOAD_FOLDER: str = "TA_documents"
+    STORAGE_STAGING_DIR: str = "TA_staging"
+    STORAGE_STAGING_HOST: Optional[str] = None
+    STORAGE_UPLOAD_WORKERS: int = 2
+    STORAGE_UPLOAD_POLL_INTERVAL_SECONDS: float = 2.0
+    STORAGE_UPLOAD_MAX_ATTEMPTS: int = 5
+    STORAGE_UPLOAD_RETRY_BASE_DELAY_SECONDS: float = 5.0
+    STORAGE_UPLOAD_LEASE_SECONDS: float = 600.0
+
+    # Uploads: segments are extracted as a stream and written this many rows at a time; CSV
+    # files are parsed CSV_READ_CHUNK_ROWS rows at a time. The upload response lists at most
+    # UPLOAD_RESPONSE_MAX_SEGMENTS segments (total_segments is always the full count)
+    SEGMENT_WRITE_BATCH_SIZE: int = 5000
+    CSV_READ_CHUNK_ROWS: int = 10_000
+    UPLOAD_RESPONSE_MAX_SEGMENTS: int = 1000
+    # Uploads: worker processes that parse files (0 parses in the API process), and uploads
+    # of a bulk upload processed at once per API process
+    DOCUMENT_PARSE_WORKERS: int = 2
+    BULK_UPLOAD_MAX_CONCURRENCY: int = 4
+    # Uploads of a file already in the project (same SHA-256 and type): "off" processes them
+    # again, "return" returns the existing document (ignoring the new name and description),
+    # "clone" copies its segments to a new document without re-uploading or re-parsing the file
+    DOCUMENT_DEDUPE_POLICY: str = "off"
 
     GOOGLE_API_KEY: str
 
+    # AI coding: parallel LLM calls per request, and the process-wide cap per provider
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_PROVIDER_MAX_CONCURRENCY: int = 16
+    # AI coding: constructed model clients kept for reuse, least recently used dropped first
+    LLM_INSTANCE_CACHE_SIZE: int = 16
+
+    # AI coding: client-side rate limits (0 disables). LLM_RATE_LIMITS overrides them per
+    # "<provider>" or "<provider>:<model>", e.g. {"google_genai:gemini-2.0-flash": {"requests_per_minute": 1000}}
+    LLM_REQUESTS_PER_MINUTE: int = 0
+    LLM_TOKENS_PER_MINUTE: int = 0
+    LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = {}
+    # Tokens assumed for the model's answer when charging the tokens-per-minute bucket
+    LLM_ESTIMATED_OUTPUT_TOKENS: int = 150
+
+    # AI coding: retries of transient LLM failures, and hedged requests (0 disables hedging)
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 1.0
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 30.0
+    LLM_HEDGE_AFTER_SECONDS: float = 0.0
+
+    # AI coding: prompts list the CODEBOOK_TOP_K existing project codes most relevant to the text
+    CODEBOOK_ENABLED: bool = True
+    CODEBOOK_TOP_K: int = 15
+    CODEBOOK_DESCRIPTION_CHARS: int = 100
+    CODEBOOK_INDEX_CACHE_SIZE: int = 64
+
+    # Theme generation: hashed TF-IDF width, cluster count cap, smallest theme, quotes used per code
+    THEME_HASH_FEATURES: int = 2 ** 14
+    THEME_MAX_CLUSTERS: int = 50
+    THEME_MIN_CLUSTER_SIZE: int = 2
+    THEME_MAX_QUOTES_PER_CODE: int = 50
+    THEME_KMEANS_ITERATIONS: int = 25
+
+    # AI coding dry-run estimates: call latency before any call was observed, and prices
+    # per "<provider>" or "<provider>:<model>", e.g. {"google_genai": {"input": 0.1, "output": 0.4}}
+    LLM_ESTIMATED_LATENCY_SECONDS: float = 2.0
+    LLM_PRICES_PER_MILLION_TOKENS: Dict[str, Dict[str, float]] = {}
+
+    # AI coding: persistent cache of parsed LLM outputs; expired and least recently used
+    # entries are evicted by each process at most every LLM_CACHE_EVICT_INTERVAL_SECONDS
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 200_000
+    LLM_CACHE_EVICT_INTERVAL_SECONDS: float = 300.0
+    # Share one in-flight request among concurrent identical cache misses
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True
+
+    # AI coding: batched mode packs several segments into one prompt
+    LLM_BATCH_TOKEN_BUDGET: int = 3000
+    LLM_BATCH_MAX_SEGMENTS: int = 25
+
+    # AI coding: segments coded and persisted per progress step
+    AI_CODING_CHUNK_SIZE: int = 50
+
+    # AI coding jobs: background worker threads per process (0 disables) and poll interval
+    AI_JOB_WORKERS: int = 2
+    AI_JOB_POLL_INTERVAL_SECONDS: float = 2.0
+    # Running jobs send a heartbeat this often; jobs without one for AI_JOB_STALE_AFTER_SECONDS
+    # are requeued and resume from their checkpoints
+    AI_JOB_HEARTBEAT_SECONDS: float = 30.0
+    AI_JOB_STALE_AFTER_SECONDS: float = 600.0
+
+    # Offline "local" LLM provider for benchmarks and tests; it writes fake codes, so requests
+    # for it are rejected unless LOCAL_LLM_ENABLED is set
+    LOCAL_LLM_ENABLED: bool = False
+    LOCAL_LLM_LATENCY_MS: float = 50.0
+    LOCAL_LLM_FAILURE_RATE: float = 0.0
+    LOCAL_LLM_SEED: int = 0
+
+    # LLM record/replay for offline benchmarks: "off", "record" or "replay" a gzipped JSONL
+    # cassette; replayed calls sleep their recorded latency times the scale (0 for no delay)
+    LLM_CASSETTE_MODE: str = "off"
+    LLM_CASSETTE_PATH: str = "llm_cassette.jsonl.gz"
+    LLM_CASSETTE_LATENCY_SCALE: float = 1.0
+
+    # Near-duplicate segment clustering at ingest (MinHash/LSH); AI coding sends one segment per cluster
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_THRESHOLD: float = 0.85
+    MINHASH_NUM_PERM: int = 128
+    MINHASH_BANDS: int = 16
+    MINHASH_SHINGLE_SIZE: int = 3
+
+    # AI coding stream: seconds between SSE heartbeats while waiting on the model
+    AI_STREAM_HEARTBEAT_SECONDS: float = 15.0
+
     class Config:
         env_file = ".env"
         
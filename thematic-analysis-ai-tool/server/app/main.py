@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import auth, users, projects, documents, quotes, codes, annotations, document_segments, code_quote_assignments, ai_services
+from app.services.ai_coding_job_service import worker_pool
+from app.services.document.parsing import shutdown_parse_pool
+from app.services.storage import storage_upload_pool
 
 app = FastAPI(title="Thematic Analysis AI Tool", version="1.0.0")
 
@@ -36,6 +39,33 @@ app.include_router(ai_services.router, prefix="/api/v1/ai",
                    tags=["AI Services"])
 
 
+@app.on_event("startup")
+def start_ai_coding_workers():
+    # Every uvicorn worker runs its own pool; jobs are claimed with SKIP LOCKED
+    worker_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_ai_coding_workers():
+    worker_pool.stop()
+
+
+@app.on_event("shutdown")
+def stop_document_parse_pool():
+    shutdown_parse_pool()
+
+
+@app.on_event("startup")
+def start_storage_upload_workers():
+    # Pending uploads left by a stopped process are picked up once their lease expires
+    storage_upload_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_storage_upload_workers():
+    storage_upload_pool.stop()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Thematic Analysis AI Tool API", "version": "1.0.0"}
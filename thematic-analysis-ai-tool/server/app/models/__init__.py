@@ -1,7 +1,11 @@
 from .user import User
 from .project import Project, project_collaborators
-from .document import Document, DocumentType
+from .document import Document, DocumentType, StorageStatus
 from .document_segment import DocumentSegment, segment_codes
 from .code import Code, quote_codes
 from .quote import Quote
 from .annotation import Annotation, AnnotationType
+from .llm_cache import LLMCacheEntry
+from .ai_coding_job import AICodingJob, AICodingJobStatus, AICodingJobSegment
+from .segment_coding_state import SegmentCodingState
+from .segment_minhash import SegmentMinHash, SegmentLSHBand
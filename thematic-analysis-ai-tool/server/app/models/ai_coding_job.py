@@ -0,0 +1,79 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum, Boolean
+from sqlalchemy.orm import relationship
+import datetime
+import enum
+from app.db.session import Base
+
+
+class AICodingJobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class AICodingJob(Base):
+    __tablename__ = "ai_coding_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(Enum(AICodingJobStatus), default=AICodingJobStatus.QUEUED,
+                    nullable=False, index=True)
+
+    # Parameters of the run
+    document_ids = Column(JSON, nullable=False)
+    model_name = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    options = Column(JSON, nullable=True)
+
+    # Progress
+    total_segments = Column(Integer, default=0, nullable=False)
+    processed_segments = Column(Integer, default=0, nullable=False)
+    failed_segments = Column(Integer, default=0, nullable=False)
+    # First errors of the run as [{"segment_id": ..., "error": ...}]
+    errors = Column(JSON, nullable=True)
+    result_summary = Column(JSON, nullable=True)
+
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    # Number of times a worker has claimed the job, including resumes
+    attempts = Column(Integer, default=0, nullable=False)
+    # "<hostname>:<pid>:<thread>" of the worker that claimed the job
+    worker_id = Column(String, nullable=True)
+
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # Timestamps
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(
+        datetime.timezone.utc), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    created_by = relationship("User")
+    segments = relationship("AICodingJobSegment", back_populates="job",
+                            cascade="all, delete-orphan", passive_deletes=True)
+
+    def __repr__(self):
+        return f"<AICodingJob(id={self.id}, status={self.status.value}, processed={self.processed_segments}/{self.total_segments})>"
+
+
+class AICodingJobSegment(Base):
+    """Checkpoint of one segment's outcome within an AI coding job"""
+    __tablename__ = "ai_coding_job_segments"
+
+    job_id = Column(Integer, ForeignKey("ai_coding_jobs.id", ondelete="CASCADE"),
+                    primary_key=True)
+    segment_id = Column(Integer, ForeignKey("document_segments.id", ondelete="CASCADE"),
+                        primary_key=True)
+    # "succeeded" or "failed"; failed segments are retried when the job resumes
+    status = Column(String(16), nullable=False)
+    error = Column(Text, nullable=True)
+    completed_at = Column(DateTime, default=lambda: datetime.datetime.now(
+        datetime.timezone.utc), nullable=False)
+
+    # Relationships
+    job = relationship("AICodingJob", back_populates="segments")
+
+    def __repr__(self):
+        return f"<AICodingJobSegment(job_id={self.job_id}, segment_id={self.segment_id}, status={self.status})>"
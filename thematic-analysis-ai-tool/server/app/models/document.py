@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum, Index
 from sqlalchemy.orm import relationship
 import datetime
 import enum
@@ -12,6 +12,12 @@ class DocumentType(enum.Enum):
     DOCX = "docx"
 
 
+class StorageStatus(enum.Enum):
+    PENDING = "pending"
+    STORED = "stored"
+    FAILED = "failed"
+
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -19,9 +25,19 @@ class Document(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
 
-    # Cloudinary integration
+    # Stored file: public id (the content-addressed storage key) and URL in the storage backend
     cloudinary_public_id = Column(String, nullable=True)
     cloudinary_url = Column(String, nullable=True)
+    storage_backend = Column(String, default="cloudinary", server_default="cloudinary", nullable=False)
+    # Files are staged locally and sent to the backend in the background, with retries
+    storage_status = Column(Enum(StorageStatus), default=StorageStatus.STORED,
+                            server_default=StorageStatus.STORED.name, nullable=False, index=True)
+    storage_attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    storage_error = Column(Text, nullable=True)
+    # Next attempt of a pending upload; pushed ahead while an attempt runs
+    storage_retry_at = Column(DateTime, nullable=True)
+    # Host whose staging directory holds the file until it is stored; only its workers upload it
+    storage_staging_host = Column(String, nullable=True)
 
     file_size = Column(Integer, nullable=True)
     file_hash = Column(String, nullable=True)
@@ -38,6 +54,11 @@ class Document(Base):
                         onupdate=datetime.datetime.now(datetime.timezone.utc), nullable=False)
     processed_at = Column(DateTime, nullable=True)
 
+    # Finds an earlier upload of the same file in the project (DOCUMENT_DEDUPE_POLICY)
+    __table_args__ = (
+        Index("ix_documents_project_file_hash", "project_id", "file_hash"),
+    )
+
     project = relationship("Project", back_populates="documents")
     uploaded_by = relationship("User", back_populates="uploaded_documents")
     segments = relationship(
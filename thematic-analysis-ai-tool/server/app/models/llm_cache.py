@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+import datetime
+from app.db.session import Base
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class LLMCacheEntry(Base):
+    """Parsed LLM output cached by provider, model, prompt and input text"""
+    __tablename__ = "llm_response_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha256 over (provider, model_name, prompt_hash, content_hash[, scope])
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)
+
+    provider = Column(String, nullable=False)
+    model_name = Column(String, nullable=False)
+    prompt_hash = Column(String(64), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+
+    response = Column(JSON, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime, default=_utcnow, nullable=False)
+    last_accessed_at = Column(DateTime, default=_utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LLMCacheEntry(id={self.id}, provider='{self.provider}', model_name='{self.model_name}')>"
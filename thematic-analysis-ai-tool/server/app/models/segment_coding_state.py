@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+import datetime
+from app.db.session import Base
+
+
+class SegmentCodingState(Base):
+    """What a segment looked like, and which model/prompt coded it, at its last AI coding"""
+    __tablename__ = "segment_coding_states"
+
+    segment_id = Column(Integer, ForeignKey(
+        "document_segments.id", ondelete="CASCADE"), primary_key=True)
+    # sha256 of the segment content that was sent to the model
+    content_hash = Column(String(64), nullable=False)
+    # sha256 of provider, model name and prompt used for the auto-generated codes
+    coding_version = Column(String(64), nullable=False)
+
+    coded_at = Column(DateTime, default=lambda: datetime.datetime.now(
+        datetime.timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f"<SegmentCodingState(segment_id={self.segment_id}, coding_version='{self.coding_version[:8]}')>"
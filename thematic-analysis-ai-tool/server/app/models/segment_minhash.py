@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey, JSON, Index
+from app.db.session import Base
+
+
+class SegmentMinHash(Base):
+    """MinHash signature of a segment and the near-duplicate cluster it belongs to"""
+    __tablename__ = "segment_minhashes"
+
+    segment_id = Column(Integer, ForeignKey(
+        "document_segments.id", ondelete="CASCADE"), primary_key=True)
+    project_id = Column(Integer, ForeignKey(
+        "projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    # List of MINHASH_NUM_PERM minimum hash values
+    signature = Column(JSON, nullable=False)
+    # Id of the cluster's representative segment (its own id if it has no near-duplicate)
+    cluster_id = Column(Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<SegmentMinHash(segment_id={self.segment_id}, cluster_id={self.cluster_id})>"
+
+
+class SegmentLSHBand(Base):
+    """One LSH band of a segment's MinHash signature, used to find near-duplicate candidates"""
+    __tablename__ = "segment_lsh_bands"
+
+    segment_id = Column(Integer, ForeignKey(
+        "document_segments.id", ondelete="CASCADE"), primary_key=True)
+    band_index = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey(
+        "projects.id", ondelete="CASCADE"), nullable=False)
+    band_hash = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_segment_lsh_bands_lookup", "project_id", "band_index", "band_hash"),
+    )
+
+    def __repr__(self):
+        return f"<SegmentLSHBand(segment_id={self.segment_id}, band={self.band_index})>"
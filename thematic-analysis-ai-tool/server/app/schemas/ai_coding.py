@@ -0,0 +1,73 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+from app.models.ai_coding_job import AICodingJobStatus
+
+
+class AICodingRequest(BaseModel):
+    """Parameters of an AI initial coding run"""
+    document_ids: List[int]
+    model_name: str = "gemini-2.0-flash"
+    provider: str = "google_genai"
+    max_concurrency: Optional[int] = Field(None, ge=1, le=64)
+    batch_mode: bool = False
+    # Skip segments already coded with the same model/prompt and unchanged since
+    incremental: bool = False
+    # Code one representative per cluster of near-duplicate segments
+    deduplicate: bool = True
+
+
+class ThemeGenerationRequest(BaseModel):
+    """Parameters of a theme generation run over a project's codes"""
+    project_id: int
+    model_name: str = "gemini-2.0-flash"
+    provider: str = "google_genai"
+    # Defaults to sqrt(codes / 2), capped by THEME_MAX_CLUSTERS
+    num_themes: Optional[int] = Field(None, ge=2, le=200)
+    max_concurrency: Optional[int] = Field(None, ge=1, le=64)
+
+
+class AICodingEstimate(BaseModel):
+    """Dry-run estimate of an AI initial coding run"""
+    total_segments: int
+    # Skipped by incremental mode
+    skipped_segments: int
+    segments_to_code: int
+    # Distinct texts or near-duplicate clusters actually sent to the model
+    unique_texts: int
+    cache_hit_ratio: float
+    llm_requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    # None unless LLM_PRICES_PER_MILLION_TOKENS has a price for the model
+    estimated_cost: Optional[float] = None
+    concurrency: int
+    expected_latency_seconds: float
+    rate_limits: Dict[str, int]
+    estimated_duration_seconds: float
+    # "concurrency", "requests_per_minute" or "tokens_per_minute"
+    bottleneck: str
+
+
+class AICodingJobOut(BaseModel):
+    """Status of a background AI coding job"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: AICodingJobStatus
+    document_ids: List[int]
+    model_name: str
+    provider: str
+    options: Optional[Dict[str, Any]] = None
+    total_segments: int
+    processed_segments: int
+    failed_segments: int
+    errors: Optional[List[Dict[str, Any]]] = None
+    result_summary: Optional[Dict[str, Any]] = None
+    cancel_requested: bool
+    attempts: int = 0
+    created_by_id: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, ConfigDict
 from typing import Optional, Dict, Any, List, Union, Literal
 from datetime import datetime
-from app.models.document import DocumentType
+from app.models.document import DocumentType, StorageStatus
 from app.schemas.document_segment import DocumentSegmentBase, DocumentSegmentOut
 
 
@@ -33,6 +33,8 @@ class DocumentUpdate(BaseModel):
     """Schema for updating an existing document"""
     name: Optional[str] = None
     description: Optional[str] = None
+    # CSV/Excel only: columns sent to the LLM during AI coding ([] for all)
+    coding_columns: Optional[List[str]] = None
 
 
 class DocumentOut(DocumentBase):
@@ -52,6 +54,7 @@ class DocumentOut(DocumentBase):
     # raw_content: Optional[str] = None
     file_metadata: Optional[Dict[str, Any]] = None
     processed_at: Optional[datetime] = None
+    storage_status: Optional[StorageStatus] = None
 
 
 class DocumentUpload(BaseModel):
@@ -63,6 +66,7 @@ class DocumentUpload(BaseModel):
     # raw_content: Optional[str] = None
     file_size: Optional[int] = None
     upload_status: str = "success"
+    storage_status: Optional[StorageStatus] = None
 
 
 class BulkUploadResult(BaseModel):
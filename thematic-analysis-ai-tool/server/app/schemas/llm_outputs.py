@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List
 
 class CodeOutput(BaseModel):
     """
@@ -7,4 +8,27 @@ class CodeOutput(BaseModel):
     reasoning: str = Field(description="The reasoning behind the code generation.")
     code: str = Field(description="The assigned/generated code.")
     quote: str = Field(description="Exact quote from the passage that the code is attached to.")
-    code_description: str = Field(description="Description of the code, explaining how it relates to the quote.")
\ No newline at end of file
+    code_description: str = Field(description="Description of the code, explaining how it relates to the quote.")
+
+
+class SegmentCodeOutput(CodeOutput):
+    """
+    Represents the code created for one segment of a batched prompt.
+    """
+    segment_id: str = Field(description="The id of the segment, exactly as given in square brackets in the input.")
+
+
+class BatchCodeOutput(BaseModel):
+    """
+    Represents the codes created for every segment of a batched prompt.
+    """
+    items: List[SegmentCodeOutput] = Field(description="One entry per input segment, in input order.")
+
+
+class ThemeOutput(BaseModel):
+    """
+    Represents the theme proposed for a cluster of codes.
+    """
+    reasoning: str = Field(description="The reasoning behind the theme.")
+    theme: str = Field(description="Short name of the theme.")
+    theme_description: str = Field(description="Description of the theme and what the codes in it have in common.")
@@ -0,0 +1,170 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import String, case, cast, func, or_
+import math
+
+from app.core.config import settings
+from app.core.permissions import PermissionChecker
+from app.models.code import Code
+from app.models.document import Document
+from app.models.document_segment import DocumentSegment
+from app.models.segment_coding_state import SegmentCodingState
+from app.models.segment_minhash import SegmentMinHash
+from app.models.user import User
+from app.prompts.initial_coding import system_message, batch_system_message
+from app.schemas.ai_coding import AICodingRequest, AICodingEstimate
+from app.services.document.columns import coding_text_expression, get_coding_columns
+from app.services.llm.batching import CHARS_PER_TOKEN, SEGMENT_OVERHEAD_TOKENS, estimate_tokens
+from app.services.llm.cache import LLMCacheService
+from app.services.llm.local_provider import LOCAL_PROVIDER
+from app.services.llm.metrics import token_cost
+from app.services.llm.rate_limiter import get_rate_limits
+from app.services.llm.retry import get_call_stats
+from app.services.llm_service import LLMService
+
+
+class AICodingEstimateService:
+    """Dry-run estimates of AI coding cost and duration, without calling the model"""
+
+    @staticmethod
+    def estimate(db: Session, request: AICodingRequest, user_id: int) -> AICodingEstimate:
+        """
+        Estimate tokens, LLM requests and wall time of coding the documents.
+
+        Uses the same segment selection as `AICodingService.generate_code`
+        (incremental skipping, column selection and near-duplicate
+        clustering) through aggregate queries only. Requests are scaled by
+        the observed cache hit ratio and duration is the slowest of the
+        concurrency, requests-per-minute and tokens-per-minute bounds.
+        """
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise ValueError("User not found")
+        if not request.document_ids:
+            raise ValueError("At least one document is required")
+        LLMService.check_provider(request.provider)
+        selected = {}
+        for document_id in request.document_ids:
+            document = PermissionChecker.check_document_access(
+                db, document_id, user, raise_exception=False
+            )
+            if not document:
+                raise ValueError(f"Document {document_id} not found or access denied")
+            columns = get_coding_columns(document.file_metadata)
+            if columns:
+                selected[document_id] = columns
+
+        query = db.query(DocumentSegment).filter(
+            DocumentSegment.document_id.in_(request.document_ids))
+        total_segments = query.with_entities(func.count(DocumentSegment.id)).scalar() or 0
+
+        # Text sent to the model: selected columns of tabular rows, else the content
+        text = DocumentSegment.content
+        if selected:
+            has_columns = DocumentSegment.document_id.in_(list(selected))
+            text = case(*[
+                (DocumentSegment.document_id == document_id, coding_text_expression(columns))
+                for document_id, columns in selected.items()
+            ], else_=DocumentSegment.content)
+            query = query.filter(func.length(text) > 0)
+
+        if request.incremental:
+            version = LLMService.version_for(request.provider, request.model_name, request.batch_mode)
+            content_hash = func.encode(
+                func.sha256(func.convert_to(text, "UTF8")), "hex")
+            query = query.outerjoin(
+                SegmentCodingState, SegmentCodingState.segment_id == DocumentSegment.id
+            ).filter(or_(
+                SegmentCodingState.segment_id.is_(None),
+                SegmentCodingState.coding_version != version,
+                SegmentCodingState.content_hash != content_hash
+            ))
+
+        # Segments sent to the model: one per cluster, or one per distinct text
+        if request.deduplicate:
+            query = query.outerjoin(
+                SegmentMinHash, SegmentMinHash.segment_id == DocumentSegment.id)
+            unit = cast(func.coalesce(SegmentMinHash.cluster_id, DocumentSegment.id), String)
+            if selected:
+                # Rows with selected columns are deduplicated by exact text only
+                unit = case((has_columns, func.md5(text)), else_=unit)
+        else:
+            unit = func.md5(text)
+        segments_to_code, total_chars, unique_texts = query.with_entities(
+            func.count(DocumentSegment.id),
+            func.coalesce(func.sum(func.length(text)), 0),
+            func.count(func.distinct(unit))
+        ).one()
+
+        hit_ratio = LLMCacheService.get_stats(db)["hit_ratio"] if settings.LLM_CACHE_ENABLED else 0.0
+        texts_to_send = unique_texts * (1.0 - hit_ratio)
+        # Characters of the distinct texts, assuming duplicates are of average length
+        text_tokens = (total_chars / segments_to_code * texts_to_send / CHARS_PER_TOKEN) \
+            if segments_to_code else 0.0
+
+        codebook_tokens = 0
+        if settings.CODEBOOK_ENABLED:
+            code_count = db.query(func.count(Code.id)).filter(
+                Code.project_id.in_(db.query(Document.project_id).filter(
+                    Document.id.in_(request.document_ids))),
+                Code.is_active.isnot(False)
+            ).scalar() or 0
+            # Upper bound: a name plus a truncated description per listed code
+            codebook_tokens = min(settings.CODEBOOK_TOP_K, code_count) * math.ceil(
+                (settings.CODEBOOK_DESCRIPTION_CHARS + 40) / CHARS_PER_TOKEN)
+
+        if request.batch_mode:
+            requests = max(
+                math.ceil((text_tokens + texts_to_send * SEGMENT_OVERHEAD_TOKENS)
+                          / settings.LLM_BATCH_TOKEN_BUDGET),
+                math.ceil(texts_to_send / settings.LLM_BATCH_MAX_SEGMENTS)
+            )
+            prompt_tokens = requests * (estimate_tokens(batch_system_message) + codebook_tokens) \
+                + text_tokens + texts_to_send * SEGMENT_OVERHEAD_TOKENS
+        else:
+            requests = math.ceil(texts_to_send)
+            prompt_tokens = requests * (estimate_tokens(system_message) + codebook_tokens) \
+                + text_tokens
+        completion_tokens = texts_to_send * settings.LLM_ESTIMATED_OUTPUT_TOKENS
+
+        concurrency = min(
+            request.max_concurrency or settings.LLM_MAX_CONCURRENCY,
+            settings.LLM_PROVIDER_MAX_CONCURRENCY
+        )
+        latency = AICodingEstimateService._expected_latency(request.provider, request.model_name)
+        limits = get_rate_limits(request.provider, request.model_name)
+        bounds = {"concurrency": requests * latency / max(1, concurrency)}
+        if limits["requests_per_minute"] > 0:
+            bounds["requests_per_minute"] = requests / limits["requests_per_minute"] * 60
+        if limits["tokens_per_minute"] > 0:
+            bounds["tokens_per_minute"] = \
+                (prompt_tokens + completion_tokens) / limits["tokens_per_minute"] * 60
+        bottleneck = max(bounds, key=bounds.get)
+
+        return AICodingEstimate(
+            total_segments=total_segments,
+            skipped_segments=total_segments - segments_to_code,
+            segments_to_code=segments_to_code,
+            unique_texts=unique_texts,
+            cache_hit_ratio=round(hit_ratio, 4),
+            llm_requests=requests,
+            prompt_tokens=math.ceil(prompt_tokens),
+            completion_tokens=math.ceil(completion_tokens),
+            total_tokens=math.ceil(prompt_tokens + completion_tokens),
+            estimated_cost=token_cost(
+                request.provider, request.model_name, prompt_tokens, completion_tokens),
+            concurrency=concurrency,
+            expected_latency_seconds=round(latency, 3),
+            rate_limits=limits,
+            estimated_duration_seconds=round(bounds[bottleneck], 1),
+            bottleneck=bottleneck,
+        )
+
+    @staticmethod
+    def _expected_latency(provider: str, model_name: str) -> float:
+        """Mean observed call latency, or a configured guess before the first call"""
+        observed = get_call_stats(provider, model_name).snapshot()["mean_latency_seconds"]
+        if observed is not None:
+            return observed
+        if provider == LOCAL_PROVIDER:
+            return settings.LOCAL_LLM_LATENCY_MS / 1000.0
+        return settings.LLM_ESTIMATED_LATENCY_SECONDS
@@ -0,0 +1,441 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Optional, List
+import datetime
+import os
+import socket
+import threading
+
+from app.core.config import settings
+from app.core.permissions import PermissionChecker
+from app.db.session import SessionLocal
+from app.models.ai_coding_job import AICodingJob, AICodingJobStatus, AICodingJobSegment
+from app.models.document_segment import DocumentSegment
+from app.models.user import User
+from app.schemas.ai_coding import AICodingRequest
+from app.services.ai_coding_service import AICodingService
+from app.services.llm_service import LLMService
+from app.services.llm.metrics import track_run
+
+# Keep at most this many per-segment errors on a job row
+MAX_STORED_ERRORS = 200
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class AICodingJobService:
+    """Service for queueing, running and tracking background AI coding jobs"""
+
+    @staticmethod
+    def create_job(db: Session, request: AICodingRequest, user_id: int) -> AICodingJob:
+        """Validate access to the documents and queue a new job"""
+
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise ValueError("User not found")
+
+        if not request.document_ids:
+            raise ValueError("At least one document is required")
+        LLMService.check_provider(request.provider)
+        for document_id in request.document_ids:
+            document = PermissionChecker.check_document_access(
+                db, document_id, user, raise_exception=False
+            )
+            if not document:
+                raise ValueError(f"Document {document_id} not found or access denied")
+
+        total_segments = db.query(func.count(DocumentSegment.id)).filter(
+            DocumentSegment.document_id.in_(request.document_ids)
+        ).scalar()
+
+        job = AICodingJob(
+            status=AICodingJobStatus.QUEUED,
+            document_ids=request.document_ids,
+            model_name=request.model_name,
+            provider=request.provider,
+            options={
+                "max_concurrency": request.max_concurrency,
+                "batch_mode": request.batch_mode,
+                "incremental": request.incremental,
+                "deduplicate": request.deduplicate,
+            },
+            total_segments=total_segments or 0,
+            errors=[],
+            created_by_id=user_id,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id: int, user_id: int) -> AICodingJob:
+        """Get a job started by the user"""
+        job = db.query(AICodingJob).filter(
+            AICodingJob.id == job_id,
+            AICodingJob.created_by_id == user_id
+        ).first()
+        if not job:
+            raise ValueError("Job not found")
+        return job
+
+    @staticmethod
+    def list_jobs(db: Session, user_id: int, limit: int = 50) -> List[AICodingJob]:
+        """Get the most recent jobs started by the user"""
+        return db.query(AICodingJob).filter(
+            AICodingJob.created_by_id == user_id
+        ).order_by(AICodingJob.created_at.desc()).limit(limit).all()
+
+    @staticmethod
+    def cancel_job(db: Session, job_id: int, user_id: int) -> AICodingJob:
+        """Cancel a queued job, or ask the worker to stop a running one"""
+        job = db.query(AICodingJob).filter(
+            AICodingJob.id == job_id,
+            AICodingJob.created_by_id == user_id
+        ).with_for_update().first()
+        if not job:
+            raise ValueError("Job not found")
+
+        if job.status == AICodingJobStatus.QUEUED:
+            job.status = AICodingJobStatus.CANCELLED
+            job.finished_at = _utcnow()
+        elif job.status == AICodingJobStatus.RUNNING:
+            # The worker checks this flag between chunks
+            job.cancel_requested = True
+        else:
+            raise ValueError(f"Job already {job.status.value}")
+
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def resume_job(db: Session, job_id: int, user_id: int) -> AICodingJob:
+        """
+        Queue a failed, cancelled or partially failed job again.
+
+        The job keeps its documents, model, provider and options; segments
+        that already succeeded are skipped and failed ones are retried.
+        """
+        job = db.query(AICodingJob).filter(
+            AICodingJob.id == job_id,
+            AICodingJob.created_by_id == user_id
+        ).with_for_update().first()
+        if not job:
+            raise ValueError("Job not found")
+
+        if job.status in (AICodingJobStatus.QUEUED, AICodingJobStatus.RUNNING):
+            raise ValueError(f"Job already {job.status.value}")
+        if job.status == AICodingJobStatus.SUCCEEDED and not job.failed_segments:
+            raise ValueError("Job already coded every segment")
+
+        job.total_segments = db.query(func.count(DocumentSegment.id)).filter(
+            DocumentSegment.document_id.in_(job.document_ids)
+        ).scalar() or 0
+        job.status = AICodingJobStatus.QUEUED
+        job.cancel_requested = False
+        job.worker_id = None
+        job.finished_at = None
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def requeue_stale_jobs(db: Session) -> int:
+        """
+        Requeue running jobs whose worker stopped sending heartbeats, e.g.
+        because its process died. They resume from their checkpoints.
+        """
+        cutoff = _utcnow() - datetime.timedelta(seconds=settings.AI_JOB_STALE_AFTER_SECONDS)
+        jobs = db.query(AICodingJob).filter(
+            AICodingJob.status == AICodingJobStatus.RUNNING,
+            AICodingJob.heartbeat_at < cutoff
+        ).with_for_update(skip_locked=True).all()
+        for job in jobs:
+            print(f"AI coding job {job.id} lost worker {job.worker_id}; requeueing")
+            if job.cancel_requested:
+                job.status = AICodingJobStatus.CANCELLED
+                job.finished_at = _utcnow()
+            else:
+                job.status = AICodingJobStatus.QUEUED
+            job.worker_id = None
+        db.commit()
+        return len(jobs)
+
+    @staticmethod
+    def _checkpoint(db: Session, job_id: int, outcomes: List[dict]) -> None:
+        """Record segment outcomes of a job; a later outcome replaces an earlier one"""
+        if not outcomes:
+            return
+        now = _utcnow()
+        stmt = pg_insert(AICodingJobSegment.__table__).values([
+            {**outcome, "job_id": job_id, "completed_at": now} for outcome in outcomes
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["job_id", "segment_id"],
+            set_={
+                "status": stmt.excluded.status,
+                "error": stmt.excluded.error,
+                "completed_at": stmt.excluded.completed_at,
+            }
+        ))
+
+    @staticmethod
+    def claim_next_job(db: Session, worker_id: str) -> Optional[int]:
+        """
+        Atomically claim the oldest queued job.
+
+        FOR UPDATE SKIP LOCKED lets workers in several processes poll the
+        same table without claiming the same job twice.
+        """
+        job = db.query(AICodingJob).filter(
+            AICodingJob.status == AICodingJobStatus.QUEUED
+        ).order_by(AICodingJob.created_at, AICodingJob.id).with_for_update(
+            skip_locked=True
+        ).first()
+        if not job:
+            db.rollback()
+            return None
+
+        now = _utcnow()
+        job.status = AICodingJobStatus.RUNNING
+        job.worker_id = worker_id
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = now
+        job.heartbeat_at = now
+        db.commit()
+        return job.id
+
+    @staticmethod
+    def _owned_job(db: Session, job_id: int, worker_id: str, attempt: int):
+        """Query of the job while it is still running as this worker's claim `attempt`"""
+        return db.query(AICodingJob).filter(
+            AICodingJob.id == job_id,
+            AICodingJob.status == AICodingJobStatus.RUNNING,
+            AICodingJob.worker_id == worker_id,
+            AICodingJob.attempts == attempt
+        )
+
+    @staticmethod
+    def run_job(job_id: int, worker_id: str) -> None:
+        """
+        Run a job claimed by `worker_id` to completion, recording progress on the job row.
+
+        Each segment's outcome is checkpointed after its chunk is persisted,
+        so a resumed run skips segments that already succeeded. A crash
+        between persisting a chunk and checkpointing it only re-codes that
+        chunk, which reuses the cached LLM output and existing quotes.
+
+        A heartbeat thread keeps the job from being requeued while it runs,
+        however long a chunk takes. Every write to the job row is conditional
+        on this worker still owning the claim; once it does not (the job was
+        requeued and claimed again), the run stops without recording anything.
+
+        The result summary includes the LLM calls, tokens and cost of the
+        latest attempt under "llm".
+        """
+        with SessionLocal() as job_db, SessionLocal() as work_db:
+            job = job_db.query(AICodingJob).filter(
+                AICodingJob.id == job_id,
+                AICodingJob.worker_id == worker_id
+            ).first()
+            if not job:
+                return
+            attempt = job.attempts
+
+            def owned():
+                return AICodingJobService._owned_job(job_db, job_id, worker_id, attempt)
+
+            options = job.options or {}
+            completed = {
+                segment_id for (segment_id,) in job_db.query(AICodingJobSegment.segment_id).filter(
+                    AICodingJobSegment.job_id == job_id,
+                    AICodingJobSegment.status == "succeeded"
+                ).all()
+            }
+            # Progress is recounted on every attempt; completed segments count as processed
+            progress = {"processed_segments": 0, "failed_segments": 0}
+            errors: list[dict] = []
+            failed_outcomes: list[dict] = []
+
+            def on_error(segment_id: int, error: Exception):
+                progress["failed_segments"] += 1
+                failed_outcomes.append(
+                    {"segment_id": segment_id, "status": "failed", "error": str(error)})
+                if len(errors) < MAX_STORED_ERRORS:
+                    errors.append({"segment_id": segment_id, "error": str(error)})
+
+            def on_progress(chunk_results: list[dict], processed: int):
+                progress["processed_segments"] += processed
+                if not owned().update({
+                    AICodingJob.processed_segments: progress["processed_segments"],
+                    AICodingJob.failed_segments: progress["failed_segments"],
+                    AICodingJob.errors: list(errors),
+                    AICodingJob.heartbeat_at: _utcnow(),
+                }, synchronize_session=False):
+                    job_db.rollback()
+                    raise _JobLost()
+                AICodingJobService._checkpoint(job_db, job_id, [
+                    {"segment_id": result["segment_id"], "status": "succeeded", "error": None}
+                    for result in chunk_results
+                ] + failed_outcomes)
+                failed_outcomes.clear()
+                job_db.commit()
+
+            def should_cancel() -> bool:
+                if heartbeat.lost.is_set():
+                    return True
+                job_db.refresh(job, attribute_names=["cancel_requested"])
+                return bool(job.cancel_requested)
+
+            values: dict = {}
+            run_metrics = None
+            try:
+                with _JobHeartbeat(job_id, worker_id, attempt) as heartbeat, \
+                        track_run() as run_metrics:
+                    results = AICodingService.generate_code(
+                        document_ids=job.document_ids,
+                        db=work_db,
+                        user_id=job.created_by_id,
+                        model_name=job.model_name,
+                        provider=job.provider,
+                        max_concurrency=options.get("max_concurrency"),
+                        batch_mode=bool(options.get("batch_mode")),
+                        incremental=bool(options.get("incremental")),
+                        deduplicate=bool(options.get("deduplicate", True)),
+                        exclude_segment_ids=completed,
+                        on_progress=on_progress,
+                        on_error=on_error,
+                        should_cancel=should_cancel
+                    )
+                if heartbeat.lost.is_set():
+                    raise _JobLost()
+                previous_code_ids = (job.result_summary or {}).get("code_ids", [])
+                values[AICodingJob.status] = AICodingJobStatus.CANCELLED \
+                    if job.cancel_requested else AICodingJobStatus.SUCCEEDED
+                values[AICodingJob.result_summary] = {
+                    "coded_segments": job_db.query(func.count()).select_from(AICodingJobSegment).filter(
+                        AICodingJobSegment.job_id == job_id,
+                        AICodingJobSegment.status == "succeeded"
+                    ).scalar(),
+                    "failed_segments": progress["failed_segments"],
+                    "code_ids": sorted(set(previous_code_ids) | {
+                        r["code_id"] for r in results if r.get("code_id")}),
+                }
+            except _JobLost:
+                work_db.rollback()
+                print(f"AI coding job {job_id} was claimed again; {worker_id} stops attempt {attempt}")
+                return
+            except Exception as e:
+                print(f"AI coding job {job_id} failed: {e}")
+                work_db.rollback()
+                job_db.rollback()
+                values[AICodingJob.status] = AICodingJobStatus.FAILED
+                if len(errors) < MAX_STORED_ERRORS:
+                    errors.append({"segment_id": None, "error": str(e)})
+
+            if run_metrics is not None:
+                values[AICodingJob.result_summary] = {
+                    **values.get(AICodingJob.result_summary, job.result_summary or {}),
+                    "llm": run_metrics.snapshot(),
+                }
+            values.update({
+                AICodingJob.processed_segments: progress["processed_segments"],
+                AICodingJob.failed_segments: progress["failed_segments"],
+                AICodingJob.errors: errors,
+                AICodingJob.finished_at: _utcnow(),
+            })
+            if not owned().update(values, synchronize_session=False):
+                print(f"AI coding job {job_id} was claimed again; dropping the result of "
+                      f"attempt {attempt} by {worker_id}")
+            job_db.commit()
+
+
+class _JobLost(Exception):
+    """The running job was requeued and claimed again: this attempt no longer owns it"""
+
+
+class _JobHeartbeat:
+    """
+    Thread that refreshes a running job's heartbeat every AI_JOB_HEARTBEAT_SECONDS
+    while the attempt still owns the job; `lost` is set once it does not.
+    """
+
+    def __init__(self, job_id: int, worker_id: str, attempt: int):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.attempt = attempt
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"ai-coding-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self) -> "_JobHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.AI_JOB_HEARTBEAT_SECONDS):
+            try:
+                with SessionLocal() as db:
+                    owned = AICodingJobService._owned_job(
+                        db, self.job_id, self.worker_id, self.attempt
+                    ).update({AICodingJob.heartbeat_at: _utcnow()}, synchronize_session=False)
+                    db.commit()
+            except Exception as e:
+                print(f"Heartbeat of AI coding job {self.job_id} failed: {e}")
+                continue
+            if not owned:
+                self.lost.set()
+                return
+
+
+class AICodingWorkerPool:
+    """In-process pool of threads that poll for and run queued AI coding jobs"""
+
+    def __init__(self, num_workers: int, poll_interval: float):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._run, name=f"ai-coding-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while not self._stop.is_set():
+            try:
+                with SessionLocal() as db:
+                    AICodingJobService.requeue_stale_jobs(db)
+                    job_id = AICodingJobService.claim_next_job(db, worker_id)
+                if job_id is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                AICodingJobService.run_job(job_id, worker_id)
+            except Exception as e:
+                print(f"AI coding worker {worker_id} error: {e}")
+                self._stop.wait(self.poll_interval)
+
+
+worker_pool = AICodingWorkerPool(
+    num_workers=settings.AI_JOB_WORKERS,
+    poll_interval=settings.AI_JOB_POLL_INTERVAL_SECONDS
+)
@@ -1,8 +1,35 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import exists, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Optional, Callable
+import datetime
+import hashlib
+import numpy as np
+from app.core.config import settings
+from app.core.permissions import PermissionChecker
+from app.models.annotation import Annotation
+from app.models.code import Code, quote_codes
+from app.models.document import Document
+from app.models.document_segment import segment_codes
+from app.models.quote import Quote
+from app.models.user import User
+from app.models.segment_coding_state import SegmentCodingState
 from app.services.llm_service import LLMService
+from app.services.llm.codebook import CodebookIndex, CodebookService
 from app.services.document_segment_service import DocumentSegmentService
-from app.schemas.llm_outputs import CodeOutput
+from app.services.document.near_duplicates import NearDuplicateService
+from app.services.document.columns import coding_text, get_coding_columns
+from app.schemas.llm_outputs import CodeOutput, ThemeOutput
 from app.services.code_assignment_service import CodeAssignmentService, SmartQuoteCodeAssignment
+from app.services import theme_clustering
+
+# Codes listed by name in a theme summary sent to the LLM
+THEME_SUMMARY_CODES = 10
+THEME_SUMMARY_TERMS = 12
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
 class AICodingService:
@@ -13,49 +40,436 @@ class AICodingService:
         db: Session,
         user_id: int,
         model_name: str = "gemini-2.0-flash",
-        provider: str = "google_genai"
+        provider: str = "google_genai",
+        max_concurrency: Optional[int] = None,
+        batch_mode: bool = False,
+        incremental: bool = False,
+        deduplicate: bool = True,
+        exclude_segment_ids: Optional[set[int]] = None,
+        on_progress: Optional[Callable[[list[dict], int], None]] = None,
+        on_error: Optional[Callable[[int, Exception], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None
     ) -> list[dict]:
+        """
+        Code every segment of the given documents with the LLM.
+
+        Segments are processed in chunks of AI_CODING_CHUNK_SIZE. After each
+        chunk `on_progress` receives the new results and the number of
+        segments processed, and `should_cancel` is checked. A failed segment
+        never aborts the run: if `on_error` is given it is reported there,
+        otherwise it appears in the results with no code and the error as
+        its message.
+
+        In incremental mode, segments whose content and coding version
+        (provider, model, prompt) are unchanged since their last AI coding
+        are skipped and counted as processed. Segments in
+        `exclude_segment_ids` (e.g. already completed by an earlier attempt of
+        a resumed job) are skipped the same way.
+
+        With `deduplicate`, near-duplicate segments (see NearDuplicateService)
+        are coded with their cluster representative's text, so each cluster
+        costs one LLM call and every member gets the same code.
+
+        With CODEBOOK_ENABLED, each prompt lists the project's existing codes
+        most relevant to the segment. The codebook index is refreshed before
+        every chunk, so codes created by one chunk can be reused by the next.
+
+        For CSV/Excel documents with selected coding columns, only those
+        columns of each row are sent (see `coding_text`); rows with none of
+        them filled in are skipped, and rows are deduplicated by exact text
+        instead of near-duplicate clusters of the whole row.
+        """
         results: list[dict] = []
-        llm_service = LLMService(model_name=model_name, provider=provider)
+        llm_service = LLMService.get_instance(model_name=model_name, provider=provider)
+        chunk_size = max(1, settings.AI_CODING_CHUNK_SIZE)
         for doc_id in document_ids:
+            document = db.query(
+                Document.project_id, Document.file_metadata
+            ).filter(Document.id == doc_id).first()
+            if document is None:
+                continue
+            project_id, file_metadata = document
             segments = DocumentSegmentService.get_document_segments(doc_id, db=db)
-            for seg in segments:
-                llm_response: CodeOutput = llm_service.initial_coding_llm.invoke(
-                    {"text": seg.content})
-
-                # Infer quote start/end within segment content
-                quote_text = llm_response.quote
-                start_idx = seg.content.find(quote_text)
-                if start_idx < 0:
-                    start_idx = 0
-                end_idx = start_idx + len(quote_text)
-
-                # Build assignment request
-                request = SmartQuoteCodeAssignment(
-                    document_id=seg.document_id,
-                    segment_id=seg.id,
-                    text=quote_text,
-                    start_char=start_idx,
-                    end_char=end_idx,
-                    code_name=llm_response.code,
-                    code_description=llm_response.code_description,
+            columns = get_coding_columns(file_metadata)
+            if exclude_segment_ids:
+                pending = [seg for seg in segments if seg.id not in exclude_segment_ids]
+                if on_progress and len(pending) < len(segments):
+                    on_progress([], len(segments) - len(pending))
+                segments = pending
+            if columns:
+                pending = [seg for seg in segments if coding_text(seg, columns)]
+                if on_progress and len(pending) < len(segments):
+                    on_progress([], len(segments) - len(pending))
+                segments = pending
+            if incremental:
+                pending = AICodingService._filter_changed_segments(
+                    db, segments, llm_service.coding_version(batch_mode), columns)
+                if on_progress and len(pending) < len(segments):
+                    on_progress([], len(segments) - len(pending))
+                segments = pending
+            for chunk_start in range(0, len(segments), chunk_size):
+                if should_cancel and should_cancel():
+                    return results
+                chunk = segments[chunk_start:chunk_start + chunk_size]
+                codebook = CodebookService.get_index(db, project_id) \
+                    if settings.CODEBOOK_ENABLED else None
+                chunk_results = AICodingService._code_segments(
+                    chunk, llm_service, db, user_id, max_concurrency, batch_mode, on_error,
+                    deduplicate, codebook, columns,
+                    # Responses chosen from the project's codes stay within the project
+                    cache_scope=f"project:{project_id}" if codebook is not None else None
                 )
-                assignment = CodeAssignmentService.smart_quote_code_assignment(
+                results.extend(chunk_results)
+                if on_progress:
+                    on_progress(chunk_results, len(chunk))
+        return results
+
+    @staticmethod
+    def _code_segments(
+        segments: list,
+        llm_service: LLMService,
+        db: Session,
+        user_id: int,
+        max_concurrency: Optional[int],
+        batch_mode: bool,
+        on_error: Optional[Callable[[int, Exception], None]],
+        deduplicate: bool = True,
+        codebook: Optional[CodebookIndex] = None,
+        columns: Optional[list[str]] = None,
+        cache_scope: Optional[str] = None
+    ) -> list[dict]:
+        """
+        Code one chunk of segments in parallel and persist the results in one
+        transaction. A segment whose LLM call fails after retries is reported
+        on its own; the rest of the chunk is still persisted. Responses are
+        cached under `cache_scope` (see `LLMService.cache_key`).
+        """
+        outcomes: dict[int, dict] = {}
+
+        def fail(seg, error: Exception):
+            if on_error is not None:
+                on_error(seg.id, error)
+            else:
+                outcomes[seg.id] = {
+                    "segment_id": seg.id,
+                    "code_id": None,
+                    "quote_id": None,
+                    "reasoning": "",
+                    "message": f"AI coding failed: {error}"
+                }
+
+        try:
+            if deduplicate and not columns:
+                # Identical texts are sent once, so a cluster costs one call
+                representatives = NearDuplicateService.get_representatives(db, segments)
+                texts = [representatives[seg.id].content for seg in segments]
+            else:
+                texts = [coding_text(seg, columns) for seg in segments]
+            llm_responses = llm_service.code_texts_cached(
+                db,
+                texts,
+                max_concurrency=max_concurrency,
+                batch_mode=batch_mode,
+                return_exceptions=True,
+                codebook=codebook,
+                scope=cache_scope
+            )
+        except Exception as e:
+            # Cache lookups or writes failed; nothing was persisted for this chunk
+            db.rollback()
+            for seg in segments:
+                fail(seg, e)
+            return [outcomes[seg.id] for seg in segments if seg.id in outcomes]
+
+        coded: list[tuple] = []
+        for seg, llm_response in zip(segments, llm_responses):
+            if isinstance(llm_response, Exception):
+                fail(seg, llm_response)
+            else:
+                coded.append((seg, llm_response))
+
+        if coded:
+            requests = [
+                AICodingService._build_assignment_request(seg, llm_response)
+                for seg, llm_response in coded
+            ]
+            try:
+                # All segments of a chunk belong to the same document
+                assignments = CodeAssignmentService.bulk_quote_code_assignment(
                     db=db,
-                    request=request,
+                    document_id=segments[0].document_id,
+                    requests=requests,
                     user_id=user_id,
                     is_auto_generated=True
                 )
+            except Exception as e:
+                db.rollback()
+                assignments = [{"assignment_status": "failed", "message": str(e)}] * len(coded)
+
+            AICodingService._record_coding_state(
+                db,
+                [seg for (seg, _), assignment in zip(coded, assignments)
+                 if assignment["assignment_status"] == "success"],
+                llm_service.coding_version(batch_mode),
+                columns
+            )
+
+            for (seg, llm_response), assignment in zip(coded, assignments):
+                if assignment["assignment_status"] != "success":
+                    fail(seg, ValueError(assignment["message"]))
+                    continue
                 # Collect result
-                results.append({
+                outcomes[seg.id] = {
                     "segment_id": seg.id,
-                    "code_id": assignment.get("code", {}).get("id"),
-                    "quote_id": assignment.get("quote", {}).get("id"),
+                    "code_id": assignment["code"]["id"],
+                    "quote_id": assignment["quote"]["id"],
                     "reasoning": llm_response.reasoning,
-                    "message": assignment.get("message")
-                })
+                    "message": assignment["message"]
+                }
+
+        return [outcomes[seg.id] for seg in segments if seg.id in outcomes]
+
+    @staticmethod
+    def _filter_changed_segments(
+        db: Session, segments: list, coding_version: str, columns: Optional[list[str]] = None
+    ) -> list:
+        """Drop segments already coded with this version and unchanged since"""
+        if not segments:
+            return segments
+        states = {
+            segment_id: (content_hash, version)
+            for segment_id, content_hash, version in db.query(
+                SegmentCodingState.segment_id,
+                SegmentCodingState.content_hash,
+                SegmentCodingState.coding_version
+            ).filter(
+                SegmentCodingState.segment_id.in_([seg.id for seg in segments])
+            ).all()
+        }
+        return [
+            seg for seg in segments
+            if states.get(seg.id) != (_content_hash(coding_text(seg, columns)), coding_version)
+        ]
+
+    @staticmethod
+    def _record_coding_state(
+        db: Session, segments: list, coding_version: str, columns: Optional[list[str]] = None
+    ) -> None:
+        """
+        Remember content hash and coding version of freshly coded segments.
+
+        The hash covers the text actually sent, so changing a document's
+        coding columns makes its rows eligible for recoding.
+        """
+        if not segments:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        stmt = pg_insert(SegmentCodingState.__table__).values([
+            {
+                "segment_id": seg.id,
+                "content_hash": _content_hash(coding_text(seg, columns)),
+                "coding_version": coding_version,
+                "coded_at": now,
+            }
+            for seg in segments
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["segment_id"],
+            set_={
+                "content_hash": stmt.excluded.content_hash,
+                "coding_version": stmt.excluded.coding_version,
+                "coded_at": stmt.excluded.coded_at,
+            }
+        ))
+        db.commit()
+
+    @staticmethod
+    def _build_assignment_request(seg, llm_response: CodeOutput) -> SmartQuoteCodeAssignment:
+        """Turn the LLM output for one segment into a quote + code assignment"""
+        # Infer quote start/end within segment content
+        quote_text = llm_response.quote
+        start_idx = seg.content.find(quote_text) if quote_text else -1
+        if start_idx < 0:
+            # The model paraphrased; quote the whole segment instead
+            quote_text = seg.content
+            start_idx = 0
+        end_idx = start_idx + len(quote_text)
+
+        return SmartQuoteCodeAssignment(
+            document_id=seg.document_id,
+            segment_id=seg.id,
+            text=quote_text,
+            start_char=start_idx,
+            end_char=end_idx,
+            code_name=llm_response.code,
+            code_description=llm_response.code_description,
+        )
+
+    @staticmethod
+    def generate_themes(
+        project_id: int,
+        db: Session,
+        user_id: int,
+        model_name: str = "gemini-2.0-flash",
+        provider: str = "google_genai",
+        num_themes: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ) -> list[dict]:
+        """
+        Group the project's top-level codes into themes.
+
+        Codes are vectorised from their name, description and up to
+        THEME_MAX_QUOTES_PER_CODE quotes as hashed TF-IDF, clustered with
+        spherical k-means, and each cluster of at least THEME_MIN_CLUSTER_SIZE
+        codes becomes a parent Code. Only a summary per cluster (top terms and
+        representative code names) is sent to the LLM for naming, never
+        quotes. Themes from a previous run are replaced.
+        """
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise ValueError("User not found")
+        project = PermissionChecker.check_project_access(
+            db, project_id, user, raise_exception=False
+        )
+        if not project:
+            raise ValueError("Project not found or access denied")
+        LLMService.check_provider(provider)
+
+        AICodingService._remove_generated_themes(db, project_id)
+
+        child = aliased(Code)
+        codes = db.query(Code.id, Code.name, Code.description).filter(
+            Code.project_id == project_id,
+            Code.parent_id.is_(None),
+            Code.is_active.isnot(False),
+            func.coalesce(Code.properties["kind"].as_string(), "") != "theme",
+            ~exists().where(child.parent_id == Code.id)
+        ).order_by(Code.id).all()
+        if len(codes) < 2:
+            raise ValueError("At least two top-level codes are needed to generate themes")
+
+        # Quote text per code, capped so a few heavily used codes do not dominate
+        quotes: dict[int, list[str]] = {}
+        quote_counts: dict[int, int] = {}
+        for code_id, text in db.query(quote_codes.c.code_id, Quote.text).join(
+            Quote, Quote.id == quote_codes.c.quote_id
+        ).join(Code, Code.id == quote_codes.c.code_id).filter(
+            Code.project_id == project_id
+        ).yield_per(5000):
+            quote_counts[code_id] = quote_counts.get(code_id, 0) + 1
+            if quote_counts[code_id] <= settings.THEME_MAX_QUOTES_PER_CODE:
+                quotes.setdefault(code_id, []).append(text)
+
+        # Name terms count three times, like a title
+        documents = [
+            theme_clustering.terms(name) * 3
+            + theme_clustering.terms(description or "")
+            + theme_clustering.terms(" ".join(quotes.get(code_id, [])))
+            for code_id, name, description in codes
+        ]
+        matrix, feature_terms = theme_clustering.hashed_tfidf(
+            documents, settings.THEME_HASH_FEATURES)
+        non_empty = np.flatnonzero(matrix.getnnz(axis=1))
+        if len(non_empty) < 2:
+            raise ValueError("Codes have too little text to generate themes")
+        matrix = matrix[non_empty]
+
+        k = num_themes or theme_clustering.default_cluster_count(
+            len(non_empty), settings.THEME_MAX_CLUSTERS)
+        labels, centroids = theme_clustering.spherical_kmeans(
+            matrix, k, iterations=settings.THEME_KMEANS_ITERATIONS)
+        # Each code's similarity to its own centroid; n x k, never n x features
+        similarity = np.asarray(matrix.dot(centroids.T))[np.arange(matrix.shape[0]), labels]
+
+        clusters = []
+        for label in range(len(centroids)):
+            members = np.flatnonzero(labels == label)
+            if len(members) < settings.THEME_MIN_CLUSTER_SIZE:
+                continue
+            # Most central codes first
+            members = members[np.argsort(-similarity[members])]
+            member_codes = [codes[non_empty[member]] for member in members]
+            top_terms = [
+                feature_terms[feature]
+                for feature in np.argsort(-centroids[label])[:THEME_SUMMARY_TERMS]
+                if centroids[label][feature] > 0 and feature in feature_terms
+            ]
+            clusters.append({
+                "code_ids": [code_id for code_id, _, _ in member_codes],
+                "top_terms": top_terms,
+                "summary": "\n".join([
+                    f"Codes: {len(member_codes)}",
+                    f"Quotes: {sum(quote_counts.get(code_id, 0) for code_id, _, _ in member_codes)}",
+                    f"Top terms: {', '.join(top_terms)}",
+                    "Representative codes:",
+                    *[f"- {name}" for _, name, _ in member_codes[:THEME_SUMMARY_CODES]],
+                ]),
+            })
+        if not clusters:
+            return []
+
+        llm_service = LLMService.get_instance(model_name=model_name, provider=provider)
+        labels_out = llm_service.label_themes(
+            [cluster["summary"] for cluster in clusters], max_concurrency)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        themes = []
+        for cluster, label in zip(clusters, labels_out):
+            if isinstance(label, Exception):
+                print(f"Theme labelling failed, naming by top terms: {label}")
+                label = ThemeOutput(
+                    reasoning=f"Labelling failed: {label}",
+                    theme=" & ".join(term.title() for term in cluster["top_terms"][:2]) or "Theme",
+                    theme_description=f"Codes about {', '.join(cluster['top_terms'][:5])}.",
+                )
+            themes.append(Code(
+                name=label.theme,
+                description=label.theme_description,
+                project_id=project_id,
+                created_by_id=user_id,
+                is_auto_generated=True,
+                properties={"kind": "theme", "top_terms": cluster["top_terms"],
+                            "reasoning": label.reasoning},
+                created_at=now,
+                updated_at=now,
+            ))
+        db.add_all(themes)
+        db.flush()
+        for theme, cluster in zip(themes, clusters):
+            db.query(Code).filter(Code.id.in_(cluster["code_ids"])).update(
+                {Code.parent_id: theme.id}, synchronize_session=False)
+
+        results = [
+            {
+                "theme_id": theme.id,
+                "name": theme.name,
+                "description": theme.description,
+                "top_terms": cluster["top_terms"],
+                "code_ids": cluster["code_ids"],
+            }
+            for theme, cluster in zip(themes, clusters)
+        ]
+        db.commit()
         return results
 
     @staticmethod
-    def generate_themes(code):
-        pass
+    def _remove_generated_themes(db: Session, project_id: int) -> None:
+        """Detach codes from previously generated themes and delete the unused themes"""
+        theme_ids = [
+            theme_id for (theme_id,) in db.query(Code.id).filter(
+                Code.project_id == project_id,
+                Code.is_auto_generated.is_(True),
+                Code.properties["kind"].as_string() == "theme"
+            ).all()
+        ]
+        if not theme_ids:
+            return
+        db.query(Code).filter(Code.parent_id.in_(theme_ids)).update(
+            {Code.parent_id: None}, synchronize_session=False)
+        # Themes someone has since attached quotes, segments or annotations to are kept
+        db.query(Code).filter(
+            Code.id.in_(theme_ids),
+            ~exists().where(quote_codes.c.code_id == Code.id),
+            ~exists().where(segment_codes.c.code_id == Code.id),
+            ~exists().where(Annotation.code_id == Code.id)
+        ).delete(synchronize_session=False)
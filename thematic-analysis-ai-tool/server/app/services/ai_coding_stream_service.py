@@ -0,0 +1,113 @@
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import asyncio
+import json
+import threading
+import time
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.schemas.ai_coding import AICodingRequest
+from app.services.ai_coding_service import AICodingService
+from app.services.llm.metrics import track_run
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class AICodingStreamService:
+    """Service that streams AI coding results as Server-Sent Events"""
+
+    @staticmethod
+    async def stream_code(
+        request: AICodingRequest,
+        user_id: int,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run AI coding in a worker thread and yield SSE messages.
+
+        Emits a `result` event per persisted segment, an `error` event per
+        failed segment, `heartbeat` events while the model is busy and a
+        final `summary` event, which includes the run's LLM calls, tokens and
+        cost. The run is cancelled if the client goes away.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        started = time.monotonic()
+        counts = {"coded_segments": 0, "failed_segments": 0}
+
+        def emit(event: str, data: dict):
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+        def on_progress(chunk_results: list[dict], processed: int):
+            for result in chunk_results:
+                emit("result", result)
+
+        def on_error(segment_id: int, error: Exception):
+            emit("error", {"segment_id": segment_id, "error": str(error)})
+
+        def run():
+            status = "succeeded"
+            run_metrics = None
+            try:
+                with SessionLocal() as db, track_run() as run_metrics:
+                    AICodingService.generate_code(
+                        document_ids=request.document_ids,
+                        db=db,
+                        user_id=user_id,
+                        model_name=request.model_name,
+                        provider=request.provider,
+                        max_concurrency=request.max_concurrency,
+                        batch_mode=request.batch_mode,
+                        incremental=request.incremental,
+                        deduplicate=request.deduplicate,
+                        on_progress=on_progress,
+                        on_error=on_error,
+                        should_cancel=cancelled.is_set
+                    )
+                if cancelled.is_set():
+                    status = "cancelled"
+            except Exception as e:
+                status = "failed"
+                emit("error", {"segment_id": None, "error": str(e)})
+            emit("done", {
+                "status": status,
+                "llm": run_metrics.snapshot() if run_metrics is not None else None
+            })
+
+        worker = threading.Thread(target=run, name="ai-coding-stream", daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(
+                        events.get(), timeout=settings.AI_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected and await is_disconnected():
+                        cancelled.set()
+                        return
+                    yield _sse_event("heartbeat", {
+                        "elapsed_seconds": round(time.monotonic() - started, 3)
+                    })
+                    continue
+
+                if event == "done":
+                    yield _sse_event("summary", {
+                        "status": data["status"],
+                        **counts,
+                        "elapsed_seconds": round(time.monotonic() - started, 3),
+                        "llm": data["llm"],
+                    })
+                    return
+                if event == "result":
+                    counts["coded_segments"] += 1
+                elif event == "error" and data.get("segment_id") is not None:
+                    counts["failed_segments"] += 1
+                yield _sse_event(event, data)
+        finally:
+            # Client went away or the generator was closed early
+            cancelled.set()
@@ -1,11 +1,14 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
+import datetime
 
 from app.models.quote import Quote
-from app.models.code import Code
+from app.models.code import Code, quote_codes
 from app.models.annotation import Annotation, AnnotationType
-from app.models.document_segment import DocumentSegment
+from app.models.document_segment import DocumentSegment, segment_codes
 from app.models.user import User
 from app.models.document import Document
 from app.services.quote_service import QuoteService
@@ -14,6 +17,16 @@ from app.services.annotation_service import AnnotationService
 from app.core.permissions import PermissionChecker
 
 
+def _code_key(name: str) -> str:
+    """Code names differing only in case or spacing refer to the same code"""
+    return " ".join(name.split()).lower()
+
+
+def _code_key_expression(name):
+    """SQL equivalent of `_code_key` over a name column"""
+    return func.lower(func.btrim(func.regexp_replace(name, r"\s+", " ", "g")))
+
+
 class SmartQuoteCodeAssignment(BaseModel):
     """Request model for smart quote + code assignment"""
     document_id: int
@@ -232,6 +245,184 @@ class CodeAssignmentService:
             "message": f"Successfully assigned code '{code.name}' to quote '{quote.text[:50]}...' and its segment"
         }
 
+    @staticmethod
+    def bulk_quote_code_assignment(
+        db: Session,
+        document_id: int,
+        requests: List[SmartQuoteCodeAssignment],
+        user_id: int,
+        is_auto_generated: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Set-based quote + code assignment for many selections in one document:
+        1. Check access once and load all target segments
+        2. Match existing quotes and codes with one query each
+        3. Insert missing codes and quotes, then link them with upserts
+        4. Commit once
+
+        Returns one result per request, in order. Requests that fail
+        validation get assignment_status "failed" and are not written.
+        """
+
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise ValueError("User not found")
+
+        document = PermissionChecker.check_document_access(
+            db, document_id, user, raise_exception=False
+        )
+        if not document:
+            raise ValueError("Document not found or access denied")
+
+        segment_ids = {request.segment_id for request in requests}
+        segments = {
+            segment_id: content for segment_id, content in db.query(
+                DocumentSegment.id, DocumentSegment.content
+            ).filter(
+                DocumentSegment.id.in_(segment_ids),
+                DocumentSegment.document_id == document_id
+            ).all()
+        }
+
+        # Validate selections against segment content
+        errors: Dict[int, str] = {}
+        for index, request in enumerate(requests):
+            content = segments.get(request.segment_id)
+            if request.document_id != document_id or content is None:
+                errors[index] = "Document segment not found"
+            elif not (0 <= request.start_char < request.end_char <= len(content)):
+                errors[index] = "Invalid quote position range"
+            elif content[request.start_char:request.end_char].strip() != request.text.strip():
+                errors[index] = "Provided text does not match segment content at specified positions"
+            elif not request.code_name.strip():
+                errors[index] = "Code name is required"
+        valid = [index for index in range(len(requests)) if index not in errors]
+
+        # Existing quotes with the exact same range and text
+        quotes_by_range: Dict[tuple, Quote] = {}
+        if valid:
+            for quote in db.query(Quote).filter(
+                Quote.segment_id.in_({requests[i].segment_id for i in valid})
+            ).all():
+                quotes_by_range.setdefault(
+                    (quote.segment_id, quote.start_char, quote.end_char, quote.text.strip()), quote)
+
+        # Existing codes by normalised name
+        code_names = {_code_key(requests[i].code_name) for i in valid}
+        codes_by_name: Dict[str, Code] = {}
+        if code_names:
+            for code in db.query(Code).filter(
+                Code.project_id == document.project_id,
+                _code_key_expression(Code.name).in_(code_names)
+            ).order_by(Code.id).all():
+                codes_by_name.setdefault(_code_key(code.name), code)
+        existing_code_names = set(codes_by_name.keys())
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        new_codes: List[Code] = []
+        for index in valid:
+            request = requests[index]
+            if _code_key(request.code_name) not in codes_by_name:
+                code = Code(
+                    name=request.code_name,
+                    description=request.code_description or f"Auto-created code: {request.code_name}",
+                    color=request.code_color,
+                    project_id=document.project_id,
+                    created_by_id=user_id,
+                    is_auto_generated=is_auto_generated,
+                    created_at=now,
+                    updated_at=now,
+                )
+                codes_by_name[_code_key(request.code_name)] = code
+                new_codes.append(code)
+
+        new_quote_keys = set()
+        for index in valid:
+            request = requests[index]
+            key = (request.segment_id, request.start_char, request.end_char, request.text.strip())
+            if key not in quotes_by_range:
+                quotes_by_range[key] = Quote(
+                    text=request.text,
+                    start_char=request.start_char,
+                    end_char=request.end_char,
+                    segment_id=request.segment_id,
+                    document_id=document_id,
+                    created_by_id=user_id,
+                    created_at=now,
+                    updated_at=now,
+                )
+                new_quote_keys.add(key)
+
+        db.add_all(new_codes)
+        db.add_all([quotes_by_range[key] for key in new_quote_keys])
+        db.flush()
+
+        quote_links = set()
+        segment_links = set()
+        for index in valid:
+            request = requests[index]
+            quote = quotes_by_range[
+                (request.segment_id, request.start_char, request.end_char, request.text.strip())]
+            code = codes_by_name[_code_key(request.code_name)]
+            quote_links.add((quote.id, code.id))
+            segment_links.add((request.segment_id, code.id))
+
+        if quote_links:
+            db.execute(pg_insert(quote_codes).values(
+                [{"quote_id": q, "code_id": c} for q, c in quote_links]
+            ).on_conflict_do_nothing())
+        if segment_links:
+            db.execute(pg_insert(segment_codes).values(
+                [{"segment_id": s, "code_id": c} for s, c in segment_links]
+            ).on_conflict_do_nothing())
+
+        # Build results before committing so expired objects are not reloaded one by one
+        results: List[Dict[str, Any]] = []
+        for index, request in enumerate(requests):
+            if index in errors:
+                results.append({
+                    "quote": None,
+                    "code": None,
+                    "segment": {"id": request.segment_id, "linked_to_code": False},
+                    "assignment_status": "failed",
+                    "message": errors[index]
+                })
+                continue
+            key = (request.segment_id, request.start_char, request.end_char, request.text.strip())
+            quote = quotes_by_range[key]
+            code = codes_by_name[_code_key(request.code_name)]
+            results.append({
+                "quote": {
+                    "id": quote.id,
+                    "text": quote.text,
+                    "start_char": quote.start_char,
+                    "end_char": quote.end_char,
+                    "segment_id": quote.segment_id,
+                    "document_id": quote.document_id,
+                    "created_at": quote.created_at,
+                    "was_existing": key not in new_quote_keys
+                },
+                "code": {
+                    "id": code.id,
+                    "name": code.name,
+                    "description": code.description,
+                    "color": code.color,
+                    "project_id": code.project_id,
+                    "created_at": code.created_at,
+                    "is_auto_generated": is_auto_generated,
+                    "was_existing": _code_key(code.name) in existing_code_names
+                },
+                "segment": {
+                    "id": request.segment_id,
+                    "linked_to_code": True
+                },
+                "assignment_status": "success",
+                "message": f"Successfully assigned code '{code.name}' to quote '{quote.text[:50]}...' and its segment"
+            })
+
+        db.commit()
+        return results
+
     @staticmethod
     def smart_segment_code_assignment(
         db: Session,
@@ -5,14 +5,17 @@ This module provides comprehensive document management services including:
 - Document upload and file processing
 - Document retrieval and search functionality
 - Document management and analytics
+- Near-duplicate clustering of segments for AI coding
 """
 
 from .upload import DocumentUploadService
 from .retrieval import DocumentRetrievalService
 from .management import DocumentManagementService
+from .near_duplicates import NearDuplicateService
 
 __all__ = [
     'DocumentUploadService',
     'DocumentRetrievalService',
-    'DocumentManagementService'
+    'DocumentManagementService',
+    'NearDuplicateService'
 ]
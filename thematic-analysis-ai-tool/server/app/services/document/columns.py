@@ -0,0 +1,68 @@
+"""
+Column selection for AI coding of tabular (CSV/Excel) documents
+"""
+from typing import Any, Dict, List, Optional
+import math
+
+from sqlalchemy import case, func, literal
+
+from app.models.document_segment import DocumentSegment
+
+# Key in Document.file_metadata holding the columns sent to the LLM
+CODING_COLUMNS_KEY = "coding_columns"
+
+
+def get_coding_columns(file_metadata: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Columns selected for AI coding, or None to send whole rows"""
+    columns = (file_metadata or {}).get(CODING_COLUMNS_KEY)
+    return list(columns) if columns else None
+
+
+def render_columns(additional_data: Optional[Dict[str, Any]], columns: List[str]) -> str:
+    """
+    "col: value | col: value" text of the selected columns of one row.
+
+    Empty cells are left out, so a row with none of the columns filled in
+    renders as an empty string. The "Row N:" label is omitted as well:
+    identical answers in different rows then share one LLM call.
+    """
+    values = []
+    for column in columns:
+        value = (additional_data or {}).get(column)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        text = str(value).strip()
+        if text:
+            values.append(f"{column}: {text}")
+    return " | ".join(values)
+
+
+def coding_text(segment, columns: Optional[List[str]]) -> str:
+    """Text of a segment as sent to the LLM"""
+    if not columns or segment.additional_data is None:
+        return segment.content
+    return render_columns(segment.additional_data, columns)
+
+
+def coding_text_expression(columns: List[str], data=DocumentSegment.additional_data):
+    """
+    SQL equivalent of `render_columns` over a JSON column of row data.
+
+    Values are rendered as Python's str() does: JSON booleans become
+    "True"/"False", and surrounding whitespace of any kind is stripped.
+    """
+    # concat_ws skips NULLs, and "col: " || NULL is NULL, so empty cells drop out
+    return func.concat_ws(" | ", *[
+        literal(f"{column}: ") + func.nullif(
+            func.regexp_replace(_python_text(data[column]), r"^\s+|\s+$", "", "g"), "")
+        for column in columns
+    ])
+
+
+def _python_text(value):
+    """str() of a JSON value as render_columns computes it, or NULL for a JSON null"""
+    return case(
+        (func.json_typeof(value) == "boolean",
+         case((value.as_string() == "true", "True"), else_="False")),
+        else_=value.as_string()
+    )
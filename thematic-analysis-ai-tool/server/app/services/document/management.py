@@ -1,10 +1,14 @@
 from sqlalchemy.orm import Session
-from typing import Dict, Any, Optional
-import cloudinary
+from sqlalchemy import func
+from typing import Dict, Any, List, Optional
 
 from app.core.permissions import PermissionChecker
-from app.models.document import Document
+from app.core.config import settings
+from app.models.document import Document, StorageStatus
+from app.models.document_segment import DocumentSegment
 from app.models.user import User
+from app.services.storage import StorageUploadService, get_storage
+from .columns import CODING_COLUMNS_KEY
 
 
 class DocumentManagementService:
@@ -12,7 +16,7 @@ class DocumentManagementService:
 
     @staticmethod
     def delete_document(db: Session, document_id: int, user_id: int) -> bool:
-        """Delete a document and its Cloudinary file"""
+        """Delete a document and its stored file"""
 
         # Get user object
         user = db.query(User).filter(User.id == user_id).first()
@@ -26,15 +30,20 @@ class DocumentManagementService:
         if not document:
             return False
 
-        # Delete from Cloudinary
-        if document.cloudinary_public_id:
+        # Delete the stored file, unless a deduplicated copy of the document still uses it
+        shared = db.query(Document.id).filter(
+            Document.cloudinary_public_id == document.cloudinary_public_id,
+            Document.storage_backend == document.storage_backend,
+            Document.id != document.id
+        ).first() is not None
+        if document.cloudinary_public_id and not shared:
             try:
-                cloudinary.uploader.destroy(
-                    document.cloudinary_public_id,
-                    resource_type="raw"
-                )
+                if document.storage_status == StorageStatus.STORED:
+                    get_storage(document.storage_backend).delete(document.cloudinary_public_id)
+                else:
+                    StorageUploadService.discard_staged(document.cloudinary_public_id)
             except Exception as e:
-                print(f"Failed to delete from Cloudinary: {e}")
+                print(f"Failed to delete stored file: {e}")
 
         # Delete from database
         db.delete(document)
@@ -77,15 +86,63 @@ class DocumentManagementService:
 
         return stats
 
+    @staticmethod
+    def get_duplicate_report(db: Session, project_id: int) -> Dict[str, Any]:
+        """
+        Documents of a project uploaded more than once (same file content),
+        grouped by file hash, with the file bytes and segment rows of the
+        extra copies. The first document of each group is the original.
+        """
+        duplicate_hashes = db.query(Document.file_hash).filter(
+            Document.project_id == project_id,
+            Document.file_hash.isnot(None)
+        ).group_by(Document.file_hash).having(func.count(Document.id) > 1).subquery()
+
+        rows = db.query(
+            Document.id, Document.name, Document.file_hash, Document.file_size, Document.created_at,
+            func.count(DocumentSegment.id)
+        ).outerjoin(DocumentSegment, DocumentSegment.document_id == Document.id).filter(
+            Document.project_id == project_id,
+            Document.file_hash.in_(db.query(duplicate_hashes.c.file_hash))
+        ).group_by(Document.id).order_by(Document.file_hash, Document.id).all()
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        for document_id, name, file_hash, file_size, created_at, segments in rows:
+            group = groups.setdefault(file_hash, {
+                "file_hash": file_hash, "file_size": file_size,
+                "original_id": document_id, "documents": [],
+            })
+            group["documents"].append({
+                "id": document_id, "name": name, "segments": segments, "created_at": created_at,
+            })
+
+        duplicate_groups = list(groups.values())
+        copies = [document for group in duplicate_groups for document in group["documents"][1:]]
+        return {
+            "project_id": project_id,
+            "dedupe_policy": settings.DOCUMENT_DEDUPE_POLICY,
+            "duplicate_groups": duplicate_groups,
+            "duplicate_documents": len(copies),
+            "redundant_bytes": sum((group["file_size"] or 0) * (len(group["documents"]) - 1)
+                                   for group in duplicate_groups),
+            "redundant_segments": sum(document["segments"] for document in copies),
+        }
+
     @staticmethod
     def update_document(
         db: Session,
         document_id: int,
         user_id: int,
         name: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        coding_columns: Optional[List[str]] = None
     ) -> Document:
-        """Update a document's metadata"""
+        """
+        Update a document's metadata.
+
+        `coding_columns` selects the columns of a CSV/Excel document sent to
+        the LLM during AI coding; an empty list sends whole rows again.
+        """
 
         # Get user object
         user = db.query(User).filter(User.id == user_id).first()
@@ -104,6 +161,22 @@ class DocumentManagementService:
             document.name = name
         if description is not None:
             document.description = description
+        if coding_columns is not None:
+            metadata = dict(document.file_metadata or {})
+            available = [str(column) for column in metadata.get("columns") or []]
+            if not available:
+                raise ValueError("Column selection is only supported for CSV and Excel documents")
+            unknown = [column for column in coding_columns if column not in available]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+            if coding_columns:
+                # Keep the file's column order, whatever order they were picked in
+                metadata[CODING_COLUMNS_KEY] = [
+                    column for column in available if column in coding_columns]
+            else:
+                metadata.pop(CODING_COLUMNS_KEY, None)
+            # Reassign: in-place changes to a JSON column are not tracked
+            document.file_metadata = metadata
 
         db.commit()
         db.refresh(document)
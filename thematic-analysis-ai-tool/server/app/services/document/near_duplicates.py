@@ -0,0 +1,298 @@
+"""
+Near-duplicate detection of document segments with MinHash and LSH
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import re
+import zlib
+import numpy as np
+
+from app.core.config import settings
+from app.models.document import Document
+from app.models.document_segment import DocumentSegment
+from app.models.segment_minhash import SegmentMinHash, SegmentLSHBand
+
+# Mersenne prime 2**31 - 1: (a * x + b) stays below 2**63 for 31-bit a, b and x
+_PRIME = np.uint64((1 << 31) - 1)
+_ROW_LABEL = re.compile(r"^\s*row\s+\d+\s*:\s*")
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+# Rows per lookup or insert statement, to keep IN lists and VALUES small
+_LOOKUP_BATCH_SIZE = 5000
+
+
+@lru_cache(maxsize=4)
+def _permutations(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed seed: signatures must be comparable across processes and restarts
+    rng = np.random.default_rng(1)
+    a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingles(text: str, size: int) -> set[str]:
+    """
+    Word shingles of normalised text.
+
+    Case, punctuation and the "Row N:" label of spreadsheet rows are
+    ignored, so "N/A" answers in different rows look identical. Numbers are
+    words: rows that differ only in a numeric answer are not duplicates.
+    Texts shorter than `size` words yield a single shingle of all their words.
+    """
+    words = _TOKEN.findall(_ROW_LABEL.sub("", text.lower()))
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text: str, num_perm: int, shingle_size: int) -> Optional[List[int]]:
+    """MinHash signature of `text`, or None if it has no words"""
+    grams = shingles(text, shingle_size)
+    if not grams:
+        return None
+    a, b = _permutations(num_perm)
+    hashes = np.fromiter(
+        (zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams)
+    ) % _PRIME
+    # (num_perm, n_shingles) matrix of permuted hashes; minimum over shingles
+    permuted = (np.outer(a, hashes) + b[:, None]) % _PRIME
+    return permuted.min(axis=1).tolist()
+
+
+def band_hashes(signature: List[int], bands: int) -> List[int]:
+    """Signed 64-bit hash of each LSH band of a signature"""
+    rows = len(signature) // bands
+    return [
+        int.from_bytes(hashlib.blake2b(
+            np.asarray(signature[band * rows:(band + 1) * rows], dtype=np.uint64).tobytes(),
+            digest_size=8
+        ).digest(), "big", signed=True)
+        for band in range(bands)
+    ]
+
+
+def estimated_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity: share of equal MinHash values"""
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
+
+
+class NearDuplicateService:
+    """Service that clusters near-duplicate segments within a project"""
+
+    @staticmethod
+    def index_document_segments(db: Session, project_id: int, document_id: int) -> int:
+        """
+        Compute MinHash signatures and LSH bands for a document's segments and
+        assign each to a near-duplicate cluster.
+
+        A segment joins the cluster of the first representative in the
+        project whose estimated similarity reaches NEAR_DUPLICATE_THRESHOLD;
+        otherwise it becomes the representative of a new cluster. Only
+        representatives are stored in the LSH index, so large clusters of
+        "N/A" answers cost one comparison per segment. Returns the number of
+        segments that joined an existing cluster.
+
+        Segments are indexed SEGMENT_WRITE_BATCH_SIZE at a time; the index rows
+        of earlier batches are visible to later ones within the transaction.
+        """
+        if not settings.NEAR_DUPLICATE_ENABLED:
+            return 0
+
+        joined = 0
+        last_id = 0
+        while True:
+            segments = db.query(DocumentSegment.id, DocumentSegment.content).filter(
+                DocumentSegment.document_id == document_id,
+                DocumentSegment.id > last_id
+            ).order_by(DocumentSegment.id).limit(settings.SEGMENT_WRITE_BATCH_SIZE).all()
+            if not segments:
+                break
+            joined += NearDuplicateService._index_segments(db, project_id, segments)
+            last_id = segments[-1][0]
+        db.commit()
+        return joined
+
+    @staticmethod
+    def _index_segments(db: Session, project_id: int, segments: list) -> int:
+        """Cluster and index (id, content) pairs of one batch, without committing"""
+        num_perm = settings.MINHASH_NUM_PERM
+        bands = settings.MINHASH_BANDS
+        threshold = settings.NEAR_DUPLICATE_THRESHOLD
+
+        signatures: Dict[int, List[int]] = {}
+        segment_bands: Dict[int, List[int]] = {}
+        # Signatures memoised by content: exact duplicates are hashed once
+        by_content: Dict[str, Optional[List[int]]] = {}
+        for segment_id, content in segments:
+            if content not in by_content:
+                by_content[content] = minhash_signature(
+                    content, num_perm, settings.MINHASH_SHINGLE_SIZE)
+            signature = by_content[content]
+            if signature is not None:
+                signatures[segment_id] = signature
+                segment_bands[segment_id] = band_hashes(signature, bands)
+        if not signatures:
+            return 0
+
+        # Existing representatives of the project sharing at least one band. Each band is
+        # looked up by (project_id, band_index, band_hash), the prefix of the lookup index
+        wanted = sorted({(band, value) for values in segment_bands.values()
+                         for band, value in enumerate(values)})
+        bucket: Dict[Tuple[int, int], List[int]] = {}
+        for start in range(0, len(wanted), _LOOKUP_BATCH_SIZE):
+            by_band: Dict[int, List[int]] = {}
+            for band, value in wanted[start:start + _LOOKUP_BATCH_SIZE]:
+                by_band.setdefault(band, []).append(value)
+            rows = db.query(
+                SegmentLSHBand.band_index, SegmentLSHBand.band_hash, SegmentLSHBand.segment_id
+            ).filter(
+                SegmentLSHBand.project_id == project_id,
+                or_(*[
+                    and_(SegmentLSHBand.band_index == band, SegmentLSHBand.band_hash.in_(values))
+                    for band, values in by_band.items()
+                ])
+            ).all()
+            for band, value, segment_id in rows:
+                bucket.setdefault((band, value), []).append(segment_id)
+
+        existing_ids = sorted({segment_id for ids in bucket.values() for segment_id in ids})
+        known: Dict[int, Tuple[List[int], int]] = {}
+        for start in range(0, len(existing_ids), _LOOKUP_BATCH_SIZE):
+            for segment_id, signature, cluster_id in db.query(
+                SegmentMinHash.segment_id, SegmentMinHash.signature, SegmentMinHash.cluster_id
+            ).filter(SegmentMinHash.segment_id.in_(existing_ids[start:start + _LOOKUP_BATCH_SIZE])):
+                known[segment_id] = (signature, cluster_id)
+
+        clusters: Dict[int, int] = {}
+        joined = 0
+        for segment_id, signature in signatures.items():
+            candidates = sorted({
+                candidate
+                for band, value in enumerate(segment_bands[segment_id])
+                for candidate in bucket.get((band, value), [])
+            })
+            cluster_id = segment_id
+            for candidate in candidates:
+                candidate_signature, candidate_cluster = known[candidate]
+                if estimated_similarity(signature, candidate_signature) >= threshold:
+                    cluster_id = candidate_cluster
+                    joined += 1
+                    break
+            clusters[segment_id] = cluster_id
+            if cluster_id == segment_id:
+                # New representative; later segments of this document can match it
+                known[segment_id] = (signature, cluster_id)
+                for band, value in enumerate(segment_bands[segment_id]):
+                    bucket.setdefault((band, value), []).append(segment_id)
+
+        minhash_rows = [
+            {"segment_id": segment_id, "project_id": project_id,
+             "signature": signatures[segment_id], "cluster_id": clusters[segment_id]}
+            for segment_id in signatures
+        ]
+        band_rows = [
+            {"segment_id": segment_id, "band_index": band,
+             "project_id": project_id, "band_hash": value}
+            for segment_id, values in segment_bands.items()
+            if clusters[segment_id] == segment_id
+            for band, value in enumerate(values)
+        ]
+        for start in range(0, len(minhash_rows), _LOOKUP_BATCH_SIZE):
+            stmt = pg_insert(SegmentMinHash.__table__).values(
+                minhash_rows[start:start + _LOOKUP_BATCH_SIZE])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["segment_id"],
+                set_={"signature": stmt.excluded.signature, "cluster_id": stmt.excluded.cluster_id}
+            ))
+        for start in range(0, len(band_rows), _LOOKUP_BATCH_SIZE):
+            db.execute(pg_insert(SegmentLSHBand.__table__).values(
+                band_rows[start:start + _LOOKUP_BATCH_SIZE]).on_conflict_do_nothing())
+        return joined
+
+    @staticmethod
+    def reindex_segment(db: Session, segment_id: int, content: str) -> None:
+        """
+        Re-cluster a segment whose content changed, without committing.
+
+        Its old signature and bands are dropped and it is indexed again with
+        `content`. If it represented a cluster, the other members are
+        re-clustered too, as they were matched against its old text.
+        """
+        indexed = db.query(SegmentMinHash.project_id, SegmentMinHash.cluster_id).filter(
+            SegmentMinHash.segment_id == segment_id).first()
+        members = []
+        if indexed is not None and indexed.cluster_id == segment_id:
+            members = db.query(DocumentSegment.id, DocumentSegment.content).join(
+                SegmentMinHash, SegmentMinHash.segment_id == DocumentSegment.id
+            ).filter(
+                SegmentMinHash.cluster_id == segment_id,
+                DocumentSegment.id != segment_id
+            ).order_by(DocumentSegment.id).all()
+            db.query(SegmentMinHash).filter(
+                SegmentMinHash.cluster_id == segment_id
+            ).delete(synchronize_session=False)
+        db.query(SegmentLSHBand).filter(
+            SegmentLSHBand.segment_id == segment_id).delete(synchronize_session=False)
+        db.query(SegmentMinHash).filter(
+            SegmentMinHash.segment_id == segment_id).delete(synchronize_session=False)
+        if not settings.NEAR_DUPLICATE_ENABLED:
+            return
+
+        project_id = indexed.project_id if indexed is not None else db.query(
+            Document.project_id
+        ).join(DocumentSegment, DocumentSegment.document_id == Document.id).filter(
+            DocumentSegment.id == segment_id
+        ).scalar()
+        for start in range(0, len(members), settings.SEGMENT_WRITE_BATCH_SIZE):
+            NearDuplicateService._index_segments(
+                db, project_id, members[start:start + settings.SEGMENT_WRITE_BATCH_SIZE])
+        NearDuplicateService._index_segments(db, project_id, [(segment_id, content)])
+
+    @staticmethod
+    def get_representatives(db: Session, segments: list) -> Dict[int, DocumentSegment]:
+        """
+        Map each segment id to the representative segment of its cluster.
+
+        Segments that were never indexed, or whose representative has been
+        deleted, represent themselves.
+        """
+        if not segments:
+            return {}
+        by_id = {seg.id: seg for seg in segments}
+        cluster_ids = dict(db.query(SegmentMinHash.segment_id, SegmentMinHash.cluster_id).filter(
+            SegmentMinHash.segment_id.in_(list(by_id))
+        ).all())
+        missing = {cluster_id for cluster_id in cluster_ids.values() if cluster_id not in by_id}
+        if missing:
+            by_id.update({
+                seg.id: seg for seg in db.query(DocumentSegment).filter(
+                    DocumentSegment.id.in_(missing)).all()
+            })
+        return {seg.id: by_id.get(cluster_ids.get(seg.id, seg.id), seg) for seg in segments}
+
+    @staticmethod
+    def get_project_stats(db: Session, project_id: int) -> dict:
+        """Number of indexed segments and near-duplicate clusters in a project"""
+        indexed, clusters = db.query(
+            func.count(SegmentMinHash.segment_id),
+            func.count(func.distinct(SegmentMinHash.cluster_id))
+        ).filter(SegmentMinHash.project_id == project_id).one()
+        largest = db.query(
+            SegmentMinHash.cluster_id, func.count(SegmentMinHash.segment_id).label("size")
+        ).filter(
+            SegmentMinHash.project_id == project_id
+        ).group_by(SegmentMinHash.cluster_id).having(
+            func.count(SegmentMinHash.segment_id) > 1
+        ).order_by(func.count(SegmentMinHash.segment_id).desc()).limit(10).all()
+        return {
+            "indexed_segments": indexed,
+            "clusters": clusters,
+            "duplicate_segments": indexed - clusters,
+            "largest_clusters": [
+                {"representative_segment_id": cluster_id, "size": size}
+                for cluster_id, size in largest
+            ],
+        }
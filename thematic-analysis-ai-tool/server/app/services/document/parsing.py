@@ -0,0 +1,133 @@
+"""
+Out-of-process parsing of uploaded documents
+
+PDF, DOCX and CSV parsing is CPU-bound and holds the GIL, so concurrent
+uploads would share one core. With DOCUMENT_PARSE_WORKERS > 0 the
+extractors run in a pool of worker processes instead. A worker writes the
+segments it extracts to a temporary spool file as pickled batches of
+tuples and returns only the spool's path with the extraction info; the
+API process reads the batches back while writing segments, so neither
+side holds a whole file's segments in memory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+import itertools
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from app.core.config import settings
+from app.models.document import DocumentType
+
+# Segment fields in the order they are spooled
+_FIELDS = (
+    "type", "content", "line_number", "page_number", "paragraph_index", "row_index",
+    "character_start", "character_end", "additional_data",
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the API process runs job worker threads and holds DB connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.DOCUMENT_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_parse_pool() -> None:
+    """Stop the worker processes, if they were started"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_to_spool(
+    path: str, document_type: DocumentType, filename: str, batch_size: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Worker: extract a file's segments into a spool file; returns its path and the extraction info"""
+    # Imported here: the upload service submits work to this module
+    from .upload import DocumentUploadService
+
+    extraction: Dict[str, Any] = {}
+    with open(path, "rb") as file, tempfile.NamedTemporaryFile(
+        suffix=".segments", delete=False
+    ) as spool:
+        try:
+            rows = (
+                tuple(segment.get(field) for field in _FIELDS)
+                for segment in DocumentUploadService._extract_segments(
+                    file, document_type, filename, extraction)
+            )
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+    return spool.name, extraction
+
+
+def _read_spool(path: str) -> Iterator[Dict[str, Any]]:
+    """Segments of a spool file, which is deleted once read"""
+    try:
+        with open(path, "rb") as spool:
+            while True:
+                try:
+                    batch = pickle.load(spool)
+                except EOFError:
+                    break
+                for values in batch:
+                    yield dict(zip(_FIELDS, values))
+    finally:
+        os.unlink(path)
+
+
+def parse_in_pool(
+    file: BinaryIO, document_type: DocumentType, filename: str, extraction: Dict[str, Any]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Extract a file's segments in the parse pool, blocking until it is parsed.
+
+    Takes the same arguments as DocumentUploadService._extract_segments and
+    fills `extraction` the same way; extraction errors are raised here.
+    """
+    # Workers read from a path: the upload may be a spooled in-memory file
+    with tempfile.NamedTemporaryFile(suffix=".upload", delete=False) as copy:
+        shutil.copyfileobj(file, copy)
+    pool = _get_pool()
+    try:
+        spool_path, info = pool.submit(
+            _parse_to_spool, copy.name, document_type, filename,
+            settings.SEGMENT_WRITE_BATCH_SIZE
+        ).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a new pool for the next upload
+        _discard_pool(pool)
+        raise
+    finally:
+        os.unlink(copy.name)
+    extraction.update(info)
+    return _read_spool(spool_path)
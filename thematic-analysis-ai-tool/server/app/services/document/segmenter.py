@@ -0,0 +1,125 @@
+"""
+Segmentation of extracted document text into line, sentence and row segments.
+
+Every strategy walks its input once and keeps a running character offset,
+so segmenting is linear in the size of the document. Segments are yielded
+as the dicts `DocumentUploadService` stores as DocumentSegment rows.
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Characters between rows in the text rendering of a spreadsheet ("\n\n")
+ROW_SEPARATOR_LENGTH = 2
+
+
+def segment_lines(text: str, **extra: Any) -> Iterator[Dict[str, Any]]:
+    """
+    One "line" segment per non-blank line of `text`.
+
+    Content is stripped; `character_start` is the offset of the raw line in
+    `text` and `character_end` is that plus the raw line's length. `extra`
+    fields (e.g. page_number) are added to every segment.
+    """
+    return segment_raw_lines(text.split("\n"), **extra)
+
+
+def segment_raw_lines(lines: Iterable[str], **extra: Any) -> Iterator[Dict[str, Any]]:
+    """
+    segment_lines of a text given as its lines, without their "\\n".
+
+    Lines are consumed lazily, so a file can be segmented as it is read.
+    """
+    offset = 0
+    for line_index, line in enumerate(lines):
+        line_content = line.strip()
+        if line_content:
+            yield {
+                "type": "line",
+                "content": line_content,
+                "line_number": line_index + 1,
+                "character_start": offset,
+                "character_end": offset + len(line),
+                **extra,
+            }
+        offset += len(line) + 1
+
+
+def segment_sentences(paragraphs: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    "sentence" segments of paragraphs, split on full stops.
+
+    Offsets refer to the paragraphs' stripped text joined with newlines.
+    Each sentence spans its text plus the full stop (or newline) after it.
+    """
+    content_length = 0
+    for paragraph_index, paragraph in enumerate(paragraphs):
+        para_text = paragraph.strip()
+        if not para_text:
+            continue
+        content_length += len(para_text) + 1
+        offset = content_length - len(para_text)
+        for sentence in para_text.split("."):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            start = offset
+            offset += len(sentence) + 1
+            yield {
+                "type": "sentence",
+                "content": sentence + ("." if not sentence.endswith(".") else ""),
+                "paragraph_index": paragraph_index,
+                "character_start": start,
+                "character_end": offset,
+            }
+
+
+def segment_rows(
+    rows: Iterable[Tuple[int, str, Optional[Dict[str, Any]]]]
+) -> Iterator[Dict[str, Any]]:
+    """
+    "row" segments of (row index, rendered row text, row data) triples.
+
+    Offsets refer to the non-empty row texts joined with blank lines; rows
+    with no text are skipped.
+    """
+    offset = 0
+    for row_index, row_text, additional_data in rows:
+        if not row_text:
+            continue
+        yield {
+            "type": "row",
+            "content": row_text,
+            "row_index": row_index,
+            "character_start": offset,
+            "character_end": offset + len(row_text),
+            "additional_data": additional_data,
+        }
+        offset += len(row_text) + ROW_SEPARATOR_LENGTH
+
+
+def table_rows(frame: pd.DataFrame, start: int = 0) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    """
+    (row index, rendered row text, row data) triples of a table for segment_rows.
+
+    A row renders as "Row N: col: value | ..." over its non-null cells, N
+    counting from `start` + 1, or as "" if it has none. Texts are built a
+    column at a time over the whole frame rather than row by row; missing
+    cells are None in the row data so it can be stored as JSON.
+    """
+    texts = np.full(len(frame), "", dtype=object)
+    for column in frame.columns:
+        values = frame[column]
+        present = values.notna().to_numpy()
+        if not present.any():
+            continue
+        cells = (f"{column}: " + values[present].astype(str)).to_numpy(dtype=object)
+        previous = texts[present]
+        texts[present] = np.where(previous == "", cells, previous + " | " + cells)
+
+    labelled = texts != ""
+    numbers = np.arange(start + 1, start + len(frame) + 1)[labelled].astype(str).astype(object)
+    texts[labelled] = "Row " + numbers + ": " + texts[labelled]
+
+    records = frame.astype(object).where(frame.notna(), None).to_dict("records")
+    return zip(range(start, start + len(frame)), texts.tolist(), records)
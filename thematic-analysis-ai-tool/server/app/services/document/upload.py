@@ -1,12 +1,18 @@
 """
 Document upload and file processing service
+
+Uploaded files are processed as a stream: extractors are generators that
+yield segments, which are written in batches of SEGMENT_WRITE_BATCH_SIZE
+rows, so memory stays flat however large the file is.
 """
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
-import cloudinary
-import cloudinary.uploader
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import SQLAlchemyError
+from typing import Optional, Dict, Any, BinaryIO, Iterable, Iterator, List, Union
+from contextlib import contextmanager
+import codecs
 import hashlib
-from sqlalchemy import inspect
+import itertools
 import PyPDF2
 import pandas as pd
 from docx import Document as DocxDocument
@@ -16,16 +22,56 @@ from app.schemas.document import DocumentUpload, DocumentContent
 from app.schemas.document_segment import DocumentSegmentOut
 from app.core.permissions import PermissionChecker
 from app.core.config import settings
-from app.models.document import Document, DocumentType
+from app.models.document import Document, DocumentType, StorageStatus
 from app.models.document_segment import DocumentSegment
 from app.models.user import User
-
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET
+from app.services.storage import StorageUploadService, staging_host, storage_upload_pool
+from .columns import CODING_COLUMNS_KEY
+from .near_duplicates import NearDuplicateService
+from .parsing import parse_in_pool
+from .segmenter import (
+    segment_lines, segment_raw_lines, segment_rows, segment_sentences, table_rows
 )
 
+# Bytes read at a time when hashing an uploaded file
+_HASH_CHUNK_SIZE = 1 << 20
+
+# Segmentation of each document type, for documents that were not just parsed
+_SEGMENTATION_TYPES = {
+    DocumentType.TEXT: "line",
+    DocumentType.PDF: "line_by_page",
+    DocumentType.DOCX: "sentence",
+    DocumentType.CSV: "csv_row",
+}
+
+
+class _CleanTextStream(io.TextIOBase):
+    """
+    UTF-8 text of a binary file without NUL characters, decoded as it is read.
+
+    With lstrip, leading whitespace of the text is dropped, like the
+    str.strip() that used to run on the whole decoded file.
+    """
+
+    def __init__(self, file: BinaryIO, lstrip: bool = False):
+        self._file = file
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._lstrip = lstrip
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        while True:
+            data = self._file.read(size if size is not None and size > 0 else -1)
+            text = self._decoder.decode(data.replace(b"\x00", b""), final=not data)
+            if self._lstrip:
+                text = text.lstrip()
+                self._lstrip = not text
+            # An empty string means end of file to readers, so keep going until there is text
+            if text or not data:
+                return text
+
 
 class DocumentUploadService:
 
@@ -37,10 +83,10 @@ class DocumentUploadService:
         document_type: DocumentType,
         project_id: int,
         uploaded_by_id: int,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO],
         filename: str
     ) -> DocumentUpload:
-        """Create a new document with file processing"""
+        """Create a new document with file processing; file_content is the bytes or a binary file"""
 
         # Get user object
         user = db.query(User).filter(User.id == uploaded_by_id).first()
@@ -54,161 +100,285 @@ class DocumentUploadService:
         if not project:
             raise ValueError("Project not found or access denied")
 
-        file_size = len(file_content)
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        file = io.BytesIO(file_content) if isinstance(file_content, (bytes, bytearray)) \
+            else file_content
+        file_size, file_hash = DocumentUploadService._hash_file(file)
+        if settings.DOCUMENT_DEDUPE_POLICY not in ("return", "clone"):
+            return DocumentUploadService._process_file(
+                db, name, description, document_type, project_id, uploaded_by_id,
+                file, file_size, file_hash, filename)
+
+        # Concurrent uploads of the same file wait here until the first one is processed
+        with DocumentUploadService._file_lock(db, project_id, file_hash):
+            # The same file was uploaded to the project before: skip the upload and parse
+            existing = DocumentUploadService.find_duplicate(
+                db, project_id, document_type, file_hash)
+            if existing is not None:
+                print(f"Upload of {filename} duplicates document {existing.id}")
+                if settings.DOCUMENT_DEDUPE_POLICY == "clone":
+                    return DocumentUploadService._clone_document(
+                        db, existing, name, description, uploaded_by_id)
+                return DocumentUploadService._upload_response(
+                    db, existing, upload_status="duplicate")
+            return DocumentUploadService._process_file(
+                db, name, description, document_type, project_id, uploaded_by_id,
+                file, file_size, file_hash, filename)
 
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file_content,
-            resource_type="raw",
-            public_id=f"documents/{project_id}/{file_hash}",
-            use_filename=True,
-            unique_filename=False
-        )
+    @staticmethod
+    @contextmanager
+    def _file_lock(db: Session, project_id: int, file_hash: str) -> Iterator[None]:
+        """
+        Postgres advisory lock on a file's content within a project, held
+        until the block exits. It is taken on its own connection, so it
+        outlives the commits made while the file is processed.
+        """
+        key = int.from_bytes(bytes.fromhex(file_hash)[:4], "big", signed=True)
+        with db.get_bind().connect() as connection:
+            connection.execute(select(func.pg_advisory_lock(project_id, key)))
+            try:
+                yield
+            finally:
+                connection.execute(select(func.pg_advisory_unlock(project_id, key)))
 
-        cloudinary_public_id = upload_result["public_id"]
-        cloudinary_url = upload_result["secure_url"]
-        # Extract segments and metadata based on file type and filename
-        segments_data, file_metadata = DocumentUploadService._extract_segments(
-            file_content, document_type, filename
-        )
+    @staticmethod
+    def _process_file(
+        db: Session,
+        name: str,
+        description: Optional[str],
+        document_type: DocumentType,
+        project_id: int,
+        uploaded_by_id: int,
+        file: BinaryIO,
+        file_size: int,
+        file_hash: str,
+        filename: str
+    ) -> DocumentUpload:
+        """Stage, record and parse a new document's file"""
+        # Kept on local disk until the storage backend has it
+        storage_key = f"documents/{project_id}/{file_hash}"
+        StorageUploadService.stage(file, storage_key)
 
-        # Create the document record
+        # Create the document record; its metadata is known once the file has been read
         document = Document(
             name=name,
             description=description,
             document_type=document_type,
             file_size=file_size,
             file_hash=file_hash,
-            cloudinary_public_id=cloudinary_public_id,
-            cloudinary_url=cloudinary_url,
-            file_metadata=file_metadata,
+            cloudinary_public_id=storage_key,
+            storage_backend=settings.STORAGE_BACKEND,
+            storage_status=StorageStatus.PENDING,
+            storage_staging_host=staging_host(),
+            file_metadata={},
             project_id=project_id,
             uploaded_by_id=uploaded_by_id
         )
         db.add(document)
         db.commit()
         db.refresh(document)
-
-        # Create DocumentSegment records from the extracted content
         print(f"Document created: {document.name} (ID: {document.id})")
-        if segments_data and "segments" in segments_data:
-            DocumentUploadService._create_document_segments(
-                db, document, segments_data["segments"])
-            print(f"Created {len(segments_data['segments'])} segments for document {document.id}")    
+        # Background workers store the file while the segments are extracted
+        storage_upload_pool.notify()
+
+        # Extract segments, in the parse pool if enabled, and write them as they are produced
+        extraction: Dict[str, Any] = {}
+        extract = parse_in_pool if settings.DOCUMENT_PARSE_WORKERS > 0 \
+            else DocumentUploadService._extract_segments
+        try:
+            total_segments = DocumentUploadService._create_document_segments(
+                db, document, extract(file, document_type, filename, extraction))
+        except SQLAlchemyError:
+            db.rollback()
+            raise
+        except Exception as e:
+            # Keep the document, but none of the segments of a partly read file
+            db.rollback()
+            print(f"Error extracting segments: {str(e)}")
+            extraction = {"metadata": {"error": str(e)}}
+            total_segments = 0
+
+        document.file_metadata = extraction.get("metadata", {})
+        db.commit()
+
+        if total_segments:
+            DocumentUploadService._index_near_duplicates(db, document)
+
+        if not storage_upload_pool.running:
+            # No background workers in this process (e.g. a script): store the file now
+            StorageUploadService.upload_now(db, document.id)
             db.refresh(document)
 
-        uploaded_doc = DocumentUpload(
+        return DocumentUploadService._upload_response(
+            db, document, total_segments,
+            segmentation_type=extraction.get("segmentation_type", "unknown"),
+            columns=extraction.get("columns", []))
+
+    @staticmethod
+    def find_duplicate(
+        db: Session, project_id: int, document_type: DocumentType, file_hash: str
+    ) -> Optional[Document]:
+        """The first document of the project with this file content that was parsed without error"""
+        candidates = db.query(Document).filter(
+            Document.project_id == project_id,
+            Document.file_hash == file_hash,
+            Document.document_type == document_type
+        ).order_by(Document.id)
+        for candidate in candidates:
+            if "error" not in (candidate.file_metadata or {}):
+                return candidate
+        return None
+
+    @staticmethod
+    def _clone_document(
+        db: Session,
+        source: Document,
+        name: str,
+        description: Optional[str],
+        uploaded_by_id: int
+    ) -> DocumentUpload:
+        """New document sharing the stored file of `source`, with copies of its segments"""
+        file_metadata = dict(source.file_metadata or {})
+        # The column selection is a choice made on the source document, not part of the file
+        file_metadata.pop(CODING_COLUMNS_KEY, None)
+        document = Document(
+            name=name,
+            description=description,
+            document_type=source.document_type,
+            file_size=source.file_size,
+            file_hash=source.file_hash,
+            cloudinary_public_id=source.cloudinary_public_id,
+            cloudinary_url=source.cloudinary_url,
+            storage_backend=source.storage_backend,
+            storage_status=source.storage_status,
+            storage_staging_host=source.storage_staging_host,
+            file_metadata=file_metadata,
+            project_id=source.project_id,
+            uploaded_by_id=uploaded_by_id
+        )
+        db.add(document)
+        db.commit()
+        db.refresh(document)
+
+        # Copy the segments in the database
+        segments = DocumentSegment.__table__
+        copied = [column.name for column in segments.c
+                  if column.name not in ("id", "document_id", "created_at", "updated_at")]
+        db.execute(insert(segments).from_select(
+            ["document_id", "created_at", "updated_at", *copied],
+            select(
+                literal(document.id), literal(document.created_at), literal(document.updated_at),
+                *(segments.c[column] for column in copied)
+            ).where(segments.c.document_id == source.id).order_by(segments.c.id)
+        ))
+        db.commit()
+        total_segments = db.query(func.count(DocumentSegment.id)).filter(
+            DocumentSegment.document_id == document.id).scalar()
+        print(f"Cloned {total_segments} segments of document {source.id} to document {document.id}")
+
+        if total_segments:
+            DocumentUploadService._index_near_duplicates(db, document)
+        return DocumentUploadService._upload_response(
+            db, document, total_segments, upload_status="cloned")
+
+    @staticmethod
+    def _index_near_duplicates(db: Session, document: Document) -> None:
+        try:
+            duplicates = NearDuplicateService.index_document_segments(
+                db, document.project_id, document.id)
+            print(f"Found {duplicates} near-duplicate segments in document {document.id}")
+        except Exception as e:
+            # Clustering only saves LLM calls; never fail the upload over it
+            db.rollback()
+            print(f"Error indexing near-duplicate segments: {str(e)}")
+        db.refresh(document)
+
+    @staticmethod
+    def _upload_response(
+        db: Session,
+        document: Document,
+        total_segments: Optional[int] = None,
+        segmentation_type: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+        upload_status: str = "success"
+    ) -> DocumentUpload:
+        """
+        Upload response for a document. Segment count, segmentation type and
+        columns default to those of its stored segments and metadata.
+        """
+        if total_segments is None:
+            total_segments = db.query(func.count(DocumentSegment.id)).filter(
+                DocumentSegment.document_id == document.id).scalar()
+        if segmentation_type is None:
+            segmentation_type = _SEGMENTATION_TYPES.get(document.document_type, "unknown")
+        if columns is None:
+            columns = (document.file_metadata or {}).get("columns", [])
+
+        # Only the first segments are returned; the rest are fetched page by page
+        segments = db.query(DocumentSegment).filter(
+            DocumentSegment.document_id == document.id
+        ).order_by(DocumentSegment.id).limit(settings.UPLOAD_RESPONSE_MAX_SEGMENTS).all()
+
+        return DocumentUpload(
             id=int(getattr(document, "id")),
             name=str(document.name),
-            cloudinary_url=str(document.cloudinary_url),
+            cloudinary_url=document.cloudinary_url,
+            storage_status=document.storage_status,
             content=DocumentContent(
-                segments=[DocumentSegmentOut.model_validate(
-                    seg) for seg in document.segments],
-                total_segments=len(document.segments),
-                segmentation_type=segments_data.get(
-                    "segmentation_type", "unknown"),
-                columns=segments_data.get("columns", [])
+                segments=[DocumentSegmentOut.model_validate(seg) for seg in segments],
+                total_segments=total_segments,
+                segmentation_type=segmentation_type,
+                columns=columns
             ),
             file_size=int(getattr(document, "file_size", 0)),
-            upload_status="success"
+            upload_status=upload_status
         )
-        return uploaded_doc
 
     @staticmethod
-    def _extract_segments(file_content: bytes, document_type: DocumentType, filename: str) -> tuple[Dict[str, Any], Dict[str, Any]]:
-        """Extract segments and metadata based on document type"""
-        try:
-            if document_type == DocumentType.TEXT:
-                segments_data, _ = DocumentUploadService._extract_text_content(
-                    file_content)
-                return segments_data, {}
-
-            elif document_type == DocumentType.PDF:
-                segments_data, _, file_metadata = DocumentUploadService._extract_pdf_content(
-                    file_content)
-                return segments_data, file_metadata
-
-            elif document_type == DocumentType.DOCX:
-                segments_data, _ = DocumentUploadService._extract_docx_content(
-                    file_content)
-                return segments_data, {}
-
-            elif document_type == DocumentType.CSV:
-                # Handle both CSV and Excel by converting spreadsheets to CSV text
-                ext = pathlib.Path(filename or "").suffix.lower()
-                if ext in (".xlsx", ".xls"):
-                    # Convert Excel to CSV bytes
-                    try:
-                        excel_buffer = io.BytesIO(file_content)
-                        df = pd.read_excel(excel_buffer)
-                        csv_bytes = df.to_csv(index=False).encode('utf-8')
-                    except Exception as e:
-                        return {"segments": [], "error": str(e)}, {"error": str(e)}
-                    segments_data, _, file_metadata = DocumentUploadService._extract_csv_content(
-                        csv_bytes)
-                else:
-                    segments_data, _, file_metadata = DocumentUploadService._extract_csv_content(
-                        file_content)
-                return segments_data, file_metadata
-
-            else:
-                return {"segments": [], "error": "unsupported_type"}, {"error": "Unsupported document type"}
-
-        except Exception as e:
-            print(f"Error extracting segments: {str(e)}")
-            return {"segments": [], "error": str(e)}, {"error": str(e)}
+    def _hash_file(file: BinaryIO) -> tuple[int, str]:
+        """Size and SHA-256 of a binary file, read in chunks; the file is rewound afterwards"""
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        file.seek(0)
+        return size, digest.hexdigest()
 
     @staticmethod
-    def _extract_excel_content(file_content: bytes) -> tuple[Dict[str, Any], str, Dict[str, Any]]:
-        """Extract content from Excel files with row-based segments for thematic analysis"""
-        try:
-            excel_file = io.BytesIO(file_content)
-            df = pd.read_excel(excel_file)
-
-            segments = []
-            content_lines = []
-            for row_index, (_, row) in enumerate(df.iterrows()):
-                # Build text for each row
-                values = [
-                    f"{col}: {row[col]}" for col in df.columns if pd.notna(row[col])]
-                if not values:
-                    continue
-                row_text = f"Row {row_index + 1}: " + " | ".join(values)
-                content_lines.append(row_text)
-                segments.append({
-                    "type": "row",
-                    "content": row_text,
-                    "row_index": row_index,
-                    "character_start": sum(len(line) + 2 for line in content_lines[:row_index]),
-                    "character_end": sum(len(line) + 2 for line in content_lines[:row_index]) + len(row_text),
-                    "additional_data": row.to_dict()
-                })
-
-            content = "\n\n".join(content_lines)
-            structured_content = {
-                "segments": segments,
-                "total_segments": len(segments),
-                "segmentation_type": "excel_row",
-                "columns": df.columns.tolist()
-            }
-            metadata = {
-                "row_count": len(df),
-                "column_count": len(df.columns),
-                "columns": df.columns.tolist(),
-                "processing_note": "Converted Excel to row-based segments"
-            }
-            return structured_content, content, metadata
-        except Exception as e:
-            print(f"Error processing Excel file: {str(e)}")
-            return {"segments": [], "error": str(e)}, "", {"error": str(e)}
+    def _extract_segments(
+        file: BinaryIO, document_type: DocumentType, filename: str, extraction: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the segments of a file based on document type.
+
+        `extraction` is filled in with segmentation_type, columns and the
+        file metadata; the metadata is complete once the segments are consumed.
+        """
+        if document_type == DocumentType.TEXT:
+            return DocumentUploadService._extract_text_content(file, extraction)
+
+        elif document_type == DocumentType.PDF:
+            return DocumentUploadService._extract_pdf_content(file, extraction)
+
+        elif document_type == DocumentType.DOCX:
+            return DocumentUploadService._extract_docx_content(file, extraction)
+
+        elif document_type == DocumentType.CSV:
+            ext = pathlib.Path(filename or "").suffix.lower()
+            if ext in (".xlsx", ".xls"):
+                return DocumentUploadService._extract_excel_content(file, extraction)
+            return DocumentUploadService._extract_csv_content(file, extraction)
+
+        raise ValueError("Unsupported document type")
 
     @staticmethod
-    def _create_document_segments(db: Session, document: Document, segments_data: list):
-        """Create DocumentSegment database records from extracted segment data using bulk insert"""
-        segment_dicts = []
-        for segment_data in segments_data:
-            segment_dict = {
+    def _create_document_segments(
+        db: Session, document: Document, segments: Iterable[Dict[str, Any]]
+    ) -> int:
+        """Write DocumentSegment records in batches as segments are produced; returns the count"""
+        total = 0
+        segment_dicts = (
+            {
                 "document_id": document.id,
                 "segment_type": segment_data.get("type", "text"),
                 "content": segment_data["content"],
@@ -222,188 +392,97 @@ class DocumentUploadService:
                 "created_at": document.created_at,
                 "updated_at": document.updated_at,
             }
-            segment_dicts.append(segment_dict)
-        # Bulk insert segments
-        db.bulk_insert_mappings(DocumentSegment.__mapper__, segment_dicts)
+            for segment_data in segments
+        )
+        while True:
+            batch = list(itertools.islice(segment_dicts, settings.SEGMENT_WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            # Bulk insert segments
+            db.bulk_insert_mappings(DocumentSegment.__mapper__, batch)
+            total += len(batch)
         db.commit()
-        print(f"Created {len(segments_data)} segments for document {document.id}")
+        print(f"Created {total} segments for document {document.id}")
+        return total
 
     @staticmethod
-    def _extract_text_content(file_content: bytes) -> tuple[Dict[str, Any], str]:
-        """Extract content from text files with structured segments for thematic analysis"""
-        try:
-            # Clean the file content by removing NUL characters
-            clean_content = file_content.replace(b'\x00', b'')
-
-            # Split into lines and create segments
-            text = clean_content.decode('utf-8', errors='replace')
-            lines = text.split('\n')
-            segments = []
-
-            for i, line in enumerate(lines):
-                line_content = line.strip()
-                if line_content:
-                    segments.append({
-                        "type": "line", 
-                        "content": line_content,
-                        "line_number": i + 1,
-                        "character_start": sum(len(l) + 1 for l in lines[:i]),
-                        "character_end": sum(len(l) + 1 for l in lines[:i]) + len(line)
-                    })
-
-            structured_content = {
-                "segments": segments,
-                "total_segments": len(segments),
-                "segmentation_type": "line"
-            }
-            return structured_content, text
-
-        except Exception as e:
-            print(f"Error processing text file: {str(e)}")
-            return {"segments": [], "error": str(e)}, f"[Error extracting text content: {str(e)}]"
+    def _extract_text_content(file: BinaryIO, extraction: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Extract line segments from text files for thematic analysis, one line at a time"""
+        extraction["segmentation_type"] = "line"
 
-    @staticmethod
-    def _extract_pdf_content(file_content: bytes) -> tuple[Dict[str, Any], str, Dict[str, Any]]:
-        """Extract content from PDF files with structured segments"""
-        try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-
-            content = ""
-            all_segments = []
-            segment_id = 1
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                content += f"\n--- Page {page_num + 1} ---\n"
-                content += page_text
-                content += "\n"
-
-                # Split page text into lines for segmentation
-                lines = page_text.split('\n')
-                for line_index, line in enumerate(lines):
-                    line_content = line.strip()
-                    if line_content:
-                        all_segments.append({
-                            "type": "line",
-                            "content": line_content,
-                            "page_number": page_num + 1,
-                            "line_number": line_index + 1,
-                            "character_start": sum(len(l) + 1 for l in lines[:line_index]),
-                            "character_end": sum(len(l) + 1 for l in lines[:line_index]) + len(line)
-                        })
-                        segment_id += 1
-
-            structured_content = {
-                "segments": all_segments,
-                "total_segments": len(all_segments),
-                "segmentation_type": "line_by_page"
-            }
-            metadata = {
-                "page_count": len(pdf_reader.pages),
-                "pdf_metadata": pdf_reader.metadata
-            }
+        def lines():
+            for raw_line in file:
+                # Remove NUL characters; no UTF-8 sequence contains a newline byte
+                line = raw_line.replace(b'\x00', b'').decode('utf-8', errors='replace')
+                yield line[:-1] if line.endswith("\n") else line
 
-            return structured_content, content, metadata
-        except Exception as e:
-            return {"segments": [], "error": str(e)}, f"[Error extracting PDF content: {str(e)}]", {"error": str(e)}
+        yield from segment_raw_lines(lines())
 
     @staticmethod
-    def _extract_docx_content(file_content: bytes) -> tuple[Dict[str, Any], str]:
-        """Extract content from DOCX files with structured segments"""
-        try:
-            doc_file = io.BytesIO(file_content)
-            doc = DocxDocument(doc_file)
-
-            content = ""
-            segments = []
-            segment_id = 1
-            for paragraph_index, paragraph in enumerate(doc.paragraphs):
-                para_text = paragraph.text.strip()
-                if para_text:
-                    content += para_text + "\n"
-
-                    # Split paragraphs into sentences for better granularity
-                    sentences = [s.strip()
-                                 for s in para_text.split('.') if s.strip()]
-                    for sentence_index, sentence in enumerate(sentences):
-                        if sentence:
-                            segments.append({
-                                "type": "sentence",
-                                "content": sentence + ("." if not sentence.endswith('.') else ""),
-                                "paragraph_index": paragraph_index,
-                                "character_start": len(content) - len(para_text) + sum(len(s) + 1 for s in sentences[:sentence_index]),
-                                "character_end": len(content) - len(para_text) + sum(len(s) + 1 for s in sentences[:sentence_index + 1])
-                            })
-                            segment_id += 1
-
-            structured_content = {
-                "segments": segments,
-                "total_segments": len(segments),
-                "segmentation_type": "sentence"
-            }
-            return structured_content, content
-        except Exception as e:
-            return {"segments": [], "error": str(e)}, f"[Error extracting DOCX content: {str(e)}]"
+    def _extract_pdf_content(file: BinaryIO, extraction: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Extract line segments from PDF files, one page at a time"""
+        pdf_reader = PyPDF2.PdfReader(file)
+        extraction["segmentation_type"] = "line_by_page"
+        extraction["metadata"] = {
+            "page_count": len(pdf_reader.pages),
+            # Plain strings: the info may be sent back from a parse worker
+            "pdf_metadata": {str(key): str(value) for key, value in (pdf_reader.metadata or {}).items()}
+        }
+        for page_num, page in enumerate(pdf_reader.pages):
+            # Line segments of the page; offsets are relative to the page text
+            yield from segment_lines(page.extract_text(), page_number=page_num + 1)
 
     @staticmethod
-    def _extract_csv_content(file_content: bytes) -> tuple[Dict[str, Any], str, Dict[str, Any]]:
-        """Extract content from CSV files with row-based segments for thematic analysis"""
-        try:
-            # Clean the file content by removing NUL characters
-            clean_content = file_content.replace(b'\x00', b'')
+    def _extract_docx_content(file: BinaryIO, extraction: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Extract sentence segments from DOCX files"""
+        doc = DocxDocument(file)
+        extraction["segmentation_type"] = "sentence"
 
-            # Decode with error handling and strip extra blank lines
-            csv_text = clean_content.decode('utf-8', errors='replace').strip()
-            csv_file = io.StringIO(csv_text)
-            # Parse CSV rows, skipping irregular rows
-            df = pd.read_csv(csv_file, on_bad_lines='skip',
-                             skip_blank_lines=True)
+        # Split paragraphs into sentences for better granularity
+        yield from segment_sentences(paragraph.text for paragraph in doc.paragraphs)
 
-            # Create segments for each row
-            segments = []
-            content_lines = []
+    @staticmethod
+    def _extract_excel_content(file: BinaryIO, extraction: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Extract row segments from Excel files by converting them to CSV.
+
+        Workbooks are read whole (they are zip archives, capped at about a
+        million rows); only the CSV pass over them is streamed.
+        """
+        df = pd.read_excel(file)
+        csv_file = io.BytesIO(df.to_csv(index=False).encode('utf-8'))
+        del df
+        yield from DocumentUploadService._extract_csv_content(csv_file, extraction)
 
-            for row_index, (_, row) in enumerate(df.iterrows()):
+    @staticmethod
+    def _extract_csv_content(file: BinaryIO, extraction: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Extract row segments from CSV files for thematic analysis, CSV_READ_CHUNK_ROWS rows at a time"""
+        # Parse CSV rows, skipping irregular rows; NUL characters and leading blank lines are dropped.
+        # Cells are kept as written: dtypes inferred per chunk would render 34 as "34.0" only in
+        # chunks where the column has a blank
+        reader = pd.read_csv(_CleanTextStream(file, lstrip=True), on_bad_lines='skip',
+                             skip_blank_lines=True, dtype=str,
+                             chunksize=settings.CSV_READ_CHUNK_ROWS)
+        extraction["segmentation_type"] = "csv_row"
+        extraction["columns"] = columns = []
+        row_count = 0
+
+        def rows():
+            nonlocal row_count
+            for chunk in reader:
+                if not columns:
+                    columns.extend(chunk.columns.tolist())
                 # Create a readable text entry for each row
-                row_text = f"Row {row_index + 1}: "
-                non_null_values = []
-
-                for col, value in row.items():
-                    if pd.notna(value):
-                        non_null_values.append(f"{col}: {str(value)}")
-
-                if non_null_values:
-                    row_text += " | ".join(non_null_values)
-                    content_lines.append(row_text)
-
-                    segments.append({
-                        "type": "row",
-                        "content": row_text,
-                        "row_index": row_index,
-                        # +2 for double line breaks
-                        "character_start": sum(len(line) + 2 for line in content_lines[:row_index]),
-                        "character_end": sum(len(line) + 2 for line in content_lines[:row_index]) + len(row_text),
-                        "additional_data": row.to_dict()
-                    })
-
-            # Join with double line breaks for readability
-            content = "\n\n".join(content_lines)
-
-            structured_content = {
-                "segments": segments,
-                "total_segments": len(segments),
-                "segmentation_type": "csv_row",
-                "columns": df.columns.tolist()
-            }
-
-            metadata = {
-                "row_count": len(df),
-                "column_count": len(df.columns),
-                "columns": df.columns.tolist(),
-                "processing_note": "Converted to row-based segments for thematic analysis"
-            }
-            return structured_content, "\n".join(content_lines), metadata
-
-        except Exception as e:
-            print(f"Error processing CSV file: {str(e)}")
-            return {"segments": [], "error": str(e)}, f"[Error extracting CSV content: {str(e)}]", {"error": str(e)}
+                yield from table_rows(chunk, row_count)
+                row_count += len(chunk)
+
+        # Create segments for each row; offsets assume double line breaks between rows
+        with reader:
+            yield from segment_rows(rows())
+
+        extraction["metadata"] = {
+            "row_count": row_count,
+            "column_count": len(columns),
+            "columns": columns,
+            "processing_note": "Converted to row-based segments for thematic analysis"
+        }
@@ -4,6 +4,7 @@ from typing import List, Optional
 
 from app.models.document_segment import DocumentSegment
 from app.models.code import Code
+from app.services.document.near_duplicates import NearDuplicateService
 from app.schemas.document_segment import (
     DocumentSegmentCreate,
     DocumentSegmentUpdate,
@@ -77,8 +78,12 @@ class DocumentSegmentService:
             raise HTTPException(status_code=404, detail="Segment not found")
 
         update_data = segment_update.model_dump(exclude_unset=True)
+        content_changed = "content" in update_data and update_data["content"] != segment.content
         for field, value in update_data.items():
             setattr(segment, field, value)
+        if content_changed:
+            # Its near-duplicate cluster was computed from the old text
+            NearDuplicateService.reindex_segment(db, segment.id, segment.content)
 
         db.commit()
         db.refresh(segment)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, BinaryIO, Dict, List, Optional, Union
 
 from app.models.document import Document, DocumentType
 from app.schemas.document import DocumentUpload
@@ -18,7 +18,7 @@ class DocumentService:
         document_type: DocumentType,
         project_id: int,
         uploaded_by_id: int,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO],
         filename: str
     ) -> DocumentUpload:
         return DocumentUploadService.create_document(
@@ -49,12 +49,17 @@ class DocumentService:
         document_id: int,
         user_id: int,
         name: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        coding_columns: Optional[List[str]] = None
     ) -> Document:
         return DocumentManagementService.update_document(
-            db, document_id, user_id, name, description
+            db, document_id, user_id, name, description, coding_columns
         )
 
+    @staticmethod
+    def get_duplicate_report(db: Session, project_id: int) -> Dict[str, Any]:
+        return DocumentManagementService.get_duplicate_report(db, project_id)
+
     @staticmethod
     def search_documents(
         db: Session,
@@ -0,0 +1,54 @@
+"""
+LLM services module.
+
+This module provides the infrastructure around LLM calls used by AI coding:
+- Persistent response caching keyed by model, prompt and input text
+- Single-flight coalescing of identical concurrent requests
+- Packing of many short segments into one batched prompt
+- An offline deterministic "local" provider for benchmarks and tests
+- Record/replay cassettes of provider responses for offline benchmarks
+- Client-side rate limiting, retries with backoff, hedging and call statistics
+- Token usage, cost and per-run totals of LLM calls
+- Retrieval of relevant existing codes for codebook-aware prompts
+"""
+
+from .cache import LLMCacheService
+from .batching import estimate_tokens, pack_batches, render_batch, parse_batch
+from .local_provider import LOCAL_PROVIDER, LocalCodingModel, LocalProviderError
+from .rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, get_rate_limits
+from .codebook import CodebookIndex, CodebookService
+from .singleflight import SingleFlight, get_single_flight
+from .cassette import Cassette, CassetteMissError, get_cassette
+from .metrics import RunMetrics, current_run, token_cost, track_run
+from .retry import CallStats, call_with_retry, get_all_call_stats, get_call_stats, is_retryable_error
+
+__all__ = [
+    'LLMCacheService',
+    'estimate_tokens',
+    'pack_batches',
+    'render_batch',
+    'parse_batch',
+    'LOCAL_PROVIDER',
+    'LocalCodingModel',
+    'LocalProviderError',
+    'RateLimiter',
+    'TokenBucket',
+    'get_rate_limiter',
+    'get_rate_limits',
+    'CallStats',
+    'call_with_retry',
+    'get_all_call_stats',
+    'get_call_stats',
+    'is_retryable_error',
+    'CodebookIndex',
+    'CodebookService',
+    'SingleFlight',
+    'get_single_flight',
+    'Cassette',
+    'CassetteMissError',
+    'get_cassette',
+    'RunMetrics',
+    'current_run',
+    'token_cost',
+    'track_run'
+]
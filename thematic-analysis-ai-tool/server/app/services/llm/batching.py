@@ -0,0 +1,54 @@
+"""
+Packing of many short texts into batched LLM prompts
+"""
+from typing import List, Sequence, Tuple
+import re
+
+# Rough characters-per-token ratio for English prose; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Tokens spent on the "[id] " tag and line break of each packed segment
+SEGMENT_OVERHEAD_TOKENS = 4
+
+_BATCH_LINE = re.compile(r"^\[([^\]]+)\] ?(.*)$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate that needs no tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(texts: Sequence[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily group text indices into batches.
+
+    A batch is closed when adding the next text would exceed `token_budget`
+    or `max_items`. A text larger than the budget gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text) + SEGMENT_OVERHEAD_TOKENS
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def render_batch(items: Sequence[Tuple[str, str]]) -> str:
+    """Render (segment id, text) pairs as the human message of a batched prompt"""
+    return "\n".join(f"[{segment_id}] {' '.join(text.split())}" for segment_id, text in items)
+
+
+def parse_batch(rendered: str) -> List[Tuple[str, str]]:
+    """Inverse of `render_batch`: recover (segment id, text) pairs from a prompt"""
+    items: List[Tuple[str, str]] = []
+    for line in rendered.splitlines():
+        match = _BATCH_LINE.match(line)
+        if match:
+            items.append((match.group(1), match.group(2)))
+    return items
@@ -0,0 +1,212 @@
+"""
+Persistent cache for parsed LLM outputs
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, Iterable, Any, Optional, Type
+from pydantic import BaseModel
+import datetime
+import hashlib
+import threading
+import time
+
+from app.core.config import settings
+from app.models.llm_cache import LLMCacheEntry
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _CacheCounters:
+    """Thread-safe in-process hit/miss counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def add(self, hits: int = 0, misses: int = 0, writes: int = 0, evictions: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.writes += writes
+            self.evictions += evictions
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+_counters = _CacheCounters()
+
+# Monotonic time of this process's last eviction pass
+_last_evicted: Optional[float] = None
+_evict_lock = threading.Lock()
+
+
+class LLMCacheService:
+    """Service for looking up and storing cached LLM outputs"""
+
+    @staticmethod
+    def make_key(
+        provider: str, model_name: str, prompt: str, text: str, scope: Optional[str] = None
+    ) -> str:
+        """
+        Build the cache key for one LLM call.
+
+        Entries with a `scope` (e.g. the project whose codes the prompt
+        lists) are only shared by calls with the same scope.
+        """
+        parts = [provider, model_name, _sha256(prompt), _sha256(text)]
+        if scope is not None:
+            parts.append(f"scope:{scope}")
+        return _sha256("|".join(parts))
+
+    @staticmethod
+    def get_many(
+        db: Session,
+        keys: Iterable[str],
+        output_model: Type[BaseModel]
+    ) -> Dict[str, BaseModel]:
+        """Return cached outputs for the given keys, skipping expired entries"""
+        keys = list(set(keys))
+        if not settings.LLM_CACHE_ENABLED or not keys:
+            return {}
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cutoff = now - datetime.timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+        rows = db.query(LLMCacheEntry.cache_key, LLMCacheEntry.response).filter(
+            LLMCacheEntry.cache_key.in_(keys),
+            LLMCacheEntry.created_at >= cutoff
+        ).all()
+
+        found: Dict[str, BaseModel] = {}
+        for cache_key, response in rows:
+            try:
+                found[cache_key] = output_model.model_validate(response)
+            except ValueError:
+                # Schema changed since the entry was written; treat as a miss
+                continue
+
+        if found:
+            db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.cache_key.in_(list(found.keys()))
+            ).update(
+                {
+                    LLMCacheEntry.hit_count: LLMCacheEntry.hit_count + 1,
+                    LLMCacheEntry.last_accessed_at: now,
+                },
+                synchronize_session=False
+            )
+            db.commit()
+
+        _counters.add(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    @staticmethod
+    def set_many(
+        db: Session,
+        provider: str,
+        model_name: str,
+        prompt: str,
+        entries: Dict[str, tuple[str, BaseModel]]
+    ) -> None:
+        """
+        Store outputs for the given keys.
+
+        `entries` maps cache key to (input text, parsed output).
+        """
+        if not settings.LLM_CACHE_ENABLED or not entries:
+            return
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        prompt_hash = _sha256(prompt)
+        rows = [
+            {
+                "cache_key": cache_key,
+                "provider": provider,
+                "model_name": model_name,
+                "prompt_hash": prompt_hash,
+                "content_hash": _sha256(text),
+                "response": output.model_dump(),
+                "hit_count": 0,
+                "created_at": now,
+                "last_accessed_at": now,
+            }
+            for cache_key, (text, output) in entries.items()
+        ]
+        stmt = pg_insert(LLMCacheEntry.__table__).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["cache_key"],
+            set_={
+                "response": stmt.excluded.response,
+                "created_at": stmt.excluded.created_at,
+                "last_accessed_at": stmt.excluded.last_accessed_at,
+            }
+        )
+        db.execute(stmt)
+        db.commit()
+        _counters.add(writes=len(rows))
+
+        LLMCacheService.maybe_evict(db)
+
+    @staticmethod
+    def maybe_evict(db: Session) -> int:
+        """
+        `evict`, unless this process already did within the last
+        LLM_CACHE_EVICT_INTERVAL_SECONDS: counting the table on every write
+        would cost a scan per chunk, and the cache may briefly overshoot
+        LLM_CACHE_MAX_ENTRIES instead.
+        """
+        global _last_evicted
+        now = time.monotonic()
+        with _evict_lock:
+            if _last_evicted is not None and \
+                    now - _last_evicted < settings.LLM_CACHE_EVICT_INTERVAL_SECONDS:
+                return 0
+            _last_evicted = now
+        return LLMCacheService.evict(db)
+
+    @staticmethod
+    def evict(db: Session) -> int:
+        """Delete expired entries and trim the cache to LLM_CACHE_MAX_ENTRIES"""
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - \
+            datetime.timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+        deleted = db.query(LLMCacheEntry).filter(
+            LLMCacheEntry.created_at < cutoff
+        ).delete(synchronize_session=False)
+
+        overflow = db.query(func.count(LLMCacheEntry.id)).scalar() - \
+            settings.LLM_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            # Least recently used entries go first
+            stale_ids = db.query(LLMCacheEntry.id).order_by(
+                LLMCacheEntry.last_accessed_at.asc()
+            ).limit(overflow).subquery()
+            deleted += db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.id.in_(select(stale_ids.c.id))
+            ).delete(synchronize_session=False)
+
+        db.commit()
+        if deleted:
+            _counters.add(evictions=deleted)
+        return deleted
+
+    @staticmethod
+    def get_stats(db: Session) -> Dict[str, Any]:
+        """Get hit/miss counters for this process and the current cache size"""
+        stats: Dict[str, Any] = _counters.snapshot()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = db.query(func.count(LLMCacheEntry.id)).scalar()
+        stats["enabled"] = settings.LLM_CACHE_ENABLED
+        return stats
@@ -0,0 +1,173 @@
+"""
+Record/replay of LLM responses, for reproducible offline benchmarks
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: recording from several processes is not supported
+    fcntl = None
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+CASSETTE_OFF = "off"
+CASSETTE_RECORD = "record"
+CASSETTE_REPLAY = "replay"
+
+
+class CassetteMissError(ValueError):
+    """Replay found no recorded response for a request (never retried)"""
+
+
+def fingerprint(provider: str, model_name: str, prompt: str, inputs: Dict[str, Any]) -> str:
+    """Stable key of one model request: model, system prompt and prompt inputs"""
+    payload = json.dumps([provider, model_name, prompt, inputs], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Gzipped JSON lines of {"key", "latency", "output", "tokens"} records.
+
+    Recording buffers records and appends them as one gzip member every
+    `flush_every` records and at exit; gzip readers treat the members as a
+    single stream, so a cassette can be extended by several recording runs.
+    Each member is compressed in memory and appended in one write under an
+    exclusive lock on the file, so several processes (e.g. uvicorn workers)
+    can record to the same cassette.
+    Replaying serves each key's recordings in turn, sleeping the recorded
+    latency times `latency_scale` to reproduce the provider's timing.
+    """
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0, flush_every: int = 100):
+        if mode not in (CASSETTE_RECORD, CASSETTE_REPLAY):
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._recordings: Dict[str, List[Tuple[float, Optional[dict], Optional[list]]]] = {}
+        self._next: Dict[str, int] = {}
+        if mode == CASSETTE_REPLAY:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == CASSETTE_RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == CASSETTE_REPLAY
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"LLM cassette not found: {self.path}")
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._recordings.setdefault(record["key"], []).append(
+                        (record["latency"], record["output"], record.get("tokens")))
+
+    def __len__(self) -> int:
+        return sum(len(recordings) for recordings in self._recordings.values())
+
+    def record(
+        self,
+        key: str,
+        latency: float,
+        output: Optional[BaseModel],
+        tokens: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """
+        Buffer one successful response and its (prompt, completion) token
+        usage; `output` is None when the model returned no structured output.
+        """
+        record = {
+            "key": key,
+            "latency": round(latency, 4),
+            "output": output.model_dump() if output is not None else None,
+            "tokens": list(tokens) if tokens is not None else None,
+        }
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def play(self, key: str) -> Tuple[Optional[dict], Optional[Tuple[int, int]]]:
+        """Payload and token usage of the next recording of `key`, after its scaled latency"""
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                raise CassetteMissError(f"No recorded LLM response for request {key[:12]}")
+            position = self._next.get(key, 0)
+            self._next[key] = (position + 1) % len(recordings)
+        latency, output, tokens = recordings[position]
+        if latency > 0 and self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return output, tuple(tokens) if tokens is not None else None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        member = gzip.compress("".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for record in self._buffer
+        ).encode("utf-8"))
+        with open(self.path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(member)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        self._buffer.clear()
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The process-wide cassette for LLM_CASSETTE_MODE, or None when it is "off" """
+    global _cassette
+    if settings.LLM_CASSETTE_MODE == CASSETTE_OFF:
+        return None
+    with _cassette_lock:
+        if _cassette is None or _cassette.mode != settings.LLM_CASSETTE_MODE \
+                or _cassette.path != settings.LLM_CASSETTE_PATH:
+            if _cassette is not None:
+                _cassette.flush()
+            _cassette = Cassette(
+                settings.LLM_CASSETTE_PATH,
+                settings.LLM_CASSETTE_MODE,
+                latency_scale=settings.LLM_CASSETTE_LATENCY_SCALE,
+            )
+        _cassette.latency_scale = settings.LLM_CASSETTE_LATENCY_SCALE
+        return _cassette
+
+
+@atexit.register
+def _flush_cassette() -> None:
+    if _cassette is not None:
+        _cassette.flush()
@@ -0,0 +1,135 @@
+"""
+Lexical (BM25) retrieval of a project's existing codes for codebook-aware prompts
+"""
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+import math
+import re
+import threading
+
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.code import Code
+
+NO_CODES = "(no existing codes yet)"
+
+_TERM = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+_STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or that the this
+    to was were will with auto created code codes""".split())
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Name terms count this many times more than description terms
+_NAME_WEIGHT = 3
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in _TERM.findall(text.lower()) if term not in _STOPWORDS]
+
+
+class CodebookIndex:
+    """Immutable BM25 index over the names and descriptions of a project's codes"""
+
+    def __init__(self, codes: List[Tuple[int, str, Optional[str]]]):
+        self.codes = codes
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for position, (_, name, description) in enumerate(codes):
+            counts = Counter(_terms(name) * _NAME_WEIGHT + _terms(description or ""))
+            self._lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self._postings.setdefault(term, []).append((position, count))
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def search(self, text: str, k: int) -> List[Tuple[int, str, Optional[str]]]:
+        """
+        The `k` codes most relevant to `text`, best first.
+
+        Small codebooks (at most `k` codes) are returned whole, relevant ones
+        first; larger ones only contribute codes sharing a term with `text`.
+        """
+        total = len(self.codes)
+        scores: Dict[int, float] = {}
+        for term in set(_terms(text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, count in postings:
+                norm = _K1 * (1 - _B + _B * self._lengths[position] / (self._average_length or 1))
+                scores[position] = scores.get(position, 0.0) + idf * count * (_K1 + 1) / (count + norm)
+
+        ranked = sorted(scores, key=lambda position: (-scores[position], position))[:k]
+        if total <= k:
+            ranked += [position for position in range(total) if position not in scores]
+        return [self.codes[position] for position in ranked]
+
+    def render(self, text: str, k: Optional[int] = None) -> str:
+        """Prompt block listing the codes most relevant to `text`, one per line"""
+        matches = self.search(text, k or settings.CODEBOOK_TOP_K)
+        if not matches:
+            return NO_CODES
+        limit = settings.CODEBOOK_DESCRIPTION_CHARS
+        lines = []
+        for _, name, description in matches:
+            description = " ".join((description or "").split())
+            if len(description) > limit:
+                description = description[:limit].rstrip() + "..."
+            lines.append(f"- {name}: {description}" if description else f"- {name}")
+        return "\n".join(lines)
+
+
+class CodebookService:
+    """Per-project codebook indexes, rebuilt only when the project's codes change"""
+
+    _indexes: "OrderedDict[int, Tuple[tuple, CodebookIndex]]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _active_codes(db: Session, project_id: int):
+        return db.query(Code).filter(
+            Code.project_id == project_id,
+            Code.is_active.isnot(False)
+        )
+
+    @staticmethod
+    def version(db: Session, project_id: int) -> tuple:
+        """Cheap fingerprint of a project's active codes: count, newest id and content hash"""
+        return tuple(CodebookService._active_codes(db, project_id).with_entities(
+            func.count(Code.id),
+            func.max(Code.id),
+            func.md5(func.string_agg(
+                Code.name + "|" + func.coalesce(Code.description, ""),
+                aggregate_order_by(literal("\n"), Code.id)
+            ))
+        ).one())
+
+    @staticmethod
+    def get_index(db: Session, project_id: int) -> CodebookIndex:
+        """The project's index, reusing the cached one while its version is unchanged"""
+        version = CodebookService.version(db, project_id)
+        with CodebookService._lock:
+            cached = CodebookService._indexes.get(project_id)
+            if cached is not None and cached[0] == version:
+                CodebookService._indexes.move_to_end(project_id)
+                return cached[1]
+
+        index = CodebookIndex([
+            (code_id, name, description)
+            for code_id, name, description in CodebookService._active_codes(db, project_id)
+            .with_entities(Code.id, Code.name, Code.description).order_by(Code.id).all()
+        ])
+        with CodebookService._lock:
+            CodebookService._indexes[project_id] = (version, index)
+            CodebookService._indexes.move_to_end(project_id)
+            while len(CodebookService._indexes) > settings.CODEBOOK_INDEX_CACHE_SIZE:
+                CodebookService._indexes.popitem(last=False)
+        return index
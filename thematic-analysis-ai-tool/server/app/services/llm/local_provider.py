@@ -0,0 +1,139 @@
+"""
+Offline, deterministic stand-in for a chat model provider
+"""
+from collections import Counter
+from typing import Any, Dict
+import random
+import re
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from app.schemas.llm_outputs import CodeOutput, BatchCodeOutput, SegmentCodeOutput, ThemeOutput
+from .batching import estimate_tokens, parse_batch
+
+LOCAL_PROVIDER = "local"
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z'-]{3,}")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+_TOP_TERMS = re.compile(r"^Top terms:\s*(.*)$", re.MULTILINE)
+_STOPWORDS = frozenset("""
+    about above after again against also because been before being below between both
+    could does doing down during each from further have having here into itself just
+    more most other over same should some such than that their them then there these
+    they this those through under until very what when where which while will with
+    would your yours row""".split())
+
+# Longest quote the local model returns, in characters
+MAX_QUOTE_LENGTH = 160
+
+
+class LocalProviderError(RuntimeError):
+    """Simulated transient provider failure, reported as a rate limit"""
+
+    status_code = 429
+
+
+class LocalCodingModel:
+    """
+    Fake chat model for benchmarks, tests and air-gapped machines.
+
+    Coding is a pure function of the input text: the code is the most
+    frequent non-stopword, the quote is the first sentence. Any codebook
+    context in the inputs is ignored. Each call
+    sleeps `latency_ms` and fails with probability `failure_rate`.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _simulate_call(self) -> None:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.failure_rate > 0:
+            with self._random_lock:
+                failed = self._random.random() < self.failure_rate
+            if failed:
+                raise LocalProviderError("Simulated provider failure (429 Too Many Requests)")
+
+    @staticmethod
+    def code(text: str) -> CodeOutput:
+        """Deterministic CodeOutput for a piece of text"""
+        words = [word.lower() for word in _WORD.findall(text)]
+        counts = Counter(word for word in words if word not in _STOPWORDS)
+        if counts:
+            # Most frequent first; ties broken alphabetically for determinism
+            keyword = min(counts.items(), key=lambda item: (-item[1], item[0]))[0]
+        else:
+            keyword = "uncategorised"
+
+        stripped = text.strip()
+        quote = _SENTENCE_END.split(stripped, maxsplit=1)[0] if stripped else ""
+        quote = quote[:MAX_QUOTE_LENGTH]
+
+        code_name = keyword.replace("-", " ").title()
+        return CodeOutput(
+            reasoning=f"Local deterministic coding: '{keyword}' is the most frequent content word.",
+            code=code_name,
+            quote=quote,
+            code_description=f"Passages that talk about {keyword}.",
+        )
+
+    def _invoke_single(self, inputs: Dict[str, Any]) -> CodeOutput:
+        self._simulate_call()
+        return self.code(inputs["text"])
+
+    def _invoke_batch(self, inputs: Dict[str, Any]) -> BatchCodeOutput:
+        self._simulate_call()
+        return BatchCodeOutput(items=[
+            SegmentCodeOutput(segment_id=segment_id, **self.code(text).model_dump())
+            for segment_id, text in parse_batch(inputs["segments"])
+        ])
+
+    def _invoke_theme(self, inputs: Dict[str, Any]) -> ThemeOutput:
+        self._simulate_call()
+        match = _TOP_TERMS.search(inputs["summary"])
+        top_terms = [term.strip() for term in match.group(1).split(",") if term.strip()] \
+            if match else []
+        name = " & ".join(term.title() for term in top_terms[:2]) or "Miscellaneous"
+        return ThemeOutput(
+            reasoning="Local deterministic theme: named after the cluster's top terms.",
+            theme=name,
+            theme_description=f"Codes about {', '.join(top_terms[:5]) or 'various topics'}.",
+        )
+
+    @staticmethod
+    def _with_raw(invoke):
+        """
+        Wrap an invoke function to return what `with_structured_output(...,
+        include_raw=True)` does, with token usage estimated from the text.
+        """
+        def invoke_with_raw(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            parsed: BaseModel = invoke(inputs)
+            input_tokens = sum(estimate_tokens(str(value)) for value in inputs.values())
+            output_tokens = estimate_tokens(parsed.model_dump_json())
+            raw = AIMessage(content="", usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            })
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+        return invoke_with_raw
+
+    def initial_coding_runnable(self) -> Runnable:
+        """Drop-in for `prompt | llm.with_structured_output(CodeOutput, include_raw=True)`"""
+        return RunnableLambda(self._with_raw(self._invoke_single))
+
+    def batch_coding_runnable(self) -> Runnable:
+        """Drop-in for `batch_prompt | llm.with_structured_output(BatchCodeOutput, include_raw=True)`"""
+        return RunnableLambda(self._with_raw(self._invoke_batch))
+
+    def theme_labeling_runnable(self) -> Runnable:
+        """Drop-in for `theme_prompt | llm.with_structured_output(ThemeOutput, include_raw=True)`"""
+        return RunnableLambda(self._with_raw(self._invoke_theme))
@@ -0,0 +1,110 @@
+"""
+Token usage, cost and per-run totals of LLM calls
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+import threading
+
+from app.core.config import settings
+
+
+def token_cost(
+    provider: str, model_name: str, prompt_tokens: float, completion_tokens: float
+) -> Optional[float]:
+    """Cost from LLM_PRICES_PER_MILLION_TOKENS, or None if the model has no price"""
+    prices = settings.LLM_PRICES_PER_MILLION_TOKENS.get(f"{provider}:{model_name}") \
+        or settings.LLM_PRICES_PER_MILLION_TOKENS.get(provider)
+    if not prices:
+        return None
+    return round(
+        (prompt_tokens * prices.get("input", 0.0)
+         + completion_tokens * prices.get("output", 0.0)) / 1_000_000, 6)
+
+
+def usage_tokens(raw: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens from a chat message's usage metadata, if reported"""
+    usage = getattr(raw, "usage_metadata", None)
+    if not usage:
+        return None
+    return int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0)
+
+
+class RunMetrics:
+    """Thread-safe LLM call totals of one AI coding run, across all models it used"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+
+    def record(
+        self,
+        provider: str,
+        model_name: str,
+        latency: float,
+        failed: bool = False,
+        parse_failed: bool = False,
+        tokens: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """One logical call (retries and hedges included) and its outcome"""
+        key = f"{provider}:{model_name}"
+        with self._lock:
+            totals = self._models.get(key)
+            if totals is None:
+                totals = self._models[key] = {
+                    "calls": 0, "failures": 0, "parse_failures": 0, "latency_seconds": 0.0,
+                    "prompt_tokens": 0, "completion_tokens": 0,
+                }
+            totals["calls"] += 1
+            totals["failures"] += int(failed)
+            totals["parse_failures"] += int(parse_failed)
+            totals["latency_seconds"] += latency
+            if tokens is not None:
+                totals["prompt_tokens"] += tokens[0]
+                totals["completion_tokens"] += tokens[1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Totals per "<provider>:<model_name>" plus overall calls, tokens and cost"""
+        with self._lock:
+            models = {key: dict(totals) for key, totals in self._models.items()}
+        summary: Dict[str, Any] = {
+            "calls": 0, "failures": 0, "parse_failures": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": None,
+        }
+        for key, totals in models.items():
+            provider, _, model_name = key.partition(":")
+            totals["latency_seconds"] = round(totals["latency_seconds"], 3)
+            totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+            totals["cost"] = token_cost(
+                provider, model_name, totals["prompt_tokens"], totals["completion_tokens"])
+            for field in ("calls", "failures", "parse_failures", "prompt_tokens", "completion_tokens"):
+                summary[field] += totals[field]
+            if totals["cost"] is not None:
+                summary["cost"] = round((summary["cost"] or 0.0) + totals["cost"], 6)
+        summary["total_tokens"] = summary["prompt_tokens"] + summary["completion_tokens"]
+        summary["models"] = models
+        return summary
+
+
+_current_run: ContextVar[Optional[RunMetrics]] = ContextVar("llm_run_metrics", default=None)
+
+
+def current_run() -> Optional[RunMetrics]:
+    """The run being tracked in this context, if any"""
+    return _current_run.get()
+
+
+@contextmanager
+def track_run() -> Iterator[RunMetrics]:
+    """
+    Collect the LLM calls made in this context into a new RunMetrics.
+
+    LLMService fans calls out with a copy of the caller's context, so calls
+    made on its worker threads are counted too.
+    """
+    run = RunMetrics()
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
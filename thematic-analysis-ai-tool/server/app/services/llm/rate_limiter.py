@@ -0,0 +1,105 @@
+"""
+Client-side token-bucket rate limiting of LLM calls per provider and model
+"""
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+from app.core.config import settings
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    A rate of 0 or less disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_second > 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` tokens and return how long the caller must wait before
+        using them. The balance may go negative, which queues later callers
+        behind this one in arrival order.
+        """
+        if not self.enabled:
+            return 0.0
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_second
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider and model"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> float:
+        """Block until one request of about `tokens` tokens may be sent; return seconds waited"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self._waited_seconds += wait
+        return wait
+
+    @property
+    def waited_seconds(self) -> float:
+        with self._lock:
+            return self._waited_seconds
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limits(provider: str, model_name: str) -> Dict[str, int]:
+    """
+    Configured limits for a provider and model.
+
+    LLM_RATE_LIMITS entries are keyed "<provider>:<model_name>" or
+    "<provider>" and override LLM_REQUESTS_PER_MINUTE/LLM_TOKENS_PER_MINUTE.
+    """
+    limits = {
+        "requests_per_minute": settings.LLM_REQUESTS_PER_MINUTE,
+        "tokens_per_minute": settings.LLM_TOKENS_PER_MINUTE,
+    }
+    limits.update(settings.LLM_RATE_LIMITS.get(provider, {}))
+    limits.update(settings.LLM_RATE_LIMITS.get(f"{provider}:{model_name}", {}))
+    return limits
+
+
+def get_rate_limiter(provider: str, model_name: str) -> RateLimiter:
+    """Process-wide limiter shared by every call to the same provider and model"""
+    key = (provider, model_name)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = get_rate_limits(provider, model_name)
+            limiter = RateLimiter(limits["requests_per_minute"], limits["tokens_per_minute"])
+            _limiters[key] = limiter
+        return limiter
@@ -0,0 +1,308 @@
+"""
+Retries with exponential backoff, hedged requests and per-model call statistics
+"""
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Callable, ContextManager, Deque, Dict, Optional, Tuple, TypeVar
+import importlib
+import random
+import threading
+import time
+
+from app.core.config import settings
+from .metrics import token_cost
+
+R = TypeVar("R")
+
+_RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+# Connection and timeout failures of the HTTP clients and provider SDKs, none of which is required
+_TRANSIENT_ERROR_TYPES = (
+    "httpx.TransportError", "requests.exceptions.ConnectionError", "requests.exceptions.Timeout",
+    "openai.APIConnectionError", "anthropic.APIConnectionError", "groq.APIConnectionError",
+)
+
+# Recent latencies kept per model for percentile estimates
+LATENCY_WINDOW = 1000
+# Upper bounds (seconds) of the per-model latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Hedged attempts run on a pool per provider so the caller can wait on whichever finishes first
+_hedge_executors: Dict[str, ThreadPoolExecutor] = {}
+_hedge_executors_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _transient_error_types() -> Tuple[type, ...]:
+    """The installed exception classes named in _TRANSIENT_ERROR_TYPES"""
+    types = [TimeoutError, ConnectionError]
+    for name in _TRANSIENT_ERROR_TYPES:
+        module_name, _, class_name = name.rpartition(".")
+        try:
+            types.append(getattr(importlib.import_module(module_name), class_name))
+        except (ImportError, AttributeError):
+            pass
+    return tuple(types)
+
+
+@lru_cache(maxsize=None)
+def _model_error_type() -> Optional[type]:
+    try:
+        from langchain_core.exceptions import ModelError
+    except ImportError:
+        return None
+    return ModelError
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Whether an LLM call failure is transient (rate limits, 5xx, timeouts).
+
+    Decided by the HTTP status code the provider reports, langchain's own
+    classification, or the exception type of connection and timeout
+    failures, following the chain of causes since integrations wrap the
+    SDK's errors. Validation errors (ValueError and its subclasses) are
+    never retried; the batch splitter and the caller deal with those.
+    """
+    if isinstance(error, ValueError):
+        return False
+    model_error = _model_error_type()
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for attribute in ("status_code", "code", "status"):
+            status = getattr(error, attribute, None)
+            if isinstance(status, int) and not isinstance(status, bool):
+                return status in _RETRYABLE_STATUS_CODES
+        if model_error is not None and isinstance(error, model_error):
+            return bool(error.is_retryable)
+        if isinstance(error, _transient_error_types()):
+            return True
+        error = error.__cause__
+    return False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CallStats:
+    """
+    Thread-safe latency, retry, hedge and token counters for one provider and model.
+
+    Latency is recorded per attempt, both as a window of recent values for
+    percentiles and as a histogram over LATENCY_BUCKETS since startup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.parse_failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls_with_usage = 0
+
+    def record_call(self, latency: float, failed: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.failures += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latencies.append(latency)
+            self._buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def record_usage(self, tokens: Optional[Tuple[int, int]], parse_failed: bool = False) -> None:
+        """Token usage reported by the provider for one call, and whether its output failed to parse"""
+        with self._lock:
+            if parse_failed:
+                self.parse_failures += 1
+            if tokens is not None:
+                self.calls_with_usage += 1
+                self.prompt_tokens += tokens[0]
+                self.completion_tokens += tokens[1]
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_hedge(self, won: bool) -> None:
+        with self._lock:
+            self.hedges += 1
+            if won:
+                self.hedge_wins += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls = self.calls
+
+            def percentile(fraction: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 4)
+
+            return {
+                "calls": calls,
+                "failures": self.failures,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "mean_latency_seconds": round(self.total_latency / calls, 4) if calls else None,
+                "p50_latency_seconds": percentile(0.50),
+                "p95_latency_seconds": percentile(0.95),
+                "max_latency_seconds": round(self.max_latency, 4),
+                # Cumulative, like Prometheus: attempts that took at most `le` seconds
+                "latency_histogram": {
+                    str(bound): count
+                    for bound, count in zip(
+                        LATENCY_BUCKETS + ("+Inf",),
+                        [sum(self._buckets[:i + 1]) for i in range(len(self._buckets))]
+                    )
+                },
+                "parse_failures": self.parse_failures,
+                "calls_with_usage": self.calls_with_usage,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+            }
+
+
+_stats: Dict[Tuple[str, str], CallStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_call_stats(provider: str, model_name: str) -> CallStats:
+    with _stats_lock:
+        stats = _stats.get((provider, model_name))
+        if stats is None:
+            stats = _stats[(provider, model_name)] = CallStats()
+        return stats
+
+
+def get_all_call_stats() -> Dict[str, dict]:
+    """Snapshot of every model's call statistics and token cost, keyed "<provider>:<model_name>" """
+    with _stats_lock:
+        items = list(_stats.items())
+    snapshots = {}
+    for (provider, model_name), stats in items:
+        snapshot = stats.snapshot()
+        snapshot["cost"] = token_cost(
+            provider, model_name, snapshot["prompt_tokens"], snapshot["completion_tokens"])
+        snapshots[f"{provider}:{model_name}"] = snapshot
+    return snapshots
+
+
+def get_hedge_executor(provider: str) -> ThreadPoolExecutor:
+    """
+    The pool that runs a provider's hedged attempts, two workers per
+    admitted call (LLM_PROVIDER_MAX_CONCURRENCY). A losing attempt keeps its
+    worker after the call returns and releases its slot, so while the
+    provider is slow new attempts can queue behind losers; a hedge still
+    queued when its call completes is cancelled rather than run.
+    """
+    with _hedge_executors_lock:
+        executor = _hedge_executors.get(provider)
+        if executor is None:
+            executor = _hedge_executors[provider] = ThreadPoolExecutor(
+                max_workers=2 * settings.LLM_PROVIDER_MAX_CONCURRENCY,
+                thread_name_prefix=f"llm-hedge-{provider}")
+        return executor
+
+
+def _timed(fn: Callable[[], R], stats: CallStats) -> R:
+    started = time.monotonic()
+    try:
+        result = fn()
+    except BaseException:
+        stats.record_call(time.monotonic() - started, failed=True)
+        raise
+    stats.record_call(time.monotonic() - started)
+    return result
+
+
+def hedged_call(
+    fn: Callable[[], R],
+    hedge_after: float,
+    stats: CallStats,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> R:
+    """
+    Call `fn`, and if it has not finished after `hedge_after` seconds start an
+    identical second attempt; return whichever succeeds first.
+
+    With `hedge_after` <= 0 this is a plain timed call. A losing attempt
+    that has started cannot be interrupted and finishes in the background;
+    one still queued is cancelled. Attempts run on `executor`, the default
+    provider's hedge pool if not given.
+    """
+    if hedge_after <= 0:
+        return _timed(fn, stats)
+
+    executor = executor or get_hedge_executor("")
+    primary = executor.submit(_timed, fn, stats)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    hedge = executor.submit(_timed, fn, stats)
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                stats.record_hedge(won=future is hedge)
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+            error = error or future.exception()
+    stats.record_hedge(won=False)
+    raise error
+
+
+def call_with_retry(
+    fn: Callable[[], R],
+    stats: CallStats,
+    max_retries: Optional[int] = None,
+    hedge_after: Optional[float] = None,
+    admit: Optional[Callable[[], ContextManager]] = None,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> R:
+    """
+    Call `fn` (hedged if configured), retrying transient failures with
+    full-jitter exponential backoff. Non-retryable errors and the last
+    transient error are raised to the caller.
+
+    Each attempt runs inside `admit()`, e.g. a rate limiter and concurrency
+    slot. Admission is neither timed nor hedged: waiting for it does not
+    count as latency or trigger a hedge, and a hedge shares the admission
+    of the attempt it duplicates. Backoff sleeps happen outside it.
+    """
+    max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    hedge_after = settings.LLM_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    attempt = 0
+    while True:
+        try:
+            with admit() if admit is not None else nullcontext():
+                return hedged_call(fn, hedge_after, stats, executor)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(
+                attempt, settings.LLM_RETRY_BASE_DELAY_SECONDS, settings.LLM_RETRY_MAX_DELAY_SECONDS)
+            print(f"LLM call failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+            stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing of identical concurrent LLM requests
+"""
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Tuple
+import threading
+
+
+class SingleFlight:
+    """
+    Registry of in-flight requests by key.
+
+    The first caller to claim a key leads it and must `resolve` it; callers
+    claiming the same key meanwhile get the leader's future and share its
+    result instead of sending the request again. Keys must therefore cover
+    everything that can change the response, like the cache keys they are
+    (see `LLMService.cache_key`).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._led = 0
+        self._coalesced = 0
+
+    def claim(self, keys: Iterable[str]) -> Tuple[List[str], Dict[str, Future]]:
+        """Split `keys` into those now led by the caller and futures of ones already in flight"""
+        led: List[str] = []
+        waiting: Dict[str, Future] = {}
+        with self._lock:
+            for key in keys:
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    led.append(key)
+                else:
+                    waiting[key] = future
+            self._led += len(led)
+            self._coalesced += len(waiting)
+        return led, waiting
+
+    def resolve(self, results: Dict[str, Any]) -> None:
+        """
+        Publish the leader's result for each key and release the keys.
+
+        Results may be exceptions; waiters receive them as values, like
+        `LLMService.code_texts(..., return_exceptions=True)` does.
+        """
+        with self._lock:
+            futures = {key: self._inflight.pop(key) for key in results if key in self._inflight}
+        for key, future in futures.items():
+            future.set_result(results[key])
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "led": self._led,
+                "coalesced": self._coalesced,
+            }
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """The process-wide registry shared by all LLM services"""
+    return _single_flight
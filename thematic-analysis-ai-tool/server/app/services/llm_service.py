@@ -1,14 +1,137 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, List, Optional, Dict, Tuple, Callable, TypeVar, Union
+import contextvars
+import hashlib
+import threading
+import time
+from sqlalchemy.orm import Session
 from langchain.chat_models import init_chat_model
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.runnables import Runnable
-from app.schemas.llm_outputs import CodeOutput
-from app.prompts.initial_coding import system_message
+from app.core.config import settings
+from app.schemas.llm_outputs import CodeOutput, BatchCodeOutput, ThemeOutput
+from app.prompts.initial_coding import system_message, batch_system_message, codebook_message
+from app.prompts.theme_generation import system_message as theme_system_message
 from app.utils.llm_provider_api_key import get_llm_provider_api_key
+from app.services.llm.cache import LLMCacheService
+from app.services.llm.batching import estimate_tokens, pack_batches, render_batch
+from app.services.llm.rate_limiter import get_rate_limiter
+from app.services.llm.retry import call_with_retry, get_call_stats, get_hedge_executor
+from app.services.llm.singleflight import get_single_flight
+from app.services.llm.cassette import fingerprint, get_cassette
+from app.services.llm.metrics import current_run, usage_tokens
+from app.services.llm.codebook import CodebookIndex, NO_CODES
+from app.services.llm.local_provider import LOCAL_PROVIDER, LocalCodingModel
+
+# Process-wide cap on in-flight calls per provider, shared by all requests
+_provider_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_provider_semaphores_lock = threading.Lock()
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# System prompt and structured output type of each chain, for cassette keys and replay
+_CHAINS = {
+    "initial_coding": (system_message + codebook_message, CodeOutput),
+    "batch_coding": (batch_system_message + codebook_message, BatchCodeOutput),
+    "theme_labeling": (theme_system_message, ThemeOutput),
+}
+
+
+def _unwrap(response: Any) -> Tuple[Any, Optional[Tuple[int, int]], Optional[Exception]]:
+    """(parsed output, token usage, parsing error) of a chain called with include_raw=True"""
+    if isinstance(response, dict) and "parsed" in response:
+        return response["parsed"], usage_tokens(response.get("raw")), response.get("parsing_error")
+    return response, None, None
+
+
+def _get_provider_semaphore(provider: str) -> threading.BoundedSemaphore:
+    with _provider_semaphores_lock:
+        semaphore = _provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                settings.LLM_PROVIDER_MAX_CONCURRENCY)
+            _provider_semaphores[provider] = semaphore
+        return semaphore
+
 
 class LLMService:
+    # Process-wide pool of constructed services, one per (provider, model_name), least
+    # recently used first; the key comes from the request, so the pool is bounded
+    _instances: "OrderedDict[Tuple[str, str], LLMService]" = OrderedDict()
+    _instance_locks: Dict[Tuple[str, str], threading.Lock] = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, model_name: str, provider: str = "google_genai") -> "LLMService":
+        """
+        Get the shared service for a provider and model, creating it on first use.
+
+        Reusing the instance keeps the chat model client (and its HTTP
+        connections) alive across requests instead of rebuilding it per call.
+        At most LLM_INSTANCE_CACHE_SIZE services are kept; the least recently
+        used one is dropped to make room.
+        """
+        key = (provider, model_name)
+        with cls._registry_lock:
+            instance = cls._instances.get(key)
+            if instance is not None:
+                cls._instances.move_to_end(key)
+                return instance
+            key_lock = cls._instance_locks.setdefault(key, threading.Lock())
+
+        # Per-key lock: building one model does not block lookups of others
+        with key_lock:
+            with cls._registry_lock:
+                instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(model_name=model_name, provider=provider)
+            with cls._registry_lock:
+                cls._instances[key] = instance
+                cls._instances.move_to_end(key)
+                while len(cls._instances) > settings.LLM_INSTANCE_CACHE_SIZE:
+                    cls._instances.popitem(last=False)
+                cls._instance_locks.pop(key, None)
+            return instance
+
+    @classmethod
+    def clear_instances(cls) -> None:
+        """Drop all pooled services, e.g. after rotating API keys"""
+        with cls._registry_lock:
+            cls._instances.clear()
+
+    @staticmethod
+    def check_provider(provider: str) -> None:
+        """Raise ValueError if `provider` may not be used in this deployment"""
+        if provider == LOCAL_PROVIDER and not settings.LOCAL_LLM_ENABLED:
+            raise ValueError("The local LLM provider is disabled")
+
     def __init__(self, model_name: str, provider: str = "google_genai"):
+        self.check_provider(provider)
         self.model_name = model_name
         self.provider = provider
+        self.rate_limiter = get_rate_limiter(provider, model_name)
+        self.call_stats = get_call_stats(provider, model_name)
+        self.cassette = get_cassette()
+        if self.cassette is not None and self.cassette.replaying:
+            # Responses come from the cassette: no client, network or API key
+            self.llm = None
+            self.initial_coding_llm = self.batch_coding_llm = self.theme_labeling_llm = None
+            return
+        if self.provider == LOCAL_PROVIDER:
+            # Offline deterministic model; no prompt or network involved
+            self.llm = LocalCodingModel(
+                latency_ms=settings.LOCAL_LLM_LATENCY_MS,
+                failure_rate=settings.LOCAL_LLM_FAILURE_RATE,
+                seed=settings.LOCAL_LLM_SEED,
+            )
+            self.initial_coding_llm: Runnable = self.llm.initial_coding_runnable()
+            self.batch_coding_llm: Runnable = self.llm.batch_coding_runnable()
+            self.theme_labeling_llm: Runnable = self.llm.theme_labeling_runnable()
+            return
+
         self.llm = init_chat_model(
             model=self.model_name,
             model_provider=self.provider,
@@ -17,13 +140,339 @@ class LLMService:
         prompt = ChatPromptTemplate.from_messages(
             [
                 SystemMessagePromptTemplate.from_template(system_message),
+                SystemMessagePromptTemplate.from_template(codebook_message),
                 HumanMessagePromptTemplate.from_template("{text}"),
             ]
-        )
+        ).partial(codebook=NO_CODES)
         self.initial_coding_llm: Runnable = (
             prompt |
-            self.llm.with_structured_output(CodeOutput)
+            self.llm.with_structured_output(CodeOutput, include_raw=True)
+            )
+        batch_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(batch_system_message),
+                SystemMessagePromptTemplate.from_template(codebook_message),
+                HumanMessagePromptTemplate.from_template("{segments}"),
+            ]
+        ).partial(codebook=NO_CODES)
+        self.batch_coding_llm: Runnable = (
+            batch_prompt |
+            self.llm.with_structured_output(BatchCodeOutput, include_raw=True)
             )
+        theme_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(theme_system_message),
+                HumanMessagePromptTemplate.from_template("{summary}"),
+            ]
+        )
+        self.theme_labeling_llm: Runnable = (
+            theme_prompt |
+            self.llm.with_structured_output(ThemeOutput, include_raw=True)
+            )
+
+    def cache_key(self, text: str, batch_mode: bool = False, scope: Optional[str] = None) -> str:
+        """
+        Cache key for coding `text` with this model and prompt.
+
+        The codebook block itself is left out: it changes whenever a code is
+        added, which would make almost every re-run a miss. Prompts that list
+        a project's codes must pass that project as `scope`, so responses
+        naming one project's codes are never served to another.
+        """
+        prompt = (batch_system_message if batch_mode else system_message) + codebook_message
+        return LLMCacheService.make_key(self.provider, self.model_name, prompt, text, scope)
+
+    @staticmethod
+    def codebook_context(codebook: Optional[CodebookIndex], text: str) -> str:
+        """The codebook block of the prompt for `text`"""
+        return codebook.render(text) if codebook is not None else NO_CODES
+
+    def coding_version(self, batch_mode: bool = False) -> str:
+        """Fingerprint of the provider, model and prompt used for coding"""
+        return self.version_for(self.provider, self.model_name, batch_mode)
+
+    @staticmethod
+    def version_for(provider: str, model_name: str, batch_mode: bool = False) -> str:
+        """`coding_version` without constructing the model client"""
+        prompt = (batch_system_message if batch_mode else system_message) + codebook_message
+        return hashlib.sha256(
+            "|".join([provider, model_name, prompt]).encode("utf-8")
+        ).hexdigest()
+
+    def _invoke(self, chain: str, runnable: Runnable, inputs: dict, tokens: int):
+        """
+        Invoke a chain under the rate limiter and provider semaphore, retrying
+        transient failures with backoff and hedging slow calls if configured.
+
+        With LLM_CASSETTE_MODE "record", successful responses and their
+        latencies are written to the cassette; with "replay" they are served
+        from it instead of calling the provider (see `Cassette`).
+
+        Token usage reported by the provider and structured-output parse
+        failures are added to the model's CallStats and to the current run's
+        RunMetrics, if one is being tracked. A parse failure is raised as
+        before, without retries.
+        """
+        cassette = self.cassette
+        prompt, output_type = _CHAINS[chain]
+        key = fingerprint(self.provider, self.model_name, prompt, inputs) \
+            if cassette is not None else None
+
+        @contextmanager
+        def admit():
+            self.rate_limiter.acquire(tokens)
+            with _get_provider_semaphore(self.provider):
+                yield
+
+        def attempt():
+            # Timed and hedged by call_with_retry; admission happens outside it
+            if cassette is not None and cassette.replaying:
+                payload, usage = cassette.play(key)
+                output = output_type.model_validate(payload) if payload is not None else None
+                return output, usage, None
+            started = time.monotonic()
+            output, usage, parsing_error = _unwrap(runnable.invoke(inputs))
+            if cassette is not None and parsing_error is None:
+                cassette.record(key, time.monotonic() - started, output, usage)
+            return output, usage, parsing_error
+
+        run = current_run()
+        started = time.monotonic()
+        try:
+            output, usage, parsing_error = call_with_retry(
+                attempt, self.call_stats, admit=admit,
+                executor=get_hedge_executor(self.provider))
+        except Exception:
+            if run is not None:
+                run.record(self.provider, self.model_name, time.monotonic() - started, failed=True)
+            raise
+        parse_failed = parsing_error is not None or output is None
+        self.call_stats.record_usage(usage, parse_failed)
+        if run is not None:
+            run.record(self.provider, self.model_name, time.monotonic() - started,
+                       failed=parse_failed, parse_failed=parse_failed, tokens=usage)
+        if parsing_error is not None:
+            raise parsing_error
+        return output
+
+    def code_text(self, text: str, codebook: str = NO_CODES) -> CodeOutput:
+        """Run initial coding on a single piece of text"""
+        tokens = estimate_tokens(system_message) + estimate_tokens(codebook) \
+            + estimate_tokens(text) + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+        return self._invoke(
+            "initial_coding", self.initial_coding_llm, {"text": text, "codebook": codebook}, tokens)
+
+    def label_theme(self, summary: str) -> ThemeOutput:
+        """Name and describe a theme from the summary of a cluster of codes"""
+        tokens = estimate_tokens(theme_system_message) + estimate_tokens(summary) \
+            + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+        response = self._invoke(
+            "theme_labeling", self.theme_labeling_llm, {"summary": summary}, tokens)
+        if response is None:
+            raise ValueError("Model returned no structured output for theme")
+        return response
+
+    def label_themes(
+        self, summaries: List[str], max_concurrency: Optional[int] = None
+    ) -> List[Union[ThemeOutput, Exception]]:
+        """Label many cluster summaries in parallel; failures are returned in place"""
+        return self._fan_out(self.label_theme, summaries, max_concurrency, return_exceptions=True)
+
+    def code_batch(
+        self, items: List[Tuple[str, str]], codebook: str = NO_CODES
+    ) -> Dict[str, CodeOutput]:
+        """
+        Run initial coding on several (segment id, text) pairs in one call.
+
+        Raises ValueError if the model does not return exactly one item per
+        segment id.
+        """
+        rendered = render_batch(items)
+        tokens = estimate_tokens(batch_system_message) + estimate_tokens(codebook) \
+            + estimate_tokens(rendered) + settings.LLM_ESTIMATED_OUTPUT_TOKENS * len(items)
+        response: BatchCodeOutput = self._invoke(
+            "batch_coding", self.batch_coding_llm,
+            {"segments": rendered, "codebook": codebook}, tokens)
+        if response is None:
+            raise ValueError("Model returned no structured output for batch")
+
+        expected = {segment_id for segment_id, _ in items}
+        outputs: Dict[str, CodeOutput] = {}
+        for item in response.items:
+            segment_id = item.segment_id.strip().strip("[]")
+            if segment_id not in expected or segment_id in outputs:
+                raise ValueError(f"Unexpected segment id in batch output: {item.segment_id}")
+            outputs[segment_id] = CodeOutput(**item.model_dump(exclude={"segment_id"}))
+        if len(outputs) != len(expected):
+            raise ValueError(
+                f"Batch output covers {len(outputs)} of {len(expected)} segments")
+        return outputs
+
+    def _code_batch_with_split(
+        self, items: List[Tuple[str, str]], codebook: Optional[CodebookIndex] = None
+    ) -> Dict[str, CodeOutput]:
+        """Code a batch, halving it and retrying whenever the output fails validation"""
+        if len(items) == 1:
+            segment_id, text = items[0]
+            return {segment_id: self.code_text(text, self.codebook_context(codebook, text))}
+        try:
+            # One codebook block for the batch, retrieved with all of its text
+            context = self.codebook_context(codebook, " ".join(text for _, text in items))
+            return self.code_batch(items, context)
+        except ValueError as e:
+            # Also covers pydantic ValidationError / OutputParserException
+            print(f"Batch of {len(items)} segments failed validation, splitting: {e}")
+            middle = len(items) // 2
+            outputs = self._code_batch_with_split(items[:middle], codebook)
+            outputs.update(self._code_batch_with_split(items[middle:], codebook))
+            return outputs
+
+    def code_texts(
+        self,
+        texts: List[str],
+        max_concurrency: Optional[int] = None,
+        batch_mode: bool = False,
+        return_exceptions: bool = False,
+        codebook: Optional[CodebookIndex] = None
+    ) -> List[Union[CodeOutput, Exception]]:
+        """
+        Run initial coding on many texts in parallel.
+
+        Results are returned in the same order as `texts`. At most
+        `max_concurrency` calls are in flight for this request, and the
+        provider-wide semaphore bounds calls across all requests. In batch
+        mode several texts are packed into each call under
+        LLM_BATCH_TOKEN_BUDGET.
+
+        With `return_exceptions`, a text whose call still fails after retries
+        gets its exception in place of a result instead of failing the rest.
+        With a `codebook`, each prompt lists the CODEBOOK_TOP_K existing codes
+        most relevant to its text so the model can reuse them.
+        """
+        if not texts:
+            return []
+        if batch_mode:
+            batches = [
+                [(str(index), texts[index]) for index in batch]
+                for batch in pack_batches(
+                    texts, settings.LLM_BATCH_TOKEN_BUDGET, settings.LLM_BATCH_MAX_SEGMENTS)
+            ]
+            outputs: Dict[str, Union[CodeOutput, Exception]] = {}
+            batch_results = self._fan_out(
+                lambda batch: self._code_batch_with_split(batch, codebook),
+                batches, max_concurrency, return_exceptions)
+            for batch, batch_outputs in zip(batches, batch_results):
+                if isinstance(batch_outputs, Exception):
+                    batch_outputs = {segment_id: batch_outputs for segment_id, _ in batch}
+                outputs.update(batch_outputs)
+            return [outputs[str(index)] for index in range(len(texts))]
+        return self._fan_out(
+            lambda text: self.code_text(text, self.codebook_context(codebook, text)),
+            texts, max_concurrency, return_exceptions)
+
+    @staticmethod
+    def _fan_out(
+        fn: Callable[[T], R],
+        inputs: List[T],
+        max_concurrency: Optional[int],
+        return_exceptions: bool = False
+    ) -> List[Union[R, Exception]]:
+        """
+        Apply `fn` to `inputs` on a bounded thread pool, preserving order.
+
+        Each call runs in a copy of the caller's context, so per-run
+        metrics (see `track_run`) follow the work onto the pool threads.
+        """
+        if return_exceptions:
+            call = fn
+
+            def fn(item: T) -> Union[R, Exception]:
+                try:
+                    return call(item)
+                except Exception as e:
+                    return e
+
+        workers = max(1, min(max_concurrency or settings.LLM_MAX_CONCURRENCY, len(inputs)))
+        if workers == 1:
+            return [fn(item) for item in inputs]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, fn, item) for item in inputs
+            ]
+            return [future.result() for future in futures]
+
+    def code_texts_cached(
+        self,
+        db: Session,
+        texts: List[str],
+        max_concurrency: Optional[int] = None,
+        batch_mode: bool = False,
+        return_exceptions: bool = False,
+        codebook: Optional[CodebookIndex] = None,
+        scope: Optional[str] = None
+    ) -> List[Union[CodeOutput, Exception]]:
+        """
+        Like `code_texts`, but serves repeated inputs from the response cache.
+
+        Identical texts within one call are only sent to the model once.
+        Failed calls are never cached. The key does not depend on the
+        codebook's contents (see `cache_key`), so re-runs hit even after
+        codes were added, but with a `codebook` the `scope` (its project)
+        is required and entries are only shared within it.
+
+        With LLM_SINGLE_FLIGHT_ENABLED, a miss already being fetched by
+        another concurrent call in this process (e.g. two users coding
+        overlapping documents of a project) is not sent again: this call
+        waits for that request and shares its result, including its failure.
+        Calls are merged on their cache keys, so never across scopes.
+        """
+        if codebook is not None and scope is None:
+            raise ValueError("A codebook-aware call needs a cache scope")
+        keys = [self.cache_key(text, batch_mode, scope) for text in texts]
+        outputs: Dict[str, CodeOutput] = LLMCacheService.get_many(db, keys, CodeOutput)
+
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in outputs and key not in pending:
+                pending[key] = text
+
+        single_flight = get_single_flight() if settings.LLM_SINGLE_FLIGHT_ENABLED else None
+        if single_flight is not None:
+            led, waiting = single_flight.claim(pending)
+        else:
+            led, waiting = list(pending), {}
+
+        if led:
+            fresh_by_key: Dict[str, Union[CodeOutput, Exception]] = {}
+            error: Optional[Exception] = None
+            try:
+                fresh = self.code_texts(
+                    [pending[key] for key in led], max_concurrency=max_concurrency,
+                    batch_mode=batch_mode, return_exceptions=return_exceptions,
+                    codebook=codebook)
+                fresh_by_key.update(zip(led, fresh))
+                LLMCacheService.set_many(
+                    db, self.provider, self.model_name,
+                    (batch_system_message if batch_mode else system_message) + codebook_message,
+                    {key: (pending[key], output) for key, output in fresh_by_key.items()
+                     if not isinstance(output, Exception)}
+                )
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                # Waiters must never hang, whatever happened to this call
+                if single_flight is not None:
+                    single_flight.resolve({key: fresh_by_key.get(key, error) for key in led})
+            outputs.update(fresh_by_key)
+
+        for key, future in waiting.items():
+            output = future.result()
+            if isinstance(output, Exception) and not return_exceptions:
+                raise output
+            outputs[key] = output
+
+        return [outputs[key] for key in keys]
 
 if __name__ == "__main__":
     # Trial
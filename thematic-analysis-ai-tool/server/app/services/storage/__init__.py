@@ -0,0 +1,26 @@
+"""
+Storage services module.
+
+This module provides the blob storage that holds uploaded document files:
+- A storage backend interface with Cloudinary and local-filesystem backends
+- Content-addressed keys, so a file stored twice is written once
+- Background upload of staged files with retries, off the request path
+"""
+
+from .base import StorageBackend
+from .local import LocalStorageBackend
+from .cloudinary_backend import CloudinaryStorageBackend
+from .uploads import (
+    StorageUploadService, StorageUploadWorkerPool, get_storage, staging_host, storage_upload_pool
+)
+
+__all__ = [
+    'StorageBackend',
+    'LocalStorageBackend',
+    'CloudinaryStorageBackend',
+    'StorageUploadService',
+    'StorageUploadWorkerPool',
+    'get_storage',
+    'staging_host',
+    'storage_upload_pool',
+]
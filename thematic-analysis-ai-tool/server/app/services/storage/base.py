@@ -0,0 +1,22 @@
+"""
+Interface of the blob stores that hold uploaded document files
+"""
+from typing import BinaryIO, Tuple
+
+
+class StorageBackend:
+    """
+    A store of files by key. Keys are content-addressed
+    ("documents/<project_id>/<sha256>"), so saving a key twice stores the
+    same bytes and backends may skip the second write.
+    """
+
+    name: str = ""
+
+    def save(self, file: BinaryIO, key: str) -> Tuple[str, str]:
+        """Store a binary file under `key`; returns its (public id, URL). The file is left open"""
+        raise NotImplementedError
+
+    def delete(self, public_id: str) -> None:
+        """Remove a stored file; removing a missing file is not an error"""
+        raise NotImplementedError
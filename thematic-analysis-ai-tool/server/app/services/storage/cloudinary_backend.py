@@ -0,0 +1,67 @@
+"""
+Storage of document files in Cloudinary
+"""
+from typing import BinaryIO, Tuple
+import threading
+
+import cloudinary
+import cloudinary.uploader
+
+from app.core.config import settings
+from .base import StorageBackend
+
+
+class _Unclosed:
+    """A file whose `with` block does not close it: upload_large closes the file it is given"""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self) -> "_Unclosed":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+class CloudinaryStorageBackend(StorageBackend):
+    """Raw Cloudinary uploads; the client is configured on first use, not at import"""
+
+    name = "cloudinary"
+
+    def __init__(self):
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def _configure(self) -> None:
+        with self._lock:
+            if self._configured:
+                return
+            if not (settings.CLOUDINARY_CLOUD_NAME and settings.CLOUDINARY_API_KEY
+                    and settings.CLOUDINARY_API_SECRET):
+                raise ValueError("Cloudinary storage is not configured")
+            cloudinary.config(
+                cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+                api_key=settings.CLOUDINARY_API_KEY,
+                api_secret=settings.CLOUDINARY_API_SECRET
+            )
+            self._configured = True
+
+    def save(self, file: BinaryIO, key: str) -> Tuple[str, str]:
+        self._configure()
+        # Sent in chunks for large files
+        result = cloudinary.uploader.upload_large(
+            _Unclosed(file),
+            resource_type="raw",
+            public_id=key,
+            use_filename=True,
+            unique_filename=False
+        )
+        return result["public_id"], result["secure_url"]
+
+    def delete(self, public_id: str) -> None:
+        self._configure()
+        cloudinary.uploader.destroy(public_id, resource_type="raw")
@@ -0,0 +1,39 @@
+"""
+Storage of document files in a local directory
+"""
+from typing import BinaryIO, Tuple
+import os
+import pathlib
+import shutil
+import tempfile
+
+from .base import StorageBackend
+
+
+class LocalStorageBackend(StorageBackend):
+    """Files under a root directory at their keys; a key that is already stored is not rewritten"""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = pathlib.Path(root).resolve()
+
+    def path(self, key: str) -> pathlib.Path:
+        """Where `key` is stored"""
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def save(self, file: BinaryIO, key: str) -> Tuple[str, str]:
+        path = self.path(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside and renamed, so a file at `path` is always complete
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as partial:
+                shutil.copyfileobj(file, partial)
+            os.replace(partial.name, path)
+        return key, path.as_uri()
+
+    def delete(self, public_id: str) -> None:
+        self.path(public_id).unlink(missing_ok=True)
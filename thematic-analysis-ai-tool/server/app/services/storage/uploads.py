@@ -0,0 +1,278 @@
+"""
+Background upload of document files to the storage backend
+
+Uploads are staged on local disk during the request and the document is
+created as PENDING, so its segments are stored without waiting on the
+backend. Worker threads poll for pending documents staged on their own
+host, upload the staged file and retry failures with exponential
+backoff; after STORAGE_UPLOAD_MAX_ATTEMPTS the document is marked FAILED.
+"""
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from typing import BinaryIO, Dict, Optional
+import datetime
+import socket
+import threading
+import time
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, StorageStatus
+from .base import StorageBackend
+from .cloudinary_backend import CloudinaryStorageBackend
+from .local import LocalStorageBackend
+
+_backends: Dict[str, StorageBackend] = {}
+_backends_lock = threading.Lock()
+_staging = LocalStorageBackend(settings.STORAGE_STAGING_DIR)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def staging_host() -> str:
+    """Name of this host's staging directory in documents' storage_staging_host"""
+    return settings.STORAGE_STAGING_HOST or socket.gethostname()
+
+
+def get_storage(name: Optional[str] = None) -> StorageBackend:
+    """The storage backend called `name`, STORAGE_BACKEND by default"""
+    name = name or settings.STORAGE_BACKEND
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == "cloudinary":
+                backend = CloudinaryStorageBackend()
+            elif name == "local":
+                backend = LocalStorageBackend(settings.UPLOAD_FOLDER)
+            else:
+                raise ValueError(f"Unknown storage backend: {name}")
+            _backends[name] = backend
+        return backend
+
+
+class StorageUploadService:
+    """Staging of uploaded files and their upload to the storage backend"""
+
+    @staticmethod
+    def stage(file: BinaryIO, key: str) -> None:
+        """Keep a copy of an uploaded file until it is stored; the file is rewound afterwards"""
+        _staging.save(file, key)
+        file.seek(0)
+
+    @staticmethod
+    def discard_staged(key: str) -> None:
+        _staging.delete(key)
+
+    @staticmethod
+    def claim_next_upload(db: Session) -> Optional[int]:
+        """
+        Claim the oldest pending upload that is due and staged on this host,
+        by pushing its next attempt STORAGE_UPLOAD_LEASE_SECONDS ahead: if
+        the worker dies mid-upload, the document becomes due again once the
+        lease expires. Documents staged before hosts were recorded are
+        claimed by any host.
+        """
+        now = _utcnow()
+        document = db.query(Document).filter(
+            Document.storage_status == StorageStatus.PENDING,
+            or_(Document.storage_staging_host == staging_host(),
+                Document.storage_staging_host.is_(None)),
+            or_(Document.storage_retry_at.is_(None), Document.storage_retry_at <= now)
+        ).order_by(Document.id).with_for_update(skip_locked=True).first()
+        if document is None:
+            return None
+        document.storage_retry_at = now + datetime.timedelta(
+            seconds=settings.STORAGE_UPLOAD_LEASE_SECONDS)
+        db.commit()
+        return document.id
+
+    @staticmethod
+    def upload_document(db: Session, document_id: int) -> bool:
+        """
+        One attempt to store a pending document's staged file. Returns True
+        if the file is stored, False if the attempt failed.
+
+        A file already stored for another document is not sent again: the
+        document shares its copy, even if its staged file is gone.
+        """
+        document = db.query(Document).filter(Document.id == document_id).first()
+        if document is None or document.storage_status != StorageStatus.PENDING:
+            return True
+        key = document.cloudinary_public_id
+        stored = StorageUploadService._stored_copy(db, document)
+        if stored is not None:
+            public_id, url = stored
+            StorageUploadService._mark_stored(db, document, key, public_id, url)
+            return True
+
+        document.storage_attempts += 1
+        document.storage_retry_at = _utcnow() + datetime.timedelta(
+            seconds=settings.STORAGE_UPLOAD_LEASE_SECONDS)
+        db.commit()
+        try:
+            backend = get_storage(document.storage_backend)
+            with _LeaseRenewal(document_id, document.storage_attempts), \
+                    open(_staging.path(key), "rb") as file:
+                public_id, url = backend.save(file, key)
+        except Exception as e:
+            db.refresh(document)
+            if document.storage_status == StorageStatus.STORED:
+                # A copy of the same file was stored meanwhile
+                return True
+            if document.storage_attempts >= settings.STORAGE_UPLOAD_MAX_ATTEMPTS:
+                document.storage_status = StorageStatus.FAILED
+                document.storage_retry_at = None
+            else:
+                document.storage_retry_at = _utcnow() + datetime.timedelta(
+                    seconds=settings.STORAGE_UPLOAD_RETRY_BASE_DELAY_SECONDS
+                    * 2 ** (document.storage_attempts - 1))
+            document.storage_error = str(e)
+            db.commit()
+            print(f"Storage upload of document {document_id} failed "
+                  f"(attempt {document.storage_attempts}): {str(e)}")
+            return False
+
+        StorageUploadService._mark_stored(db, document, key, public_id, url)
+        return True
+
+    @staticmethod
+    def _stored_copy(db: Session, document: Document) -> Optional[tuple]:
+        """(public id, URL) of the same file already stored for another document of the project"""
+        if document.file_hash is None:
+            return None
+        return db.query(Document.cloudinary_public_id, Document.cloudinary_url).filter(
+            Document.project_id == document.project_id,
+            Document.file_hash == document.file_hash,
+            Document.storage_backend == document.storage_backend,
+            Document.storage_status == StorageStatus.STORED,
+            Document.id != document.id
+        ).order_by(Document.id).first()
+
+    @staticmethod
+    def _mark_stored(db: Session, document: Document, key: str, public_id: str, url: str) -> None:
+        """Mark every pending document with this staged file as stored and drop the file"""
+        # Deduplicated clones share the file
+        db.query(Document).filter(
+            Document.cloudinary_public_id == key,
+            Document.storage_backend == document.storage_backend,
+            Document.storage_status == StorageStatus.PENDING
+        ).update({
+            Document.cloudinary_public_id: public_id,
+            Document.cloudinary_url: url,
+            Document.storage_status: StorageStatus.STORED,
+            Document.storage_error: None,
+            Document.storage_retry_at: None,
+        }, synchronize_session=False)
+        db.commit()
+        # A new upload of the file may have staged it again and committed its document since;
+        # one committed later finds the stored copy instead (see `upload_document`)
+        if not db.query(Document.id).filter(
+            Document.cloudinary_public_id == key,
+            Document.storage_backend == document.storage_backend,
+            Document.storage_status == StorageStatus.PENDING
+        ).first():
+            _staging.delete(key)
+
+    @staticmethod
+    def upload_now(db: Session, document_id: int) -> bool:
+        """Store a document's file on the calling thread, retrying with backoff"""
+        for attempt in range(settings.STORAGE_UPLOAD_MAX_ATTEMPTS):
+            if StorageUploadService.upload_document(db, document_id):
+                return True
+            if attempt + 1 < settings.STORAGE_UPLOAD_MAX_ATTEMPTS:
+                time.sleep(settings.STORAGE_UPLOAD_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+        return False
+
+
+class _LeaseRenewal:
+    """
+    Thread that keeps pushing a pending document's lease ahead while an
+    upload attempt runs, so an upload slower than the lease is not claimed
+    and sent a second time. It stops renewing once another attempt started.
+    """
+
+    def __init__(self, document_id: int, attempt: int):
+        self.document_id = document_id
+        self.attempt = attempt
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"storage-lease-{document_id}", daemon=True)
+
+    def __enter__(self) -> "_LeaseRenewal":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.STORAGE_UPLOAD_LEASE_SECONDS / 3):
+            try:
+                with SessionLocal() as db:
+                    renewed = db.query(Document).filter(
+                        Document.id == self.document_id,
+                        Document.storage_status == StorageStatus.PENDING,
+                        Document.storage_attempts == self.attempt
+                    ).update({Document.storage_retry_at: _utcnow() + datetime.timedelta(
+                        seconds=settings.STORAGE_UPLOAD_LEASE_SECONDS)}, synchronize_session=False)
+                    db.commit()
+            except Exception as e:
+                print(f"Lease renewal of document {self.document_id} failed: {str(e)}")
+                continue
+            if not renewed:
+                return
+
+
+class StorageUploadWorkerPool:
+    """In-process pool of threads that poll for and run pending storage uploads"""
+
+    def __init__(self, num_workers: int, poll_interval: float):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self) -> None:
+        for index in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._run, name=f"storage-upload-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers: a new upload is pending"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with SessionLocal() as db:
+                    document_id = StorageUploadService.claim_next_upload(db)
+                    if document_id is not None:
+                        StorageUploadService.upload_document(db, document_id)
+                        continue
+            except Exception as e:
+                print(f"Storage upload worker error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+storage_upload_pool = StorageUploadWorkerPool(
+    num_workers=settings.STORAGE_UPLOAD_WORKERS,
+    poll_interval=settings.STORAGE_UPLOAD_POLL_INTERVAL_SECONDS
+)
@@ -0,0 +1,118 @@
+"""
+Sparse hashed TF-IDF vectors and spherical k-means for grouping codes into themes
+"""
+from collections import Counter
+from typing import Dict, List, Tuple
+import math
+import re
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+_TERM = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+_STOPWORDS = frozenset("""
+    about after also and are auto because been being but can code codes could created did
+    does for from had has have her his how its just more most not our out over passages
+    she some such than that the their them then there these they this those through too
+    very was were what when where which while who will with would you your""".split())
+
+
+def terms(text: str) -> List[str]:
+    return [term for term in _TERM.findall(text.lower()) if term not in _STOPWORDS]
+
+
+def hashed_tfidf(documents: List[List[str]], n_features: int) -> Tuple[sparse.csr_matrix, Dict[int, str]]:
+    """
+    L2-normalised TF-IDF matrix of tokenised documents, one row each.
+
+    Terms are hashed into `n_features` columns, so memory does not grow
+    with the vocabulary. Also returns the most frequent term of each used
+    column, to describe clusters in words.
+    """
+    rows: List[int] = []
+    columns: List[int] = []
+    term_counts: Counter = Counter()
+    feature_of: Dict[str, int] = {}
+    for row, tokens in enumerate(documents):
+        term_counts.update(tokens)
+        for token in tokens:
+            feature = feature_of.get(token)
+            if feature is None:
+                feature = feature_of[token] = zlib.crc32(token.encode("utf-8")) % n_features
+            rows.append(row)
+            columns.append(feature)
+
+    counts = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(documents), n_features)
+    )
+    counts.sum_duplicates()
+    counts.data = np.log1p(counts.data)
+
+    document_frequency = np.bincount(counts.indices, minlength=n_features)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1.0
+    matrix = counts.multiply(idf.astype(np.float32)).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+    feature_terms: Dict[int, str] = {}
+    best: Dict[int, int] = {}
+    for term, count in term_counts.items():
+        feature = feature_of[term]
+        if count > best.get(feature, 0):
+            best[feature] = count
+            feature_terms[feature] = term
+    return matrix, feature_terms
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def spherical_kmeans(
+    matrix: sparse.csr_matrix, k: int, iterations: int = 25, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster L2-normalised rows by cosine similarity.
+
+    Centroids are seeded with k-means++ and kept dense (k x features);
+    rows stay sparse, so each iteration costs one sparse-dense product.
+    Returns (labels, centroids).
+    """
+    n = matrix.shape[0]
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ seeding on cosine distance
+    chosen = [int(rng.integers(n))]
+    closest = np.asarray(matrix.dot(matrix[chosen[0]].T).todense()).ravel()
+    while len(chosen) < k:
+        distance = np.clip(1.0 - closest, 0.0, None)
+        total = distance.sum()
+        if total <= 0:
+            break
+        candidate = int(rng.choice(n, p=distance / total))
+        chosen.append(candidate)
+        closest = np.maximum(closest, np.asarray(matrix.dot(matrix[candidate].T).todense()).ravel())
+    centroids = np.asarray(matrix[chosen].todense())
+
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        similarity = np.asarray(matrix.dot(centroids.T))
+        new_labels = similarity.argmax(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        membership = sparse.csr_matrix(
+            (np.ones(n, dtype=np.float32), (labels, np.arange(n))), shape=(len(centroids), n))
+        centroids = _normalise_rows(np.asarray(membership.dot(matrix).todense()))
+    return labels, centroids
+
+
+def default_cluster_count(n_codes: int, max_clusters: int) -> int:
+    """Rule of thumb sqrt(n / 2), at least 2 and at most `max_clusters`"""
+    return max(2, min(max_clusters, round(math.sqrt(n_codes / 2))))
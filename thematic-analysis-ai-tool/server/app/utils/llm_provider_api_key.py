@@ -3,6 +3,9 @@ from app.core.config import settings
 def get_llm_provider_api_key(provider: str) -> str:
     if(provider == "google_genai"):
         return settings.GOOGLE_API_KEY
+    elif(provider == "local"):
+        # Built-in offline model, no key needed
+        return ""
     # elif(provider == "openai"):
     #     return settings.OPENAI_API_KEY
     # elif(provider == "anthropic"):
@@ -10,4 +13,4 @@ def get_llm_provider_api_key(provider: str) -> str:
     # elif(provider == "groq"):
     #     return settings.GROQ_API_KEY
     else:
-        raise ValueError(f"Unsupported LLM provider: {provider}. Supported providers are: google_genai, openai, anthropic, groq.")
\ No newline at end of file
+        raise ValueError(f"Unsupported LLM provider: {provider}. Supported providers are: google_genai, local.")
\ No newline at end of file
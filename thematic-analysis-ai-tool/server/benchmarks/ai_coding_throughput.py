@@ -0,0 +1,61 @@
+"""
+Throughput of AI coding against a live provider, the local model or a cassette.
+
+Record real provider responses once, then replay them offline:
+
+    python -m benchmarks.ai_coding_throughput segments.txt --provider google_genai \
+        --model gemini-2.0-flash --cassette record
+    python -m benchmarks.ai_coding_throughput segments.txt --provider google_genai \
+        --model gemini-2.0-flash --cassette replay --latency-scale 0.5
+
+Each non-empty line of the input file is one segment. The response cache is
+bypassed, so every run sends every segment.
+"""
+import argparse
+import time
+
+from app.core.config import settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("segments", help="text file with one segment per line")
+    parser.add_argument("--provider", default="local")
+    parser.add_argument("--model", default="local-deterministic")
+    parser.add_argument("--concurrency", type=int, default=settings.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--batch", action="store_true", help="pack several segments per call")
+    parser.add_argument("--cassette", choices=["off", "record", "replay"], default="off")
+    parser.add_argument("--cassette-path", default=settings.LLM_CASSETTE_PATH)
+    parser.add_argument("--latency-scale", type=float, default=settings.LLM_CASSETTE_LATENCY_SCALE)
+    args = parser.parse_args()
+
+    # Before the service is built: it picks up the cassette on construction
+    settings.LLM_CASSETTE_MODE = args.cassette
+    settings.LLM_CASSETTE_PATH = args.cassette_path
+    settings.LLM_CASSETTE_LATENCY_SCALE = args.latency_scale
+    settings.LOCAL_LLM_ENABLED = True
+
+    from app.services.llm import get_call_stats, get_cassette
+    from app.services.llm_service import LLMService
+
+    with open(args.segments, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    service = LLMService.get_instance(model_name=args.model, provider=args.provider)
+    started = time.perf_counter()
+    outputs = service.code_texts(
+        texts, max_concurrency=args.concurrency, batch_mode=args.batch, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    failures = sum(isinstance(output, Exception) for output in outputs)
+    print(f"{len(texts)} segments in {elapsed:.2f}s "
+          f"({len(texts) / elapsed if elapsed else 0.0:.1f} segments/s), {failures} failed")
+    print(get_call_stats(args.provider, args.model).snapshot())
+    cassette = get_cassette()
+    if cassette is not None and cassette.recording:
+        cassette.flush()
+        print(f"Recorded responses to {cassette.path}")
+
+
+if __name__ == "__main__":
+    main()
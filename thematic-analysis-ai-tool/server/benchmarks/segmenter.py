@@ -0,0 +1,59 @@
+"""
+Time line segmentation of transcripts of 10k, 100k and 1M lines.
+
+    python -m benchmarks.segmenter [--reference]
+
+With --reference, the former quadratic offset computation is timed too, on
+the 10k-line input only (it grows with the square of the line count).
+"""
+import argparse
+import random
+import time
+
+from app.services.document.segmenter import segment_lines
+
+SIZES = (10_000, 100_000, 1_000_000)
+REFERENCE_MAX_LINES = 10_000
+
+
+def transcript(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    speakers = ["Interviewer", "Participant"]
+    words = "I think remote work helps me focus but the meetings run too long".split()
+    return "\n".join(
+        f"{speakers[i % 2]}: " + " ".join(rng.choices(words, k=rng.randint(3, 20)))
+        if i % 7 else "" for i in range(lines)
+    )
+
+
+def reference_offsets(text: str) -> int:
+    lines = text.split('\n')
+    count = 0
+    for i, line in enumerate(lines):
+        if line.strip():
+            _ = sum(len(l) + 1 for l in lines[:i])
+            count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reference", action="store_true",
+                        help=f"also time the quadratic version up to {REFERENCE_MAX_LINES} lines")
+    args = parser.parse_args()
+
+    for size in SIZES:
+        text = transcript(size)
+        started = time.perf_counter()
+        segments = sum(1 for _ in segment_lines(text))
+        elapsed = time.perf_counter() - started
+        print(f"{size:>9} lines: {segments} segments in {elapsed:.3f}s "
+              f"({size / elapsed:,.0f} lines/s)")
+        if args.reference and size <= REFERENCE_MAX_LINES:
+            started = time.perf_counter()
+            reference_offsets(text)
+            print(f"{'':>9}        quadratic reference: {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
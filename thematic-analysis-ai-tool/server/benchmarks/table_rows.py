@@ -0,0 +1,78 @@
+"""
+Time row segmentation of survey exports of 10k, 100k and 1M rows.
+
+    python -m benchmarks.table_rows [--reference]
+
+Each export is read from CSV bytes the way uploads are, in chunks of
+CSV_READ_CHUNK_ROWS rows, and every row is rendered and segmented. With
+--reference, the former DataFrame.iterrows rendering is timed too, on the
+10k- and 100k-row inputs only.
+"""
+import argparse
+import io
+import random
+import time
+
+import pandas as pd
+
+from app.core.config import settings
+from app.services.document.segmenter import segment_rows, table_rows
+
+SIZES = (10_000, 100_000, 1_000_000)
+REFERENCE_MAX_ROWS = 100_000
+
+
+def survey_export(rows: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    regions = ["North", "South", "East", "West", ""]
+    words = "I think remote work helps me focus but the meetings run too long".split()
+    lines = ["respondent_id,age,region,satisfaction,comment"]
+    for i in range(rows):
+        comment = " ".join(rng.choices(words, k=rng.randint(3, 20))) if i % 5 else ""
+        satisfaction = str(rng.randint(1, 5)) if i % 11 else ""
+        lines.append(f"{100000 + i},{rng.randint(18, 80)},{rng.choice(regions)},"
+                     f"{satisfaction},{comment}")
+    return "\n".join(lines).encode("utf-8")
+
+
+def reference_rows(chunk: pd.DataFrame, start: int):
+    for row_index, (_, row) in enumerate(chunk.iterrows()):
+        non_null_values = [
+            f"{col}: {str(value)}" for col, value in row.items() if pd.notna(value)]
+        row_text = f"Row {start + row_index + 1}: " + " | ".join(non_null_values) \
+            if non_null_values else ""
+        yield start + row_index, row_text, row.to_dict()
+
+
+def segment_export(data: bytes, render) -> int:
+    def rows():
+        start = 0
+        for chunk in pd.read_csv(io.BytesIO(data), chunksize=settings.CSV_READ_CHUNK_ROWS):
+            yield from render(chunk, start)
+            start += len(chunk)
+
+    return sum(1 for _ in segment_rows(rows()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reference", action="store_true",
+                        help=f"also time iterrows rendering up to {REFERENCE_MAX_ROWS} rows")
+    args = parser.parse_args()
+
+    for size in SIZES:
+        data = survey_export(size)
+        started = time.perf_counter()
+        segments = segment_export(data, table_rows)
+        elapsed = time.perf_counter() - started
+        print(f"{size:>9} rows: {segments} segments in {elapsed:.3f}s "
+              f"({size / elapsed:,.0f} rows/s)")
+        if args.reference and size <= REFERENCE_MAX_ROWS:
+            started = time.perf_counter()
+            segment_export(data, reference_rows)
+            elapsed = time.perf_counter() - started
+            print(f"{'':>9}       iterrows reference: {elapsed:.3f}s ({size / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -63,3 +63,42 @@ def test_ai_initial_coding():
         assert isinstance(item.get("message"), str), "message should be str"
 
     print("✅ AI initial coding test passed")
+
+
+def _register_and_login(prefix: str) -> dict:
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"{prefix}_{timestamp}",
+        "email": f"{prefix}{timestamp}@example.com",
+        "password": "aipassword123"
+    }
+    resp = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert resp.status_code in (200, 201), f"Registration failed: {resp.text}"
+    resp = requests.post(f"{BASE_URL}/auth/login",
+                         json={"email": user_data["email"], "password": user_data["password"]})
+    assert resp.status_code == 200, f"Login failed: {resp.text}"
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def test_ai_initial_coding_checks_document_access():
+    """Unknown documents and other users' documents are rejected before any LLM call"""
+    owner_headers = _register_and_login("ai_owner")
+    resp = requests.post(f"{BASE_URL}/projects/",
+                         json={"title": "AI Access Project", "description": "Owner only"},
+                         headers=owner_headers)
+    assert resp.status_code in (200, 201), f"Project creation failed: {resp.text}"
+    files = {"file": ("ai_access.txt", "Only the owner may code this.", "text/plain")}
+    data = {"project_id": resp.json()["id"], "name": "AI Access Document"}
+    resp = requests.post(f"{BASE_URL}/documents/",
+                         files=files, data=data, headers=owner_headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    document_id = resp.json()["id"]
+
+    other_headers = _register_and_login("ai_other")
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding",
+                         json=[document_id], headers=other_headers)
+    assert resp.status_code == 404, resp.text
+
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding",
+                         json=[2_000_000_000], headers=owner_headers)
+    assert resp.status_code == 404, resp.text
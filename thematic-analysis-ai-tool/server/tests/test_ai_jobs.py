@@ -0,0 +1,366 @@
+import requests
+import time
+
+from langchain_core.runnables import RunnableLambda
+
+from app.core.config import settings
+from app.services.llm.local_provider import LocalCodingModel
+from app.services.llm_service import LLMService
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def _setup_document() -> tuple[dict, int]:
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"ai_job_user_{timestamp}",
+        "email": f"aijob{timestamp}@example.com",
+        "password": "aijobpassword123"
+    }
+    resp = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert resp.status_code in (200, 201), f"Registration failed: {resp.text}"
+
+    login_data = {"email": user_data["email"],
+                  "password": user_data["password"]}
+    resp = requests.post(f"{BASE_URL}/auth/login", json=login_data)
+    assert resp.status_code == 200, f"Login failed: {resp.text}"
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    project_data = {"title": "AI Job Project",
+                    "description": "Test background AI coding"}
+    resp = requests.post(f"{BASE_URL}/projects/",
+                         json=project_data, headers=headers)
+    assert resp.status_code in (200, 201), f"Project creation failed: {resp.text}"
+    project_id = resp.json().get("id")
+
+    test_content = "First line about remote work.\nSecond line about team meetings."
+    files = {"file": ("ai_job.txt", test_content, "text/plain")}
+    data = {"project_id": project_id, "name": "AI Job Document"}
+    resp = requests.post(f"{BASE_URL}/documents/",
+                         files=files, data=data, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    return headers, resp.json().get("id")
+
+
+def _wait_for_job(job: dict, headers: dict) -> dict:
+    deadline = time.time() + 120
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(1)
+        resp = requests.get(f"{BASE_URL}/ai/jobs/{job['id']}", headers=headers)
+        assert resp.status_code == 200, f"Job status failed: {resp.text}"
+        job = resp.json()
+    return job
+
+
+def test_ai_coding_job_lifecycle():
+    """Start a background AI coding job, poll it to completion"""
+    headers, document_id = _setup_document()
+
+    # The built-in "local" provider runs offline and deterministically (LOCAL_LLM_ENABLED=true)
+    job_request = {"document_ids": [document_id],
+                   "provider": "local", "model_name": "local-deterministic"}
+    resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+    assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+    job = resp.json()
+    assert job["status"] == "queued"
+    assert job["total_segments"] == 2
+
+    job = _wait_for_job(job, headers)
+    assert job["status"] == "succeeded", f"Job did not succeed: {job}"
+    assert job["processed_segments"] == job["total_segments"]
+    assert job["failed_segments"] == 0
+    assert job["result_summary"]["coded_segments"] == 2
+    # LLM usage of the run; cached segments need no calls
+    llm = job["result_summary"]["llm"]
+    assert llm["failures"] == 0
+    assert llm["total_tokens"] == llm["prompt_tokens"] + llm["completion_tokens"]
+
+    # Finished jobs can no longer be cancelled
+    resp = requests.post(f"{BASE_URL}/ai/jobs/{job['id']}/cancel", headers=headers)
+    assert resp.status_code == 409
+
+
+def test_ai_coding_job_resume():
+    """A cancelled job can be resumed with its original parameters"""
+    headers, document_id = _setup_document()
+
+    job_request = {"document_ids": [document_id],
+                   "provider": "local", "model_name": "local-deterministic"}
+    resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+    assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+    job = resp.json()
+
+    resp = requests.post(f"{BASE_URL}/ai/jobs/{job['id']}/cancel", headers=headers)
+    assert resp.status_code == 200, f"Job cancel failed: {resp.text}"
+    job = _wait_for_job(resp.json(), headers)
+    assert job["status"] == "cancelled"
+
+    resp = requests.post(f"{BASE_URL}/ai/jobs/{job['id']}/resume", headers=headers)
+    assert resp.status_code == 202, f"Job resume failed: {resp.text}"
+    job = resp.json()
+    assert job["status"] == "queued"
+    assert job["provider"] == "local"
+    assert job["model_name"] == "local-deterministic"
+
+    job = _wait_for_job(job, headers)
+    assert job["status"] == "succeeded", f"Resumed job did not succeed: {job}"
+    assert job["processed_segments"] == job["total_segments"]
+    assert job["result_summary"]["coded_segments"] == 2
+
+    # Nothing left to resume
+    resp = requests.post(f"{BASE_URL}/ai/jobs/{job['id']}/resume", headers=headers)
+    assert resp.status_code == 409
+
+
+def test_ai_coding_estimate():
+    """A dry run estimates the work without coding anything"""
+    headers, document_id = _setup_document()
+
+    job_request = {"document_ids": [document_id], "incremental": True,
+                   "provider": "local", "model_name": "local-deterministic"}
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding/estimate",
+                         json=job_request, headers=headers)
+    assert resp.status_code == 200, f"Estimate failed: {resp.text}"
+    estimate = resp.json()
+    assert estimate["total_segments"] == 2
+    assert estimate["segments_to_code"] == 2
+    # Scaled down by the cache hit ratio observed so far
+    assert 0 <= estimate["cache_hit_ratio"] <= 1
+    assert estimate["llm_requests"] <= 2
+    assert estimate["estimated_duration_seconds"] >= 0
+
+    # Once coded, an incremental run has nothing left to do
+    resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+    assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+    job = _wait_for_job(resp.json(), headers)
+    assert job["status"] == "succeeded", f"Job did not succeed: {job}"
+
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding/estimate",
+                         json=job_request, headers=headers)
+    assert resp.status_code == 200, f"Estimate failed: {resp.text}"
+    estimate = resp.json()
+    assert estimate["skipped_segments"] == 2
+    assert estimate["llm_requests"] == 0
+
+
+def test_ai_coding_job_access():
+    """Jobs require access to every document"""
+    headers, _ = _setup_document()
+    resp = requests.post(f"{BASE_URL}/ai/jobs",
+                         json={"document_ids": [999999999]}, headers=headers)
+    assert resp.status_code == 404
+
+    resp = requests.get(f"{BASE_URL}/ai/jobs/999999999", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_ai_coding_selected_columns():
+    """Only the selected columns of CSV rows are sent to the model"""
+    headers, document_id = _setup_document()
+    resp = requests.get(f"{BASE_URL}/documents/{document_id}", headers=headers)
+    project_id = resp.json()["project_id"]
+
+    csv_text = ("respondent_id,age,comment\n"
+                "1001,34,I enjoy working remotely\n"
+                "1002,41, \n"
+                "1003,29,Meetings take too long\n"
+                "1004,52,\n")
+    files = {"file": ("survey.csv", csv_text, "text/csv")}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files,
+                         data={"project_id": project_id}, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    csv_id = resp.json()["id"]
+
+    estimate_request = {"document_ids": [csv_id],
+                        "provider": "local", "model_name": "local-deterministic"}
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding/estimate",
+                         json=estimate_request, headers=headers)
+    assert resp.status_code == 200, f"Estimate failed: {resp.text}"
+    whole_rows = resp.json()
+    assert whole_rows["segments_to_code"] == 4
+
+    resp = requests.put(f"{BASE_URL}/documents/{csv_id}",
+                        json={"coding_columns": ["missing"]}, headers=headers)
+    assert resp.status_code == 400
+    resp = requests.put(f"{BASE_URL}/documents/{document_id}",
+                        json={"coding_columns": ["comment"]}, headers=headers)
+    assert resp.status_code == 400
+
+    resp = requests.put(f"{BASE_URL}/documents/{csv_id}",
+                        json={"coding_columns": ["comment"]}, headers=headers)
+    assert resp.status_code == 200, f"Column selection failed: {resp.text}"
+    assert resp.json()["file_metadata"]["coding_columns"] == ["comment"]
+
+    # The rows with a blank or empty comment are skipped
+    resp = requests.post(f"{BASE_URL}/ai/initial-coding/estimate",
+                         json=estimate_request, headers=headers)
+    assert resp.status_code == 200, f"Estimate failed: {resp.text}"
+    selected = resp.json()
+    assert selected["segments_to_code"] == 2
+    assert selected["skipped_segments"] == 2
+
+    resp = requests.post(f"{BASE_URL}/ai/jobs", json=estimate_request, headers=headers)
+    assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+    job = _wait_for_job(resp.json(), headers)
+    assert job["status"] == "succeeded", f"Job did not succeed: {job}"
+    assert job["processed_segments"] == 4
+    assert job["result_summary"]["coded_segments"] == 2
+
+
+
+def test_ai_coding_concurrent_jobs():
+    """Concurrent jobs over identical segments both succeed"""
+    headers, first_id = _setup_document()
+    resp = requests.get(f"{BASE_URL}/documents/{first_id}", headers=headers)
+    project_id = resp.json()["project_id"]
+
+    # Same text as the first document, so both jobs request identical prompts
+    test_content = "First line about remote work.\nSecond line about team meetings."
+    files = {"file": ("ai_job_copy.txt", test_content, "text/plain")}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files,
+                         data={"project_id": project_id}, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    second_id = resp.json()["id"]
+
+    jobs = []
+    for document_id in (first_id, second_id):
+        job_request = {"document_ids": [document_id],
+                       "provider": "local", "model_name": "local-deterministic"}
+        resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+        assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+        jobs.append(resp.json())
+    for job in jobs:
+        job = _wait_for_job(job, headers)
+        assert job["status"] == "succeeded", f"Job did not succeed: {job}"
+        assert job["result_summary"]["coded_segments"] == 2
+
+    resp = requests.get(f"{BASE_URL}/ai/cache/stats", headers=headers)
+    assert resp.status_code == 200
+    single_flight = resp.json()["single_flight"]
+    assert single_flight["in_flight"] == 0
+    assert single_flight["coalesced"] >= 0
+
+
+def test_ai_metrics():
+    """LLM metrics report latency histograms and token usage per model"""
+    headers, document_id = _setup_document()
+    resp = requests.get(f"{BASE_URL}/documents/{document_id}", headers=headers)
+    project_id = resp.json()["project_id"]
+
+    # Text never coded before, so the job cannot be served from the cache
+    test_content = f"Metrics line {time.time_ns()} about workload and deadlines."
+    files = {"file": ("metrics.txt", test_content, "text/plain")}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files,
+                         data={"project_id": project_id}, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+
+    job_request = {"document_ids": [resp.json()["id"]],
+                   "provider": "local", "model_name": "local-deterministic"}
+    resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+    assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+    job = _wait_for_job(resp.json(), headers)
+    assert job["result_summary"]["llm"]["calls"] == 1
+
+    resp = requests.get(f"{BASE_URL}/ai/metrics", headers=headers)
+    assert resp.status_code == 200, f"Metrics failed: {resp.text}"
+    metrics = resp.json()
+    local = metrics["models"]["local:local-deterministic"]
+    assert local["calls"] > 0
+    assert local["latency_histogram"]["+Inf"] == local["calls"]
+    assert local["prompt_tokens"] > 0
+    assert metrics["totals"]["calls"] >= local["calls"]
+    assert "hit_ratio" in metrics["cache"]
+
+
+def _local_service() -> LLMService:
+    # A private instance: patching methods on the shared one would leak into other tests
+    settings.LOCAL_LLM_ENABLED = True
+    return LLMService(model_name="local-deterministic", provider="local")
+
+
+def test_ai_coding_batch_mode_job():
+    """Batch mode codes several segments per call and caches them under batch keys"""
+    headers, document_id = _setup_document()
+    resp = requests.get(f"{BASE_URL}/documents/{document_id}", headers=headers)
+    project_id = resp.json()["project_id"]
+
+    # Text never coded before, so the first job cannot be served from the cache
+    stamp = time.time_ns()
+    test_content = "\n".join([
+        f"Batch line {stamp} about flexible schedules.",
+        f"Batch line {stamp} about commuting costs.",
+        f"Batch line {stamp} about office friendships.",
+    ])
+    files = {"file": ("batch.txt", test_content, "text/plain")}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files,
+                         data={"project_id": project_id}, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    batch_document_id = resp.json()["id"]
+
+    def run(batch_mode: bool) -> dict:
+        job_request = {"document_ids": [batch_document_id], "batch_mode": batch_mode,
+                       "provider": "local", "model_name": "local-deterministic"}
+        resp = requests.post(f"{BASE_URL}/ai/jobs", json=job_request, headers=headers)
+        assert resp.status_code == 202, f"Job creation failed: {resp.text}"
+        job = _wait_for_job(resp.json(), headers)
+        assert job["status"] == "succeeded", f"Job did not succeed: {job}"
+        assert job["result_summary"]["coded_segments"] == 3
+        return job["result_summary"]["llm"]
+
+    # All three segments fit in one prompt
+    assert run(batch_mode=True)["calls"] == 1
+    # Served from the cache under the batch prompt's keys
+    assert run(batch_mode=True)["calls"] == 0
+    # The single-segment prompt has keys of its own
+    assert run(batch_mode=False)["calls"] == 3
+
+
+def test_batch_output_is_mapped_by_segment_id(monkeypatch):
+    """Items are matched to segments by id, whatever order the model returns them in"""
+    service = _local_service()
+    texts = ["Remote work saves commuting time.", "Meetings interrupt deep focus.",
+             "Salary reviews feel arbitrary."]
+    batch_coding = service.batch_coding_llm
+
+    def reversed_items(inputs):
+        response = batch_coding.invoke(inputs)
+        response["parsed"].items.reverse()
+        return response
+
+    monkeypatch.setattr(service, "batch_coding_llm", RunnableLambda(reversed_items))
+    monkeypatch.setattr(service, "cassette", None)
+    outputs = service.code_texts(texts, batch_mode=True)
+    assert [output.code for output in outputs] == \
+        [LocalCodingModel.code(text).code for text in texts]
+
+
+def test_invalid_batch_output_is_split(monkeypatch):
+    """A batch whose output misses a segment is halved until every segment is coded"""
+    service = _local_service()
+    texts = ["Remote work saves commuting time.", "Meetings interrupt deep focus.",
+             "Salary reviews feel arbitrary.", "Onboarding lacked documentation."]
+    batch_coding = service.batch_coding_llm
+    batch_sizes = []
+
+    def drop_last_item(inputs):
+        response = batch_coding.invoke(inputs)
+        batch_sizes.append(len(response["parsed"].items))
+        response["parsed"].items.pop()
+        return response
+
+    single_texts = []
+    code_text = service.code_text
+
+    def counting_code_text(text, *args, **kwargs):
+        single_texts.append(text)
+        return code_text(text, *args, **kwargs)
+
+    monkeypatch.setattr(service, "batch_coding_llm", RunnableLambda(drop_last_item))
+    monkeypatch.setattr(service, "code_text", counting_code_text)
+    monkeypatch.setattr(service, "cassette", None)
+    outputs = service.code_texts(texts, batch_mode=True, max_concurrency=1)
+    assert [output.code for output in outputs] == \
+        [LocalCodingModel.code(text).code for text in texts]
+    # 4 -> 2 + 2 -> 1 + 1 + 1 + 1
+    assert batch_sizes == [4, 2, 2]
+    assert sorted(single_texts) == sorted(texts)
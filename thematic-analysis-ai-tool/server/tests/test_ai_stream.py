@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+
+import requests
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user import User
+from app.schemas.ai_coding import AICodingRequest
+from app.services.ai_coding_stream_service import AICodingStreamService
+from app.services.llm_service import LLMService
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def _setup_document(content: str) -> tuple[dict, str, int]:
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"ai_stream_user_{timestamp}",
+        "email": f"aistream{timestamp}@example.com",
+        "password": "aistreampassword123"
+    }
+    resp = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert resp.status_code in (200, 201), f"Registration failed: {resp.text}"
+    resp = requests.post(f"{BASE_URL}/auth/login",
+                         json={"email": user_data["email"], "password": user_data["password"]})
+    assert resp.status_code == 200, f"Login failed: {resp.text}"
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    resp = requests.post(f"{BASE_URL}/projects/",
+                         json={"title": "AI Stream Project", "description": "SSE coding"},
+                         headers=headers)
+    assert resp.status_code in (200, 201), f"Project creation failed: {resp.text}"
+    files = {"file": ("ai_stream.txt", content, "text/plain")}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files,
+                         data={"project_id": resp.json()["id"]}, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    return headers, user_data["email"], resp.json()["id"]
+
+
+def _parse_events(text: str) -> list[tuple[str, dict]]:
+    events = []
+    for message in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_ai_coding_stream_endpoint():
+    """The endpoint streams one result per segment and a final summary"""
+    stamp = time.time_ns()
+    headers, _, document_id = _setup_document(
+        f"Stream line {stamp} about remote work.\nStream line {stamp} about team meetings.")
+    request = {"document_ids": [document_id],
+               "provider": "local", "model_name": "local-deterministic"}
+    with requests.post(f"{BASE_URL}/ai/initial-coding/stream", json=request,
+                       headers=headers, stream=True, timeout=120) as resp:
+        assert resp.status_code == 200, resp.text
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = _parse_events(resp.text)
+
+    names = [event for event, _ in events]
+    assert names.count("result") == 2
+    assert names[-1] == "summary"
+    summary = events[-1][1]
+    assert summary["status"] == "succeeded"
+    assert summary["coded_segments"] == 2
+    assert summary["failed_segments"] == 0
+    assert summary["llm"]["calls"] == 2
+
+
+def test_ai_coding_stream_heartbeats_and_errors(monkeypatch):
+    """Heartbeats are sent while the model is busy, and a failing segment gets an error event"""
+    stamp = time.time_ns()
+    _, email, document_id = _setup_document(
+        f"Stream line {stamp} about remote work.\nStream line {stamp} that will FAIL.")
+    monkeypatch.setattr(settings, "AI_STREAM_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LOCAL_LLM_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    code_text = LLMService.code_text
+
+    def slow_code_text(self, text, *args, **kwargs):
+        time.sleep(0.3)
+        if "FAIL" in text:
+            raise ValueError("Model refused the segment")
+        return code_text(self, text, *args, **kwargs)
+
+    monkeypatch.setattr(LLMService, "code_text", slow_code_text)
+    with SessionLocal() as db:
+        user_id = db.query(User.id).filter(User.email == email).scalar()
+    request = AICodingRequest(document_ids=[document_id], max_concurrency=1,
+                              provider="local", model_name="local-deterministic")
+
+    async def consume() -> list[str]:
+        return [message async for message in AICodingStreamService.stream_code(request, user_id)]
+
+    events = _parse_events("".join(asyncio.run(consume())))
+    names = [event for event, _ in events]
+    assert "heartbeat" in names
+    assert names.count("result") == 1
+    errors = [data for event, data in events if event == "error"]
+    assert len(errors) == 1
+    assert errors[0]["segment_id"] is not None
+    assert "Model refused the segment" in errors[0]["error"]
+    summary = events[-1][1]
+    assert names[-1] == "summary"
+    assert (summary["status"], summary["coded_segments"], summary["failed_segments"]) == \
+        ("succeeded", 1, 1)
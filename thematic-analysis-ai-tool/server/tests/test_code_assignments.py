@@ -200,4 +200,122 @@ if __name__ == "__main__":
     if success:
         print("\n✅ Code assignment implementation is working correctly!")
     else:
-        print("\n❌ Some tests failed - check the output above")
\ No newline at end of file
+        print("\n❌ Some tests failed - check the output above")
+
+def _setup_document(content: str) -> tuple[int, int, int]:
+    """(user id, project id, document id) of a new user's uploaded text document"""
+    from app.db.session import SessionLocal
+    from app.models.user import User
+
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"bulk_user_{timestamp}",
+        "email": f"bulktest{timestamp}@example.com",
+        "password": "bulkpassword123"
+    }
+    response = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert response.status_code in (200, 201), f"Registration failed: {response.text}"
+    response = requests.post(f"{BASE_URL}/auth/login",
+                             json={"email": user_data["email"], "password": user_data["password"]})
+    assert response.status_code == 200, f"Login failed: {response.text}"
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = requests.post(f"{BASE_URL}/projects/",
+                             json={"title": "Bulk Assignment Project", "description": "Chunks"},
+                             headers=headers)
+    assert response.status_code in (200, 201), f"Project creation failed: {response.text}"
+    project_id = response.json()["id"]
+    files = {"file": ("bulk.txt", content, "text/plain")}
+    response = requests.post(f"{BASE_URL}/documents/", files=files,
+                             data={"project_id": project_id}, headers=headers)
+    assert response.status_code in (200, 201), f"Document upload failed: {response.text}"
+    with SessionLocal() as db:
+        user_id = db.query(User.id).filter(User.email == user_data["email"]).scalar()
+    return user_id, project_id, response.json()["id"]
+
+
+def test_bulk_assignment_matches_codes_ignoring_spacing():
+    """An existing code is reused whatever the case and spacing of the requested name"""
+    from app.db.session import SessionLocal
+    from app.models.code import Code
+    from app.models.document_segment import DocumentSegment
+    from app.services.code_assignment_service import (
+        CodeAssignmentService, SmartQuoteCodeAssignment
+    )
+
+    user_id, project_id, document_id = _setup_document("Remote work saves commuting time.")
+    with SessionLocal() as db:
+        existing = Code(name="Remote  Work", project_id=project_id, created_by_id=user_id)
+        db.add(existing)
+        db.commit()
+        segment = db.query(DocumentSegment).filter(
+            DocumentSegment.document_id == document_id).one()
+        results = CodeAssignmentService.bulk_quote_code_assignment(
+            db, document_id, [SmartQuoteCodeAssignment(
+                document_id=document_id, segment_id=segment.id, text="Remote work",
+                start_char=0, end_char=11, code_name=" remote work ")], user_id)
+        assert results[0]["assignment_status"] == "success"
+        assert results[0]["code"]["id"] == existing.id
+        assert results[0]["code"]["was_existing"]
+        assert db.query(Code).filter(Code.project_id == project_id).count() == 1
+
+
+def test_ai_coding_persists_each_chunk_in_its_own_transaction(monkeypatch):
+    """A chunk whose writes fail is rolled back whole; earlier chunks stay persisted"""
+    from app.core.config import settings
+    from app.db.session import SessionLocal
+    from app.models.code import Code
+    from app.models.document_segment import DocumentSegment, segment_codes
+    from app.models.quote import Quote
+    from app.services.ai_coding_service import AICodingService
+    from app.services.code_assignment_service import CodeAssignmentService
+    from app.services.llm.local_provider import LocalCodingModel
+
+    stamp = time.time_ns()
+    lines = [
+        f"Commuting costs {stamp}.",
+        f"Salaries stagnate {stamp}.",
+        f"Onboarding lacks {stamp}.",
+        f"Deadlines slip {stamp}.",
+    ]
+    user_id, project_id, document_id = _setup_document("\n".join(lines))
+    monkeypatch.setattr(settings, "AI_CODING_CHUNK_SIZE", 2)
+    monkeypatch.setattr(settings, "LOCAL_LLM_ENABLED", True)
+    monkeypatch.setattr(settings, "CODEBOOK_ENABLED", False)
+    bulk_assignment = CodeAssignmentService.bulk_quote_code_assignment
+    chunks = []
+
+    def failing_second_chunk(db, *args, **kwargs):
+        chunks.append(kwargs.get("requests"))
+        if len(chunks) != 2:
+            return bulk_assignment(db, *args, **kwargs)
+
+        # Everything is written, then the commit fails
+        def commit():
+            raise RuntimeError("Connection lost during commit")
+
+        monkeypatch.setattr(db, "commit", commit)
+        try:
+            return bulk_assignment(db, *args, **kwargs)
+        finally:
+            monkeypatch.delattr(db, "commit")
+
+    monkeypatch.setattr(CodeAssignmentService, "bulk_quote_code_assignment",
+                        staticmethod(failing_second_chunk))
+    with SessionLocal() as db:
+        results = AICodingService.generate_code(
+            [document_id], db, user_id,
+            model_name="local-deterministic", provider="local")
+        segment_ids = [segment_id for segment_id, in db.query(DocumentSegment.id).filter(
+            DocumentSegment.document_id == document_id).order_by(DocumentSegment.id)]
+        linked = {segment_id for segment_id, in db.query(segment_codes.c.segment_id).filter(
+            segment_codes.c.segment_id.in_(segment_ids))}
+        quoted = {segment_id for segment_id, in db.query(Quote.segment_id).filter(
+            Quote.segment_id.in_(segment_ids))}
+        code_names = {name for name, in db.query(Code.name).filter(Code.project_id == project_id)}
+
+    assert len(chunks) == 2
+    assert [result["code_id"] is not None for result in results] == [True, True, False, False]
+    assert "Connection lost during commit" in results[2]["message"]
+    # The first chunk is persisted; nothing of the failed one is
+    assert linked == quoted == set(segment_ids[:2])
+    assert code_names == {LocalCodingModel.code(line).code for line in lines[:2]}
@@ -0,0 +1,24 @@
+import json
+
+from sqlalchemy import JSON, cast, literal, select
+
+from app.db.session import SessionLocal
+from app.services.document.columns import coding_text_expression, render_columns
+
+COLUMNS = ["comment", "age", "score", "consent", "note"]
+
+
+def test_sql_rendering_matches_python():
+    rows = [
+        {"comment": "I enjoy working remotely", "age": 34, "score": 4.5,
+         "consent": True, "note": None},
+        {"comment": " \t padded\n", "age": 41.0, "score": 0.1, "consent": False, "note": ""},
+        {"comment": None, "age": None, "score": 1e20, "consent": None, "note": "   "},
+        {"comment": "", "age": -7, "score": None, "consent": None, "note": "N/A"},
+        {},
+    ]
+    with SessionLocal() as db:
+        for row in rows:
+            data = cast(literal(json.dumps(row)), JSON)
+            rendered = db.execute(select(coding_text_expression(COLUMNS, data))).scalar()
+            assert rendered == render_columns(row, COLUMNS), row
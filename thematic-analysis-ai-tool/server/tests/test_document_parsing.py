@@ -82,6 +82,25 @@ def test_csv_parsing(setup_environment):
                for seg in segments), "CSV content not parsed correctly"
 
 
+def test_csv_rows_render_the_same_in_every_chunk(monkeypatch):
+    from app.core.config import settings
+    from app.services.document.upload import DocumentUploadService
+    # Two rows per chunk: "age" is blank in the second chunk only
+    monkeypatch.setattr(settings, "CSV_READ_CHUNK_ROWS", 2)
+    csv_text = "id,age,score\n1,34,0.5\n2,35,1\n3,,2\n4,35,true\n"
+    extraction = {}
+    segments = list(DocumentUploadService._extract_csv_content(
+        io.BytesIO(csv_text.encode("utf-8")), extraction))
+    assert [seg["content"] for seg in segments] == [
+        "Row 1: id: 1 | age: 34 | score: 0.5",
+        "Row 2: id: 2 | age: 35 | score: 1",
+        "Row 3: id: 3 | score: 2",
+        "Row 4: id: 4 | age: 35 | score: true",
+    ]
+    assert segments[2]["additional_data"] == {"id": "3", "age": None, "score": "2"}
+    assert extraction["metadata"]["row_count"] == 4
+
+
 def test_xlsx_parsing(setup_environment):
     headers, project_id = setup_environment
     # Create a simple Excel file in memory
@@ -274,6 +274,113 @@ Key insight: Users want streamlined document handling.
         return False
 
 
+
+def test_duplicate_uploads():
+    """
+    Re-uploading a file returns the existing document and shows up in the dedupe report.
+
+    Needs DOCUMENT_DEDUPE_POLICY=return on the server.
+    """
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"dedupe_user_{timestamp}",
+        "email": f"dedupe{timestamp}@example.com",
+        "password": "dedupepassword123"
+    }
+    response = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert response.status_code in (200, 201), f"Registration failed: {response.text}"
+    response = requests.post(f"{BASE_URL}/auth/login", json={
+        "email": user_data["email"], "password": user_data["password"]})
+    assert response.status_code == 200, f"Login failed: {response.text}"
+    client = DocumentTestClient(response.json()["access_token"])
+
+    response = requests.post(f"{BASE_URL}/projects/", json={
+        "title": "Dedupe Test Project", "description": "Duplicate uploads"}, headers=client.headers)
+    assert response.status_code in (200, 201), f"Project creation failed: {response.text}"
+    project_id = response.json()["id"]
+
+    content = f"id,answer\n1,Interview {timestamp}\n2,Same file uploaded twice\n"
+    first = client.upload_document(project_id, content, "interview")
+    assert first["status_code"] == 200, first["error"]
+    assert first["data"]["upload_status"] == "success"
+
+    again = client.upload_document(project_id, content, "interview again")
+    assert again["status_code"] == 200, again["error"]
+    assert again["data"]["id"] == first["data"]["id"]
+    assert again["data"]["upload_status"] == "duplicate"
+    assert again["data"]["content"]["total_segments"] == first["data"]["content"]["total_segments"]
+
+    # Files of a bulk upload are processed concurrently; a file sent twice is processed once
+    concurrent_content = f"Concurrent interview {timestamp}\nUploaded twice at once\n"
+    bulk = client.bulk_upload_documents(project_id, [
+        {"name": "concurrent.txt", "content": concurrent_content},
+        {"name": "concurrent_again.txt", "content": concurrent_content},
+    ])
+    assert bulk["status_code"] == 200, bulk["error"]
+    uploads = bulk["data"]["uploaded_documents"]
+    assert len(uploads) == 2 and uploads[0]["id"] == uploads[1]["id"]
+    assert sorted(upload["upload_status"] for upload in uploads) == ["duplicate", "success"]
+
+    # The same bytes as a spreadsheet are another document, so they are reported
+    response = requests.post(
+        f"{BASE_URL}/documents/",
+        files={"file": ("interview.csv", content, "text/csv")},
+        data={"project_id": project_id},
+        headers=client.headers
+    )
+    assert response.status_code == 200, response.text
+    csv_id = response.json()["id"]
+    assert csv_id != first["data"]["id"]
+
+    response = requests.get(
+        f"{BASE_URL}/documents/project/{project_id}/duplicates", headers=client.headers)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["duplicate_documents"] == 1
+    [group] = report["duplicate_groups"]
+    assert group["original_id"] == first["data"]["id"]
+    assert [document["id"] for document in group["documents"]] == [first["data"]["id"], csv_id]
+    assert report["redundant_segments"] == 2
+    assert report["redundant_bytes"] == len(content)
+
+
+
+def test_document_storage_in_background():
+    """Uploads return before the file is stored; the background upload then stores it"""
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"storage_user_{timestamp}",
+        "email": f"storage{timestamp}@example.com",
+        "password": "storagepassword123"
+    }
+    response = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert response.status_code in (200, 201), f"Registration failed: {response.text}"
+    response = requests.post(f"{BASE_URL}/auth/login", json={
+        "email": user_data["email"], "password": user_data["password"]})
+    assert response.status_code == 200, f"Login failed: {response.text}"
+    client = DocumentTestClient(response.json()["access_token"])
+
+    response = requests.post(f"{BASE_URL}/projects/", json={
+        "title": "Storage Test Project", "description": "Background uploads"}, headers=client.headers)
+    assert response.status_code in (200, 201), f"Project creation failed: {response.text}"
+    project_id = response.json()["id"]
+
+    result = client.upload_document(project_id, f"Stored in the background {timestamp}\n", "stored")
+    assert result["status_code"] == 200, result["error"]
+    document = result["data"]
+    # Segments are available at once, whether or not the file is stored yet
+    assert document["content"]["total_segments"] == 1
+    assert document["storage_status"] in ("pending", "stored")
+
+    for _ in range(50):
+        response = requests.get(f"{BASE_URL}/documents/{document['id']}", headers=client.headers)
+        assert response.status_code == 200, response.text
+        if response.json()["storage_status"] != "pending":
+            break
+        time.sleep(0.2)
+    assert response.json()["storage_status"] == "stored"
+
+
 if __name__ == "__main__":
     print("Document Management API Tests")
     print("Make sure the server is running on http://localhost:8000")
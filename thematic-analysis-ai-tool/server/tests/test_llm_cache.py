@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.llm import cache
+from app.services.llm.cache import LLMCacheService
+from app.services.llm.codebook import CodebookIndex
+from app.services.llm_service import LLMService
+
+
+def _local_service() -> LLMService:
+    # A private instance: patching methods on the shared one would leak into other tests
+    settings.LOCAL_LLM_ENABLED = True
+    return LLMService(model_name="local-deterministic", provider="local")
+
+
+def test_cache_key_is_scoped_to_the_project():
+    service = _local_service()
+    text = "We mostly talk about remote work."
+    assert service.cache_key(text, scope="project:1") == service.cache_key(text, scope="project:1")
+    assert service.cache_key(text, scope="project:1") != service.cache_key(text, scope="project:2")
+    assert service.cache_key(text, scope="project:1") != service.cache_key(text)
+
+
+def test_single_flight_is_scoped_to_the_project(monkeypatch):
+    service = _local_service()
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_SINGLE_FLIGHT_ENABLED", True)
+    codebook = CodebookIndex([(1, "Remote work", None)])
+    calls = []
+    code_texts = service.code_texts
+
+    def slow_code_texts(texts, *args, **kwargs):
+        calls.append(len(texts))
+        time.sleep(0.3)
+        return code_texts(texts, *args, **kwargs)
+
+    monkeypatch.setattr(service, "code_texts", slow_code_texts)
+    text = f"Single-flight scoping {time.time_ns()}"
+
+    def code(scope):
+        return service.code_texts_cached(None, [text], codebook=codebook, scope=scope)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(code, ["project:1", "project:2", "project:1"]))
+    # One call per project; the second project:1 request waited for the first
+    assert len(calls) == 2
+
+
+def test_repeated_run_is_served_from_the_cache(monkeypatch):
+    service = _local_service()
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    texts = [f"Cached answer {time.time_ns()} about hybrid work.",
+             f"Cached answer {time.time_ns()} about pay transparency."]
+    calls = []
+    code_text = service.code_text
+
+    def counting_code_text(text, *args, **kwargs):
+        calls.append(text)
+        return code_text(text, *args, **kwargs)
+
+    monkeypatch.setattr(service, "code_text", counting_code_text)
+    with SessionLocal() as db:
+        first = service.code_texts_cached(db, texts)
+        assert len(calls) == 2
+        hits = LLMCacheService.get_stats(db)["hits"]
+        second = service.code_texts_cached(db, texts)
+        assert len(calls) == 2
+        assert LLMCacheService.get_stats(db)["hits"] == hits + 2
+    assert second == first
+
+
+def test_eviction_runs_at_most_once_per_interval(monkeypatch):
+    evictions = []
+    monkeypatch.setattr(LLMCacheService, "evict", staticmethod(lambda db: evictions.append(db) or 0))
+    monkeypatch.setattr(cache, "_last_evicted", None)
+    monkeypatch.setattr(settings, "LLM_CACHE_EVICT_INTERVAL_SECONDS", 300.0)
+    LLMCacheService.maybe_evict(None)
+    LLMCacheService.maybe_evict(None)
+    assert len(evictions) == 1
+    monkeypatch.setattr(settings, "LLM_CACHE_EVICT_INTERVAL_SECONDS", 0.0)
+    LLMCacheService.maybe_evict(None)
+    assert len(evictions) == 2
@@ -0,0 +1,59 @@
+import multiprocessing
+
+import pytest
+
+from app.schemas.llm_outputs import CodeOutput
+from app.services.llm.cassette import Cassette, CassetteMissError
+
+RECORDS_PER_PROCESS = 200
+
+
+def _output(index: int) -> CodeOutput:
+    return CodeOutput(reasoning=f"reason {index}", code=f"Code {index}",
+                      quote=f"quote {index}", code_description=f"description {index}")
+
+
+def _record(path: str, worker: int) -> None:
+    cassette = Cassette(path, "record", flush_every=1)
+    for index in range(RECORDS_PER_PROCESS):
+        cassette.record(f"{worker}-{index}", 0.01, _output(index), (10, index))
+    cassette.flush()
+
+
+def test_cassette_round_trip(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    recorder = Cassette(path, "record", flush_every=2)
+    recorder.record("first", 0.5, _output(1), (12, 3))
+    recorder.record("first", 0.25, _output(2), (12, 4))
+    recorder.record("empty", 0.1, None)
+    recorder.flush()
+    # A later recording run extends the cassette
+    Cassette(path, "record").record("second", 0.1, _output(3))
+    Cassette(path, "record").flush()
+
+    player = Cassette(path, "replay", latency_scale=0)
+    assert len(player) == 3
+    # Recordings of a key are served in turn
+    assert player.play("first") == (_output(1).model_dump(), (12, 3))
+    assert player.play("first") == (_output(2).model_dump(), (12, 4))
+    assert player.play("first") == (_output(1).model_dump(), (12, 3))
+    assert player.play("empty") == (None, None)
+    with pytest.raises(CassetteMissError):
+        player.play("unknown")
+
+
+def test_cassette_records_from_several_processes(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_record, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    player = Cassette(path, "replay", latency_scale=0)
+    assert len(player) == 4 * RECORDS_PER_PROCESS
+    for worker in range(4):
+        for index in (0, RECORDS_PER_PROCESS - 1):
+            assert player.play(f"{worker}-{index}") == (_output(index).model_dump(), (10, index))
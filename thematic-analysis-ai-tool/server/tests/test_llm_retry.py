@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import threading
+import time
+
+import httpx
+import openai
+
+from app.services.llm.local_provider import LocalProviderError
+from app.services.llm.retry import CallStats, call_with_retry, is_retryable_error
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_conflict_is_not_retried():
+    assert not is_retryable_error(_StatusError(409))
+    assert is_retryable_error(_StatusError(429))
+    assert is_retryable_error(_StatusError(503))
+
+
+def test_errors_are_classified_by_type_not_message():
+    request = httpx.Request("POST", "https://api.example.com/v1/chat")
+    assert is_retryable_error(httpx.ConnectTimeout("timed out", request=request))
+    assert is_retryable_error(openai.APIConnectionError(request=request))
+    assert is_retryable_error(TimeoutError())
+    assert is_retryable_error(LocalProviderError("Simulated provider failure"))
+    # Status codes and connection words in a message mean nothing on their own
+    assert not is_retryable_error(RuntimeError("HTTP 500 connection reset"))
+    assert not is_retryable_error(_StatusError(400))
+
+
+def test_wrapped_errors_are_classified_by_their_cause():
+    try:
+        try:
+            raise _StatusError(503)
+        except _StatusError as e:
+            raise RuntimeError("Error calling model") from e
+    except RuntimeError as wrapped:
+        assert is_retryable_error(wrapped)
+
+
+def test_admission_is_not_timed_or_hedged():
+    stats = CallStats()
+    calls = []
+
+    @contextlib.contextmanager
+    def admit():
+        # Waiting for a rate-limit token, longer than the hedge delay
+        time.sleep(0.3)
+        yield
+
+    def fn():
+        calls.append(1)
+        return "ok"
+
+    assert call_with_retry(fn, stats, max_retries=0, hedge_after=0.1, admit=admit) == "ok"
+    snapshot = stats.snapshot()
+    assert len(calls) == 1
+    assert snapshot["hedges"] == 0
+    assert snapshot["max_latency_seconds"] < 0.1
+
+
+def test_queued_hedge_is_cancelled_when_the_primary_wins():
+    stats = CallStats()
+    calls = []
+    release = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # A saturated pool: one worker is busy elsewhere, and other work queues ahead of the hedge
+        executor.submit(release.wait)
+
+        def fn():
+            calls.append(1)
+            executor.submit(release.wait)
+            time.sleep(0.2)
+            return "ok"
+
+        assert call_with_retry(fn, stats, max_retries=0, hedge_after=0.05, executor=executor) == "ok"
+        release.set()
+    assert len(calls) == 1
+    assert stats.snapshot()["hedges"] == 1
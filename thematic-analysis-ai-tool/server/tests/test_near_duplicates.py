@@ -0,0 +1,90 @@
+import time
+
+import requests
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document_segment import DocumentSegment, segment_codes
+from app.models.user import User
+from app.services.ai_coding_service import AICodingService
+from app.services.document.near_duplicates import minhash_signature, shingles
+from app.services.llm_service import LLMService
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def test_shingles_ignore_row_labels_and_case():
+    assert shingles("Row 3: N/A", 3) == shingles("row 17: n/a", 3) == {"n a"}
+
+
+def test_numeric_answers_are_not_duplicates():
+    first = minhash_signature("satisfaction: 1", 128, 3)
+    second = minhash_signature("satisfaction: 5", 128, 3)
+    assert shingles("satisfaction: 1", 3) == {"satisfaction 1"}
+    assert first != second
+
+
+def test_near_duplicates_are_coded_once(monkeypatch):
+    """Near-duplicate segments share one LLM call and every member gets its code"""
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"near_dup_user_{timestamp}",
+        "email": f"neardup{timestamp}@example.com",
+        "password": "neardup123"
+    }
+    resp = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert resp.status_code in (200, 201), f"Registration failed: {resp.text}"
+    resp = requests.post(f"{BASE_URL}/auth/login",
+                         json={"email": user_data["email"], "password": user_data["password"]})
+    assert resp.status_code == 200, f"Login failed: {resp.text}"
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    resp = requests.post(f"{BASE_URL}/projects/",
+                         json={"title": "Near Duplicate Project", "description": "MinHash"},
+                         headers=headers)
+    assert resp.status_code in (200, 201), f"Project creation failed: {resp.text}"
+
+    # Three lines that differ only in case and punctuation, and one unrelated line
+    answer = f"working from home gives me more time with my family {timestamp}"
+    content = "\n".join([
+        answer.capitalize() + ".",
+        answer + "!",
+        answer.upper(),
+        f"The commute was the worst part of the office {timestamp}",
+    ])
+    files = {"file": ("near_dup.txt", content, "text/plain")}
+    data = {"project_id": resp.json()["id"], "name": "Near Duplicate Document"}
+    resp = requests.post(f"{BASE_URL}/documents/", files=files, data=data, headers=headers)
+    assert resp.status_code in (200, 201), f"Document upload failed: {resp.text}"
+    document_id = resp.json()["id"]
+
+    monkeypatch.setattr(settings, "LOCAL_LLM_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    sent = []
+    code_text = LLMService.code_text
+
+    def counting_code_text(self, text, *args, **kwargs):
+        sent.append(text)
+        return code_text(self, text, *args, **kwargs)
+
+    monkeypatch.setattr(LLMService, "code_text", counting_code_text)
+    db = SessionLocal()
+    try:
+        user_id = db.query(User.id).filter(User.email == user_data["email"]).scalar()
+        results = AICodingService.generate_code(
+            [document_id], db, user_id,
+            model_name="local-deterministic", provider="local", deduplicate=True)
+        segment_ids = [segment_id for segment_id, in db.query(DocumentSegment.id).filter(
+            DocumentSegment.document_id == document_id).order_by(DocumentSegment.id)]
+        coded = dict(db.query(segment_codes.c.segment_id, segment_codes.c.code_id).filter(
+            segment_codes.c.segment_id.in_(segment_ids)).all())
+    finally:
+        db.close()
+
+    # One call for the cluster, one for the unrelated line
+    assert len(sent) == 2
+    assert len(results) == 4 and all(result["code_id"] for result in results)
+    by_segment = {result["segment_id"]: result["code_id"] for result in results}
+    cluster = segment_ids[:3]
+    assert len({by_segment[segment_id] for segment_id in cluster}) == 1
+    # The shared code is persisted for every member, not only the representative
+    assert all(coded.get(segment_id) == by_segment[segment_id] for segment_id in cluster)
@@ -0,0 +1,146 @@
+import io
+import random
+
+import pandas as pd
+
+from app.services.document.segmenter import (
+    segment_lines, segment_raw_lines, segment_rows, segment_sentences, table_rows
+)
+
+
+# Reference implementations: the original quadratic offset computations
+
+def _reference_lines(text: str) -> list:
+    lines = text.split('\n')
+    segments = []
+    for i, line in enumerate(lines):
+        line_content = line.strip()
+        if line_content:
+            segments.append({
+                "type": "line",
+                "content": line_content,
+                "line_number": i + 1,
+                "character_start": sum(len(l) + 1 for l in lines[:i]),
+                "character_end": sum(len(l) + 1 for l in lines[:i]) + len(line)
+            })
+    return segments
+
+
+def _reference_sentences(paragraphs: list) -> list:
+    content = ""
+    segments = []
+    for paragraph_index, paragraph in enumerate(paragraphs):
+        para_text = paragraph.strip()
+        if para_text:
+            content += para_text + "\n"
+            sentences = [s.strip() for s in para_text.split('.') if s.strip()]
+            for sentence_index, sentence in enumerate(sentences):
+                segments.append({
+                    "type": "sentence",
+                    "content": sentence + ("." if not sentence.endswith('.') else ""),
+                    "paragraph_index": paragraph_index,
+                    "character_start": len(content) - len(para_text) + sum(len(s) + 1 for s in sentences[:sentence_index]),
+                    "character_end": len(content) - len(para_text) + sum(len(s) + 1 for s in sentences[:sentence_index + 1])
+                })
+    return segments
+
+
+def _reference_rows(row_texts: list) -> list:
+    segments = []
+    content_lines = []
+    for row_index, row_text in enumerate(row_texts):
+        content_lines.append(row_text)
+        segments.append({
+            "type": "row",
+            "content": row_text,
+            "row_index": row_index,
+            "character_start": sum(len(line) + 2 for line in content_lines[:row_index]),
+            "character_end": sum(len(line) + 2 for line in content_lines[:row_index]) + len(row_text),
+            "additional_data": {"row": row_index}
+        })
+    return segments
+
+
+def _reference_table_rows(frame: pd.DataFrame, start: int) -> list:
+    rows = []
+    for row_index, (_, row) in enumerate(frame.iterrows()):
+        non_null_values = [f"{col}: {str(value)}" for col, value in row.items() if pd.notna(value)]
+        row_text = f"Row {start + row_index + 1}: " + " | ".join(non_null_values) \
+            if non_null_values else ""
+        rows.append((start + row_index, row_text))
+    return rows
+
+
+def _random_text(rng: random.Random, lines: int) -> str:
+    words = ["remote", "work", "  team", "meeting.", "", "pay", "\t", "é", "focus. Then"]
+    return "\n".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(0, 8))) for _ in range(lines)
+    )
+
+
+def test_line_offsets_match_reference():
+    rng = random.Random(0)
+    for _ in range(50):
+        text = _random_text(rng, rng.randint(0, 200))
+        assert list(segment_lines(text)) == _reference_lines(text)
+
+
+def test_streamed_lines_match_text():
+    rng = random.Random(3)
+    for _ in range(20):
+        text = _random_text(rng, rng.randint(0, 200))
+        lines = iter(text.split("\n"))
+        assert list(segment_raw_lines(lines)) == list(segment_lines(text))
+
+
+def test_line_segments_locate_content():
+    text = "first line\n\n  indented line  \r\nlast"
+    for segment in segment_lines(text):
+        raw = text[segment["character_start"]:segment["character_end"]]
+        assert raw.strip() == segment["content"]
+
+
+def test_line_extra_fields():
+    segments = list(segment_lines("a\nb", page_number=3))
+    assert [segment["page_number"] for segment in segments] == [3, 3]
+
+
+def test_sentence_offsets_match_reference():
+    rng = random.Random(1)
+    for _ in range(50):
+        paragraphs = _random_text(rng, rng.randint(0, 60)).split("\n")
+        assert list(segment_sentences(paragraphs)) == _reference_sentences(paragraphs)
+
+
+def test_row_offsets_match_reference():
+    rng = random.Random(2)
+    row_texts = [f"Row {i + 1}: answer: " + "x" * rng.randint(0, 40) for i in range(300)]
+    rows = [(i, text, {"row": i}) for i, text in enumerate(row_texts)]
+    assert list(segment_rows(rows)) == _reference_rows(row_texts)
+
+
+def test_rows_without_text_are_skipped():
+    rows = [(0, "Row 1: a: 1", None), (1, "", None), (2, "Row 3: a: 3", None)]
+    segments = list(segment_rows(rows))
+    assert [segment["row_index"] for segment in segments] == [0, 2]
+    content = "\n\n".join(segment["content"] for segment in segments)
+    for segment in segments:
+        assert content[segment["character_start"]:segment["character_end"]] == segment["content"]
+
+
+def test_table_rows_match_reference():
+    rng = random.Random(4)
+    answers = ["", "yes", "never really", "a | b", "42"]
+    lines = ["id,answer,note,score"] + [
+        f"{i},{rng.choice(answers)},{rng.choice(answers)},{rng.choice(['', '1.5', '3'])}"
+        for i in range(200)
+    ] + [",,,"]
+    frame = pd.read_csv(io.StringIO("\n".join(lines)), skip_blank_lines=True)
+    rows = list(table_rows(frame, 10))
+    assert [(index, text) for index, text, _ in rows] == _reference_table_rows(frame, 10)
+
+
+def test_table_rows_missing_cells_are_none():
+    frame = pd.read_csv(io.StringIO("id,answer\n1,\n2,ok\n"))
+    assert [data for _, _, data in table_rows(frame)] == [
+        {"id": 1, "answer": None}, {"id": 2, "answer": "ok"}]
@@ -0,0 +1,153 @@
+import io
+import time
+
+import pytest
+
+from app.services.storage import LocalStorageBackend
+
+
+def test_local_storage_round_trip(tmp_path):
+    storage = LocalStorageBackend(str(tmp_path))
+    public_id, url = storage.save(io.BytesIO(b"interview transcript"), "documents/1/abc")
+    assert public_id == "documents/1/abc"
+    assert url == (tmp_path / "documents/1/abc").as_uri()
+    assert storage.path(public_id).read_bytes() == b"interview transcript"
+
+    storage.delete(public_id)
+    assert not storage.path(public_id).exists()
+    # Deleting a missing file is not an error
+    storage.delete(public_id)
+
+
+def test_local_storage_is_content_addressed(tmp_path):
+    storage = LocalStorageBackend(str(tmp_path))
+    storage.save(io.BytesIO(b"first"), "documents/1/abc")
+    # A stored key is not rewritten
+    storage.save(io.BytesIO(b"second"), "documents/1/abc")
+    assert storage.path("documents/1/abc").read_bytes() == b"first"
+    assert [path.name for path in (tmp_path / "documents/1").iterdir()] == ["abc"]
+
+
+def test_local_storage_rejects_keys_outside_root(tmp_path):
+    storage = LocalStorageBackend(str(tmp_path / "root"))
+    with pytest.raises(ValueError):
+        storage.save(io.BytesIO(b"x"), "../outside")
+
+
+def test_cloudinary_upload_leaves_the_file_open(monkeypatch):
+    # The real upload_large, which closes the file it is given, with only the HTTP part stubbed
+    import cloudinary.uploader
+    from app.core.config import settings
+    from app.services.storage import CloudinaryStorageBackend
+
+    monkeypatch.setattr(settings, "CLOUDINARY_CLOUD_NAME", "test")
+    monkeypatch.setattr(settings, "CLOUDINARY_API_KEY", "key")
+    monkeypatch.setattr(settings, "CLOUDINARY_API_SECRET", "secret")
+    parts = []
+
+    def upload_part(file, **options):
+        parts.append(file[1])
+        return {"public_id": options["public_id"], "secure_url": "https://example.invalid/x"}
+
+    monkeypatch.setattr(cloudinary.uploader, "upload_large_part", upload_part)
+
+    file = io.BytesIO(b"interview transcript")
+    public_id, _ = CloudinaryStorageBackend().save(file, "documents/1/abc")
+    assert public_id == "documents/1/abc"
+    assert parts == [b"interview transcript"]
+    # Still readable by the caller, e.g. to parse it after uploading
+    file.seek(0)
+    assert file.read() == b"interview transcript"
+
+
+@pytest.fixture
+def upload_queue(monkeypatch, tmp_path):
+    """A project owner, this test's staging host and local staging and storage directories"""
+    from app.core.config import settings
+    from app.db.session import SessionLocal
+    from app.models.project import Project
+    from app.models.user import User
+    from app.services.storage import uploads
+
+    host = f"test-host-{time.time_ns()}"
+    monkeypatch.setattr(settings, "STORAGE_STAGING_HOST", host)
+    monkeypatch.setattr(uploads, "_staging", LocalStorageBackend(str(tmp_path / "staging")))
+    monkeypatch.setitem(uploads._backends, "local", LocalStorageBackend(str(tmp_path / "stored")))
+    db = SessionLocal()
+    user = User(email=f"{host}@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    project = Project(title=host, owner_id=user.id)
+    db.add(project)
+    db.commit()
+    yield db, project, user, host
+    db.close()
+
+
+def _pending_document(db, project, user, host, file_hash="abc"):
+    from app.models.document import Document, DocumentType, StorageStatus
+
+    document = Document(
+        name="Staged", document_type=DocumentType.TEXT, file_hash=file_hash,
+        cloudinary_public_id=f"documents/{project.id}/{file_hash}", storage_backend="local",
+        storage_status=StorageStatus.PENDING, storage_staging_host=host,
+        project_id=project.id, uploaded_by_id=user.id)
+    db.add(document)
+    db.commit()
+    return document
+
+
+def _claim_all(db):
+    from app.services.storage import StorageUploadService
+
+    claimed = []
+    while (document_id := StorageUploadService.claim_next_upload(db)) is not None:
+        claimed.append(document_id)
+    return claimed
+
+
+def test_uploads_are_claimed_on_their_staging_host(upload_queue):
+    db, project, user, host = upload_queue
+    foreign = _pending_document(db, project, user, f"{host}-other")
+    local = _pending_document(db, project, user, host)
+    claimed = _claim_all(db)
+    assert local.id in claimed
+    assert foreign.id not in claimed
+
+
+def test_expired_lease_is_claimed_again(upload_queue):
+    import datetime
+
+    db, project, user, host = upload_queue
+    document = _pending_document(db, project, user, host)
+    assert document.id in _claim_all(db)
+    # Leased: not due again while the upload may still be running
+    assert document.id not in _claim_all(db)
+    document.storage_retry_at = datetime.datetime.now(datetime.timezone.utc) - \
+        datetime.timedelta(seconds=1)
+    db.commit()
+    assert document.id in _claim_all(db)
+
+
+def test_upload_shares_a_copy_stored_meanwhile(upload_queue):
+    from app.models.document import StorageStatus
+    from app.services.storage import StorageUploadService
+    from app.services.storage import uploads
+
+    db, project, user, host = upload_queue
+    first = _pending_document(db, project, user, host)
+    key = first.cloudinary_public_id
+    StorageUploadService.stage(io.BytesIO(b"interview transcript"), key)
+    assert StorageUploadService.upload_document(db, first.id)
+    db.refresh(first)
+    assert first.storage_status == StorageStatus.STORED
+    assert not uploads._staging.path(key).exists()
+
+    # A second upload of the file whose document was committed after the first one was stored
+    second = _pending_document(db, project, user, host)
+    assert StorageUploadService.upload_document(db, second.id)
+    db.refresh(second)
+    assert second.storage_status == StorageStatus.STORED
+    assert second.storage_attempts == 0
+    assert (second.cloudinary_public_id, second.cloudinary_url) == \
+        (first.cloudinary_public_id, first.cloudinary_url)
@@ -0,0 +1,80 @@
+import requests
+import time
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def _setup_project() -> tuple[dict, int]:
+    timestamp = str(time.time_ns())
+    user_data = {
+        "username": f"theme_user_{timestamp}",
+        "email": f"theme{timestamp}@example.com",
+        "password": "themepassword123"
+    }
+    resp = requests.post(f"{BASE_URL}/auth/register", json=user_data)
+    assert resp.status_code in (200, 201), f"Registration failed: {resp.text}"
+
+    login_data = {"email": user_data["email"],
+                  "password": user_data["password"]}
+    resp = requests.post(f"{BASE_URL}/auth/login", json=login_data)
+    assert resp.status_code == 200, f"Login failed: {resp.text}"
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    project_data = {"title": "Theme Project",
+                    "description": "Test theme generation"}
+    resp = requests.post(f"{BASE_URL}/projects/",
+                         json=project_data, headers=headers)
+    assert resp.status_code in (200, 201), f"Project creation failed: {resp.text}"
+    return headers, resp.json().get("id")
+
+
+def test_generate_themes():
+    """Codes about two topics are grouped under two generated parent codes"""
+    headers, project_id = _setup_project()
+
+    codes = {
+        "Remote commute": "No commute when working remotely from home",
+        "Home office": "Working remotely from a home office",
+        "Remote flexibility": "Flexible remote working hours from home",
+        "Salary raise": "Asking for a salary raise and better pay",
+        "Low pay": "Pay and salary are too low",
+        "Bonus pay": "Yearly bonus on top of salary pay",
+    }
+    code_ids = {}
+    for name, description in codes.items():
+        resp = requests.post(f"{BASE_URL}/codes/", json={
+            "name": name, "description": description, "project_id": project_id
+        }, headers=headers)
+        assert resp.status_code in (200, 201), f"Code creation failed: {resp.text}"
+        code_ids[name] = resp.json()["id"]
+
+    theme_request = {"project_id": project_id, "num_themes": 2,
+                     "provider": "local", "model_name": "local-deterministic"}
+    for _ in range(2):
+        # Running again replaces the previous themes
+        resp = requests.post(f"{BASE_URL}/ai/themes", json=theme_request, headers=headers)
+        assert resp.status_code == 200, f"Theme generation failed: {resp.text}"
+        themes = resp.json()
+        assert len(themes) == 2
+        groups = sorted(sorted(theme["code_ids"]) for theme in themes)
+        assert groups == sorted([
+            sorted(code_ids[name] for name in list(codes)[:3]),
+            sorted(code_ids[name] for name in list(codes)[3:]),
+        ])
+
+    resp = requests.get(f"{BASE_URL}/codes/project/{project_id}", headers=headers)
+    assert resp.status_code == 200
+    project_codes = resp.json()
+    assert len(project_codes) == len(codes) + 2
+    theme_ids = {theme["theme_id"] for theme in themes}
+    for code in project_codes:
+        if code["id"] not in theme_ids:
+            assert code["parent_id"] in theme_ids
+
+
+def test_generate_themes_access():
+    """Theme generation requires access to the project"""
+    headers, _ = _setup_project()
+    resp = requests.post(f"{BASE_URL}/ai/themes",
+                         json={"project_id": 999999999}, headers=headers)
+    assert resp.status_code == 404